@@ -0,0 +1,53 @@
+"""
+Асинхронный доступ к базе данных.
+Синхронные функции database.py выполняются в выделенном пуле потоков,
+поэтому медленный запрос или ожидание блокировки не останавливает цикл событий.
+"""
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import DB_WORKERS
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_db_executor() -> ThreadPoolExecutor:
+    """
+    Пул потоков для запросов к базе (создается при первом обращении).
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=DB_WORKERS,
+                    thread_name_prefix='db'
+                )
+                print(f"✅ Пул потоков базы данных: {DB_WORKERS}")
+    return _executor
+
+async def run_db(func, *args, **kwargs):
+    """
+    Выполнение блокирующей функции, работающей с базой, в пуле потоков.
+
+    Пример: activity = await run_db(get_current_activity, user_id)
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_db_executor(),
+        functools.partial(func, *args, **kwargs)
+    )
+
+def shutdown_db_executor():
+    """
+    Остановка пула потоков с ожиданием выполняющихся запросов.
+    """
+    global _executor
+    with _executor_lock:
+        executor = _executor
+        _executor = None
+
+    if executor is not None:
+        executor.shutdown(wait=True)
@@ -0,0 +1,119 @@
+"""
+Нагрузочное сравнение планировщиков напоминаний (heap и wheel).
+
+Для каждого тика измеряется стоимость pop_due и перепланирования:
+средняя на одно событие, 99-й перцентиль и максимум по тикам,
+средняя для тиков без событий.
+
+Пользователи получают интервалы из клавиатуры настроек напоминаний,
+короткие интервалы (до 30 минут) привязаны к границам минут, как в
+ReminderManager. Время моделируется: каждая итерация - одна секунда.
+
+Для сравнения разнесения (REMINDER_JITTER_WINDOW) выводится отношение
+пикового числа напоминаний в секунду к среднему.
+
+Запуск: python bench_scheduler.py --users 100000 1000000 --duration 3600 --jitter 0 20
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+from scheduler import SCHEDULERS, stable_jitter
+
+# Интервалы из keyboards.get_reminder_interval_keyboard (без тестовых 5 секунд)
+INTERVALS = [300, 900, 1800, 3600, 7200, 14400, 28800]
+
+def next_due(now: float, interval: int, jitter: float = 0.0) -> float:
+    """
+    Следующее срабатывание по правилам ReminderManager._calculate_next_reminder_time
+    (jitter - постоянное смещение пользователя для привязанных интервалов).
+    """
+    if interval <= 1800:
+        return (now // interval + 1) * interval + jitter
+    return now + interval
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def run(kind: str, users: int, duration: int, start: float, seed: int, jitter_window: float = 0.0) -> dict:
+    rng = random.Random(seed)
+    intervals = [rng.choice(INTERVALS) for _ in range(users)]
+    jitters = [stable_jitter(user_id, jitter_window) for user_id in range(users)]
+
+    if kind == 'wheel':
+        scheduler = SCHEDULERS[kind](start=start)
+    else:
+        scheduler = SCHEDULERS[kind]()
+
+    began = time.perf_counter()
+    for user_id, interval in enumerate(intervals):
+        # Длинные интервалы начинаются в случайный момент, как у реальных пользователей
+        offset = 0 if interval <= 1800 else rng.uniform(0, interval)
+        scheduler.schedule(user_id, next_due(start + offset, interval, jitters[user_id]))
+    insert_seconds = time.perf_counter() - began
+
+    tick_costs = []
+    idle_costs = []
+    sends_per_second = []
+    fired = 0
+    for second in range(1, duration + 1):
+        now = start + second
+        began = time.perf_counter()
+        due_items = scheduler.pop_due(now)
+        for user_id, _ in due_items:
+            scheduler.schedule(user_id, next_due(now, intervals[user_id], jitters[user_id]))
+        cost = time.perf_counter() - began
+
+        fired += len(due_items)
+        sends_per_second.append(len(due_items))
+        tick_costs.append(cost)
+        if not due_items:
+            idle_costs.append(cost)
+
+    sample = rng.sample(range(users), min(users, 10000))
+    began = time.perf_counter()
+    for user_id in sample:
+        scheduler.cancel(user_id)
+    cancel_seconds = time.perf_counter() - began
+
+    return {
+        'insert_us': insert_seconds / users * 1e6,
+        'cancel_us': cancel_seconds / len(sample) * 1e6,
+        'fired': fired,
+        'per_event_us': sum(tick_costs) / fired * 1e6 if fired else 0.0,
+        'tick_p99_us': percentile(tick_costs, 0.99) * 1e6,
+        'idle_tick_mean_us': statistics.mean(idle_costs) * 1e6 if idle_costs else 0.0,
+        'max_tick_ms': max(tick_costs) * 1e3,
+        # Неравномерность отправки: пиковое число напоминаний в секунду к среднему
+        'peak_to_mean': max(sends_per_second) / (fired / duration) if fired else 0.0
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Сравнение планировщиков напоминаний')
+    parser.add_argument('--users', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--backends', nargs='+', default=list(SCHEDULERS), choices=list(SCHEDULERS))
+    parser.add_argument('--duration', type=int, default=3600, help='Моделируемое время в секундах')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--jitter', type=float, nargs='+', default=[0.0, 20.0],
+                        help='Окна разнесения привязанных напоминаний (сек) для сравнения')
+    args = parser.parse_args()
+
+    start = float(int(time.time()))
+    print(f"{'backend':8} {'jitter':>6} {'users':>9} {'insert мкс':>11} {'cancel мкс':>11} {'событий':>9} "
+          f"{'событие мкс':>12} {'p99 тика мкс':>13} {'пустой тик мкс':>15} {'макс. тик мс':>13} {'пик/среднее':>12}")
+
+    for users in args.users:
+        for kind in args.backends:
+            for jitter in args.jitter:
+                result = run(kind, users, args.duration, start, args.seed, jitter)
+                print(f"{kind:8} {jitter:>6.0f} {users:>9} {result['insert_us']:>11.2f} {result['cancel_us']:>11.2f} "
+                      f"{result['fired']:>9} {result['per_event_us']:>12.2f} "
+                      f"{result['tick_p99_us']:>13.0f} {result['idle_tick_mean_us']:>15.2f} "
+                      f"{result['max_tick_ms']:>13.1f} "
+                      f"{result['peak_to_mean']:>12.1f}")
+
+if __name__ == "__main__":
+    main()
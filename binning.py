@@ -0,0 +1,167 @@
+"""
+Раскладка активностей по интервалам суток (для графиков активности).
+
+Активности сортируются один раз и проходятся одним проходом (sweep line):
+указатель дня только растет, вся арифметика - целые секунды UTC, результат
+пишется в заранее выделенные массивы на все дни. При большом числе
+активностей и установленном NumPy используется векторизованный вариант.
+
+В каждом интервале остается активность с наибольшим временем внутри
+интервала (при равенстве - более ранняя); пустые интервалы - ('rest', 0).
+"""
+
+try:
+    import numpy as np
+except ImportError:  # NumPy необязателен
+    np = None
+
+SLOT_SECONDS = 1800  # 30 минут
+BASE_SLOT_SECONDS = 900  # Самая мелкая сетка: 15 минут
+NUMPY_MIN_ACTIVITIES = 256  # На малых объемах накладные расходы NumPy больше выигрыша
+
+def _slots_per_day(slot_seconds: int) -> int:
+    return 86400 // slot_seconds
+
+def bin_activities(activities, day_starts, slot_seconds: int = SLOT_SECONDS):
+    """
+    Раскладка активностей по интервалам.
+    activities - последовательность (activity_type, start_time, duration) в секундах UTC;
+    day_starts - начала локальных дней в секундах UTC и конец последнего дня
+    (days + 1 значение, с учетом перехода на летнее время).
+    Возвращает список дней, в каждом 86400 // slot_seconds пар (activity_type, seconds).
+    Последний интервал дня заканчивается в полночь (в день перевода часов
+    он длиннее или короче обычного).
+    """
+    if np is not None and len(activities) >= NUMPY_MIN_ACTIVITIES:
+        return _bin_numpy(activities, day_starts, slot_seconds)
+    return _bin_sweep(activities, day_starts, slot_seconds)
+
+def _to_days(types, seconds, days, slots):
+    """
+    Плоские массивы интервалов -> список дней с парами (activity_type, seconds).
+    """
+    result = []
+    for day in range(days):
+        offset = day * slots
+        result.append([
+            (types[i], seconds[i]) if types[i] is not None else ('rest', 0)
+            for i in range(offset, offset + slots)
+        ])
+    return result
+
+def _bin_sweep(activities, day_starts, slot_seconds):
+    """
+    Однопроходная раскладка на чистом Python.
+    """
+    days = len(day_starts) - 1
+    slots = _slots_per_day(slot_seconds)
+    last_slot = slots - 1
+
+    # Плоские массивы на все дни: тип и время лидирующей активности интервала
+    best_types = [None] * (days * slots)
+    best_seconds = [0] * (days * slots)
+
+    day_index = 0
+    for activity_type, start_time, duration in sorted(activities, key=lambda a: a[1]):
+        position = max(start_time, day_starts[0])
+        end_time = start_time + duration
+
+        # Активности отсортированы - день начала только растет
+        while day_index < days and position >= day_starts[day_index + 1]:
+            day_index += 1
+        day = day_index
+
+        while position < end_time and day < days:
+            day_start = day_starts[day]
+            next_day_start = day_starts[day + 1]
+
+            if position >= next_day_start:
+                day += 1
+                continue
+
+            slot = (position - day_start) // slot_seconds
+            if slot >= last_slot:
+                slot = last_slot
+                slot_end = next_day_start
+            else:
+                slot_end = min(day_start + (slot + 1) * slot_seconds, next_day_start)
+
+            piece_end = end_time if end_time < slot_end else slot_end
+            seconds = piece_end - position
+
+            index = day * slots + slot
+            if seconds > best_seconds[index]:
+                best_seconds[index] = seconds
+                best_types[index] = activity_type
+
+            position = piece_end
+
+    return _to_days(best_types, best_seconds, days, slots)
+
+def _bin_numpy(activities, day_starts, slot_seconds):
+    """
+    Векторизованная раскладка: каждая активность делится на куски по
+    интервалам, для каждого интервала выбирается самый длинный кусок.
+    """
+    days = len(day_starts) - 1
+    slots = _slots_per_day(slot_seconds)
+
+    types = [activity[0] for activity in activities]
+    starts = np.fromiter((activity[1] for activity in activities), dtype=np.int64, count=len(activities))
+    durations = np.fromiter((activity[2] for activity in activities), dtype=np.int64, count=len(activities))
+
+    # Границы интервалов всех дней; интервал не выходит за полночь, последний доходит до нее
+    bounds = np.asarray(day_starts, dtype=np.int64)
+    slot_starts = np.minimum(
+        bounds[:-1, None] + np.arange(slots, dtype=np.int64)[None, :] * slot_seconds,
+        bounds[1:, None]
+    ).ravel()
+    slot_ends = np.empty_like(slot_starts)
+    slot_ends[:-1] = slot_starts[1:]
+    slot_ends[slots - 1::slots] = bounds[1:]
+
+    # Часть активности внутри периода
+    clipped_starts = np.maximum(starts, bounds[0])
+    ends = np.minimum(starts + durations, bounds[-1])
+    valid = ends > clipped_starts
+    activity_ids = np.flatnonzero(valid)
+    clipped_starts = clipped_starts[valid]
+    ends = ends[valid]
+
+    best_types = [None] * (days * slots)
+    best_seconds = [0] * (days * slots)
+    if activity_ids.size == 0:
+        return _to_days(best_types, best_seconds, days, slots)
+
+    # Первый и последний интервал каждой активности
+    first = np.searchsorted(slot_starts, clipped_starts, side='right') - 1
+    last = np.searchsorted(slot_starts, ends, side='left') - 1
+    counts = last - first + 1
+
+    # Куски: (активность, интервал)
+    piece_owner = np.repeat(np.arange(activity_ids.size), counts)
+    piece_offsets = np.arange(piece_owner.size) - np.repeat(np.cumsum(counts) - counts, counts)
+    piece_slots = first[piece_owner] + piece_offsets
+    piece_seconds = (
+        np.minimum(ends[piece_owner], slot_ends[piece_slots])
+        - np.maximum(clipped_starts[piece_owner], slot_starts[piece_slots])
+    )
+
+    keep = piece_seconds > 0
+    piece_owner = piece_owner[keep]
+    piece_slots = piece_slots[keep]
+    piece_seconds = piece_seconds[keep]
+
+    # Лидер интервала: наибольшее время, при равенстве - более ранняя активность
+    owner_starts = starts[activity_ids][piece_owner]
+    order = np.lexsort((owner_starts, -piece_seconds, piece_slots))
+    sorted_slots = piece_slots[order]
+    leaders = order[np.concatenate(([True], sorted_slots[1:] != sorted_slots[:-1]))]
+
+    for slot, owner, seconds in zip(piece_slots[leaders].tolist(),
+                                    activity_ids[piece_owner[leaders]].tolist(),
+                                    piece_seconds[leaders].tolist()):
+        best_types[slot] = types[owner]
+        best_seconds[slot] = seconds
+
+    return _to_days(best_types, best_seconds, days, slots)
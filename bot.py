@@ -5,6 +5,7 @@ Time Tracker Bot с поддержкой часовых поясов и ново
 
 import asyncio
 import re
+import time
 from datetime import datetime, timedelta
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command, StateFilter
@@ -12,14 +13,18 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import Message, CallbackQuery
 
-from config import BOT_TOKEN, ADMIN_ID, ACTIVITIES, DEFAULT_TIMEZONE
+from config import (
+    BOT_TOKEN, ADMIN_ID, ACTIVITIES, DEFAULT_TIMEZONE,
+    TIMELINE_RESOLUTIONS
+)
 from database import (
-    init_db, add_user, start_activity, get_current_activity,
+    init_db, close_db, add_user, start_activity, get_current_activity,
     get_daily_stats, get_period_stats, update_user_setting,
     get_user_settings, clear_user_data, get_all_users,
     get_users_for_reminders, update_user_timezone,
     get_user_timezone, get_user_timezone_info, get_timezone_stats,
-    get_hourly_activity_stats, get_total_stats_by_activity
+    count_active_users, get_profile_cache_stats, get_stats_cache_stats,
+    get_dead_letter_count
 )
 from keyboards import (
     get_main_keyboard, get_statistics_keyboard, get_settings_keyboard,
@@ -31,9 +36,12 @@ from keyboards import (
 from utils import (
     get_activity_emoji, format_duration_simple, format_stats_message,
     format_interval, format_timezone_info, get_timezone_display_name,
-    format_user_local_time, format_complete_stats, format_all_settings
+    format_user_local_time, format_complete_stats, format_all_settings,
+    format_view_stats
 )
+from async_database import run_db, shutdown_db_executor
 from reminder import ReminderManager
+from stats_engine import stats_engine, STATS_VIEWS
 from timezone_manager import timezone_manager
 
 # Создаем бота и диспетчер
@@ -67,18 +75,21 @@ async def cmd_start(message: Message):
     except:
         auto_timezone = DEFAULT_TIMEZONE
 
-    add_user(
+    await run_db(
+        add_user,
         user_id=message.from_user.id,
         username=message.from_user.username,
         first_name=message.from_user.first_name,
         last_name=message.from_user.last_name,
         timezone=auto_timezone
     )
+    await reminder_manager.on_settings_changed(message.from_user.id)
+    local_time = await run_db(format_user_local_time, message.from_user.id)
 
     welcome_text = (
         f"⏱️ Учёт времени\n\n"
         f"Часовой пояс автоматически определен как: {get_timezone_display_name(auto_timezone)}\n"
-        f"Локальное время: {format_user_local_time(message.from_user.id)}"
+        f"Локальное время: {local_time}"
     )
 
     await message.answer(welcome_text, reply_markup=get_main_keyboard())
@@ -112,6 +123,7 @@ async def cmd_help(message: Message):
 • 📅 Неделя - статистика за неделю
 • 📅 Месяц - статистика за месяц
 • 📊 Год - статистика за год
+• 🔍 15 мин / 30 мин / 1 час / 2 часа - разрешение графика активности
 
 <b>Напоминания:</b>
 • Напоминания привязаны к часам (12:15, 12:30, 12:45...)
@@ -130,10 +142,10 @@ async def cmd_timezone(message: Message):
     Команда для проверки часового пояса.
     """
     user_id = message.from_user.id
-    timezone_info = get_user_timezone_info(user_id)
+    timezone_info = await run_db(get_user_timezone_info, user_id)
 
     if timezone_info:
-        current_time = format_user_local_time(user_id)
+        current_time = await run_db(format_user_local_time, user_id)
         timezone_display = get_timezone_display_name(timezone_info['timezone'])
 
         response = (
@@ -154,7 +166,7 @@ async def cmd_time(message: Message):
     Команда для отображения текущего времени.
     """
     user_id = message.from_user.id
-    local_time = format_user_local_time(user_id)
+    local_time = await run_db(format_user_local_time, user_id)
 
     await message.answer(f"🕒 Ваше локальное время: {local_time}")
 
@@ -171,13 +183,11 @@ async def cmd_test5(message: Message):
         return
 
     # Устанавливаем интервал 5 секунд
-    update_user_setting(user_id_int, 'reminder_interval', 5)
-    update_user_setting(user_id_int, 'notifications_enabled', 1)
+    await run_db(update_user_setting, user_id_int, 'reminder_interval', 5)
+    await run_db(update_user_setting, user_id_int, 'notifications_enabled', 1)
 
-    # Сбрасываем кэш времени напоминаний для этого пользователя
-    for key in list(reminder_manager.user_next_reminder_time.keys()):
-        if key.startswith(str(user_id_int)):
-            del reminder_manager.user_next_reminder_time[key]
+    # Пересчитываем время напоминаний для этого пользователя
+    await reminder_manager.on_settings_changed(user_id_int)
 
     await message.answer("✅ Установлен тестовый интервал 5 секунд. Напоминания будут приходить каждые 5 секунд.")
 
@@ -206,9 +216,13 @@ async def cmd_status(message: Message):
     if user_id_int != admin_id_int:
         return
 
-    all_users = get_all_users()
-    users_for_reminders = get_users_for_reminders()
-    timezone_stats = get_timezone_stats()
+    all_users = await run_db(get_all_users)
+    users_for_reminders = await run_db(get_users_for_reminders)
+    timezone_stats = await run_db(get_timezone_stats)
+    dead_letter_count = await run_db(get_dead_letter_count)
+    cache_stats = get_profile_cache_stats()
+    stats_cache_stats = get_stats_cache_stats()
+    send_stats = reminder_manager.sender.stats()
 
     status_text = (
         f"🤖 Статус бота:\n\n"
@@ -216,6 +230,16 @@ async def cmd_status(message: Message):
         f"• Пользователей для напоминаний: {len(users_for_reminders)}\n"
         f"• Напоминания: {'✅ Вкл' if reminder_manager.is_running else '❌ Выкл'}\n"
         f"• База данных: ✅ Работает\n"
+        f"• Кэш профилей: {cache_stats['size']}/{cache_stats['maxsize']}, "
+        f"попадания {cache_stats['hits']}, промахи {cache_stats['misses']} "
+        f"({cache_stats['hit_rate']:.0%})\n"
+        f"• Кэш статистики: {stats_cache_stats['size']}/{stats_cache_stats['maxsize']}, "
+        f"попадания {stats_cache_stats['hits']}, промахи {stats_cache_stats['misses']} "
+        f"({stats_cache_stats['hit_rate']:.0%}), вытеснено {stats_cache_stats['evictions']}\n"
+        f"• Отправка напоминаний: отправлено {send_stats['sent']}, "
+        f"429 {send_stats['rate_limited']}, повторов {send_stats['transient_retries']}, "
+        f"заблокировали бота {send_stats['permanent']}, не отправлено {send_stats['failed']}, "
+        f"в журнале недоставленных {dead_letter_count}\n"
         f"• Версия: 4.3 (тестовые уведомления 5 секунд + упрощенные интервалы)\n"
         f"• Ваш ID: {user_id_int}\n"
         f"• ADMIN_ID: {admin_id_int}\n\n"
@@ -239,7 +263,7 @@ async def cmd_users(message: Message):
     if user_id_int != admin_id_int:
         return
 
-    all_users = get_all_users()
+    all_users = await run_db(get_all_users)
 
     if not all_users:
         await message.answer("📭 Нет зарегистрированных пользователей")
@@ -271,7 +295,7 @@ async def cmd_stats(message: Message):
     if user_id_int != admin_id_int:
         return
 
-    all_users = get_all_users()
+    all_users = await run_db(get_all_users)
 
     if not all_users:
         await message.answer("📭 Нет зарегистрированных пользователей")
@@ -279,13 +303,7 @@ async def cmd_stats(message: Message):
 
     # Статистика
     total_users = len(all_users)
-    active_now = 0
-
-    for user in all_users:
-        user_id = user[0]
-        current = get_current_activity(user_id)
-        if current:
-            active_now += 1
+    active_now = await run_db(count_active_users)
 
     stats_text = (
         f"📊 Статистика бота:\n\n"
@@ -313,12 +331,10 @@ for button_text, activity_type in activity_buttons.items():
         user_id = message.from_user.id
 
         # Проверяем, активна ли уже такая же активность
-        current = get_current_activity(user_id)
+        current = await run_db(get_current_activity, user_id)
         if current and current[0] == act_type:
             display_text = get_display_activity(user_id, act_type)
-            start_time = datetime.fromisoformat(current[1])
-            current_time = datetime.now()
-            duration = int((current_time - start_time).total_seconds())
+            duration = int(time.time()) - current[1]
 
             await message.answer(
                 f"{display_text} продолжается\n{format_duration_simple(duration)}"
@@ -326,18 +342,15 @@ for button_text, activity_type in activity_buttons.items():
             return
 
         # Запускаем новую активность
-        completed_activity = start_activity(user_id, act_type)
+        completed_activity = await run_db(start_activity, user_id, act_type)
 
         response = ""
 
         if completed_activity:
-            completed_type, start_time_str = completed_activity
+            # Длительность завершенной активности посчитана базой при закрытии
+            completed_type, duration = completed_activity
             display_text = get_display_activity(user_id, completed_type)
 
-            start_time = datetime.fromisoformat(start_time_str)
-            end_time = datetime.now()
-            duration = int((end_time - start_time).total_seconds())
-
             response += f"{display_text} стоп\n{format_duration_simple(duration)}\n\n"
 
         # Новая активность
@@ -359,35 +372,7 @@ async def handle_statistics(message: Message):
     """
     Статистика по умолчанию (3 дня график + 24 часа распределение).
     """
-    user_id = message.from_user.id
-
-    from database import get_hourly_activity_stats, get_total_stats_by_activity
-    from utils import generate_activity_graph, generate_bar_graph
-
-    # Получаем данные
-    hourly_stats = get_hourly_activity_stats(user_id, 3)  # График за 3 дня
-    activity_stats = get_total_stats_by_activity(user_id, 1)  # Распределение за 24 часа
-
-    # Генерируем графики
-    timeline_graph = generate_activity_graph(hourly_stats, 3)
-    bar_graph = generate_bar_graph(activity_stats, user_id, max_width=12)
-
-    # Форматируем сообщение
-    message_text = "📊 Статистика за последние 3 дня:\n\n"
-
-    if timeline_graph and timeline_graph.strip():
-        message_text += "График активности:\n"
-        message_text += timeline_graph
-        message_text += "\n\n"
-
-    message_text += "Распределение по активностям (за 24 часа):\n\n"
-
-    if bar_graph:
-        message_text += bar_graph
-    else:
-        message_text += "Нет данных об активностях\n"
-
-    await message.answer(message_text, reply_markup=get_statistics_keyboard())
+    await answer_view_stats(message, 'default')
 
 
 @dp.message(F.text == "📅 Неделя")
@@ -395,176 +380,40 @@ async def handle_week_statistics(message: Message):
     """
     Статистика за неделю (7 дней график + 24 часа распределение).
     """
-    user_id = message.from_user.id
-
-    from database import get_hourly_activity_stats, get_total_stats_by_activity
-    from utils import generate_activity_graph, generate_bar_graph
-
-    # Получаем данные за 7 дней
-    hourly_stats = get_hourly_activity_stats(user_id, 7)  # График за 7 дней
-    activity_stats = get_total_stats_by_activity(user_id, 1)  # Распределение за 24 часа
-
-    # Генерируем графики
-    timeline_graph = generate_activity_graph(hourly_stats, 7)
-    bar_graph = generate_bar_graph(activity_stats, user_id, max_width=12)
-
-    # Общее время за 24 часа
-    total_seconds = sum(duration for _, duration in activity_stats)
-    hours = total_seconds // 3600
-    minutes = (total_seconds % 3600) // 60
-    seconds = total_seconds % 60
-
-    message_text = "📅 Статистика за неделю:\n\n"
-
-    if timeline_graph and timeline_graph.strip():
-        message_text += "График активности (7 дней):\n"
-        # Для недели показываем только последние 3 дня графика
-        lines = timeline_graph.split('\n')
-        if len(lines) > 6:
-            message_text += '\n'.join(lines[:6]) + "\n..."
-        else:
-            message_text += timeline_graph
-        message_text += "\n\n"
-
-    message_text += f"📈 Всего времени за 24 часа: {hours:02d}:{minutes:02d}:{seconds:02d}\n\n"
-    message_text += "Распределение по активностям (за 24 часа):\n\n"
-
-    if bar_graph:
-        message_text += bar_graph
-    else:
-        message_text += "Нет данных об активностях"
-
-    await message.answer(message_text, reply_markup=get_statistics_keyboard())
+    await answer_view_stats(message, 'week')
 
 
 @dp.message(F.text == "📅 Месяц")
 async def handle_month_statistics(message: Message):
     """
-    Статистика за месяц (30 дней общая + 24 часа распределение).
+    Статистика за месяц (30 дней график и общая + 24 часа распределение).
     """
-    user_id = message.from_user.id
-
-    from database import get_hourly_activity_stats, get_total_stats_by_activity
-    from utils import generate_activity_graph, generate_bar_graph
-
-    # Получаем данные за 30 дней для общей статистики
-    activity_stats_total = get_total_stats_by_activity(user_id, 30)  # Общая за 30 дней
-    activity_stats_24h = get_total_stats_by_activity(user_id, 1)  # Распределение за 24 часа
-
-    # Генерируем графики
-    bar_graph_24h = generate_bar_graph(activity_stats_24h, user_id, max_width=12)
-
-    # Общее время за 30 дней
-    total_seconds_30d = sum(duration for _, duration in activity_stats_total)
-    hours_30d = total_seconds_30d // 3600
-    minutes_30d = (total_seconds_30d % 3600) // 60
-    seconds_30d = total_seconds_30d % 60
-
-    # Общее время за 24 часа
-    total_seconds_24h = sum(duration for _, duration in activity_stats_24h)
-    hours_24h = total_seconds_24h // 3600
-    minutes_24h = (total_seconds_24h % 3600) // 60
-    seconds_24h = total_seconds_24h % 60
-
-    message_text = "📅 Статистика за месяц:\n\n"
-    message_text += f"📈 Всего времени за 30 дней: {hours_30d:02d}:{minutes_30d:02d}:{seconds_30d:02d}\n"
-    message_text += f"📈 Всего времени за 24 часа: {hours_24h:02d}:{minutes_24h:02d}:{seconds_24h:02d}\n\n"
-    message_text += "Распределение по активностям (за 24 часа):\n\n"
-
-    if bar_graph_24h:
-        message_text += bar_graph_24h
-    else:
-        message_text += "Нет данных об активностях"
-
-    await message.answer(message_text, reply_markup=get_statistics_keyboard())
+    await answer_view_stats(message, 'month')
 
 
 @dp.message(F.text == "📊 Год")
 async def handle_year_statistics(message: Message):
     """
-    Статистика за год.
+    Статистика за год (общая за год + топ активностей за 24 часа).
     """
-    user_id = message.from_user.id
-
-    from database import get_total_stats_by_activity
-
-    # Для года показываем только общую статистику
-    activity_stats_total = get_total_stats_by_activity(user_id, 365)  # Общая за год
-    activity_stats_24h = get_total_stats_by_activity(user_id, 1)  # Распределение за 24 часа
-
-    # Общее время за год
-    total_seconds_year = sum(duration for _, duration in activity_stats_total)
-    hours_year = total_seconds_year // 3600
-    minutes_year = (total_seconds_year % 3600) // 60
-    seconds_year = total_seconds_year % 60
-
-    # Общее время за 24 часа
-    total_seconds_24h = sum(duration for _, duration in activity_stats_24h)
-    hours_24h = total_seconds_24h // 3600
-    minutes_24h = (total_seconds_24h % 3600) // 60
-    seconds_24h = total_seconds_24h % 60
-
-    message_text = "📊 Статистика за год:\n\n"
-    message_text += f"📈 Всего времени за год: {hours_year:02d}:{minutes_year:02d}:{seconds_year:02d}\n"
-    message_text += f"📈 Всего времени за 24 часа: {hours_24h:02d}:{minutes_24h:02d}:{seconds_24h:02d}\n\n"
-    message_text += "Топ активностей за 24 часа:\n\n"
-
-    # Показываем только топ-5 активности за 24 часа
-    top_activities = sorted(activity_stats_24h, key=lambda x: x[1], reverse=True)[:5]
-    for activity_type, duration in top_activities:
-        if duration == 0:
-            continue
-        activity_name = ACTIVITIES.get(activity_type, activity_type)
-        emoji = get_activity_emoji(activity_type)
-        hours = duration // 3600
-        minutes = (duration % 3600) // 60
-        seconds = duration % 60
-        message_text += f"{emoji} {activity_name}: {hours:02d}:{minutes:02d}:{seconds:02d}\n"
-
-    if not top_activities or all(duration == 0 for _, duration in top_activities):
-        message_text += "Нет данных об активностях"
+    await answer_view_stats(message, 'year')
 
-    await message.answer(message_text, reply_markup=get_statistics_keyboard())
 
+async def answer_view_stats(message: Message, view_name: str):
+    """
+    Ответ экраном статистики view_name (stats_engine.STATS_VIEWS).
+    """
+    result = await run_db(stats_engine.fetch, message.from_user.id, STATS_VIEWS[view_name])
+    await message.answer(format_view_stats(result), reply_markup=get_statistics_keyboard())
 
-@dp.message(F.text == "📊 Год")
-async def handle_year_statistics(message: Message):
+@dp.message(F.text.in_(TIMELINE_RESOLUTIONS))
+async def handle_timeline_resolution(message: Message):
     """
-    Статистика за год.
+    Выбор разрешения графика активности и показ статистики с ним.
     """
     user_id = message.from_user.id
-
-    from database import get_total_stats_by_activity
-
-    # Для года показываем только общую статистику
-    activity_stats = get_total_stats_by_activity(user_id, 365)
-
-    # Общее время
-    total_seconds = sum(duration for _, duration in activity_stats)
-    hours = total_seconds // 3600
-    minutes = (total_seconds % 3600) // 60
-    seconds = total_seconds % 60
-
-    message_text = "📊 Статистика за год:\n\n"
-    message_text += f"📈 Всего времени: {hours:02d}:{minutes:02d}:{seconds:02d}\n\n"
-    message_text += "Топ активностей:\n\n"
-
-    # Показываем только топ-5 активности
-    top_activities = sorted(activity_stats, key=lambda x: x[1], reverse=True)[:5]
-    for activity_type, duration in top_activities:
-        if duration == 0:
-            continue
-        activity_name = ACTIVITIES.get(activity_type, activity_type)
-        emoji = get_activity_emoji(activity_type)
-        hours = duration // 3600
-        minutes = (duration % 3600) // 60
-        seconds = duration % 60
-        message_text += f"{emoji} {activity_name}: {hours:02d}:{minutes:02d}:{seconds:02d}\n"
-
-    if not top_activities or all(duration == 0 for _, duration in top_activities):
-        message_text += "Нет данных об активностях"
-
-    await message.answer(message_text, reply_markup=get_statistics_keyboard())
+    await run_db(update_user_setting, user_id, 'timeline_resolution', TIMELINE_RESOLUTIONS[message.text])
+    await handle_statistics(message)
 
 @dp.message(F.text == "⚙️ Настройки")
 async def handle_settings(message: Message):
@@ -572,7 +421,7 @@ async def handle_settings(message: Message):
     Настройки - показываем все настройки сразу.
     """
     user_id = message.from_user.id
-    settings_text = format_all_settings(user_id)
+    settings_text = await run_db(format_all_settings, user_id)
 
     await message.answer(settings_text, reply_markup=get_settings_keyboard())
 
@@ -582,9 +431,9 @@ async def handle_timezone(message: Message):
     Настройка часового пояса.
     """
     user_id = message.from_user.id
-    current_timezone = get_user_timezone(user_id)
+    current_timezone = await run_db(get_user_timezone, user_id)
     current_display = get_timezone_display_name(current_timezone)
-    current_time = format_user_local_time(user_id)
+    current_time = await run_db(format_user_local_time, user_id)
 
     message_text = (
         f"🌍 Часовой пояс\n\n"
@@ -604,10 +453,11 @@ async def handle_auto_timezone(message: Message):
 
     try:
         auto_timezone = timezone_manager.detect_by_ip()
-        update_user_timezone(user_id, auto_timezone)
+        await run_db(update_user_timezone, user_id, auto_timezone)
+        await reminder_manager.on_settings_changed(user_id)
 
         timezone_display = get_timezone_display_name(auto_timezone)
-        local_time = format_user_local_time(user_id)
+        local_time = await run_db(format_user_local_time, user_id)
 
         response = (
             f"✅ Часовой пояс обновлен!\n\n"
@@ -632,8 +482,9 @@ async def handle_timezone_selection(message: Message):
     timezone_code = timezone_manager.common_timezones.get(timezone_display, DEFAULT_TIMEZONE)
 
     # Обновляем часовой пояс
-    if update_user_timezone(user_id, timezone_code):
-        local_time = format_user_local_time(user_id)
+    if await run_db(update_user_timezone, user_id, timezone_code):
+        await reminder_manager.on_settings_changed(user_id)
+        local_time = await run_db(format_user_local_time, user_id)
 
         response = (
             f"✅ Часовой пояс обновлен!\n\n"
@@ -651,7 +502,7 @@ async def handle_reminders(message: Message):
     Настройка напоминаний.
     """
     user_id = message.from_user.id
-    settings = get_user_settings(user_id)
+    settings = await run_db(get_user_settings, user_id)
 
     current_interval = settings['reminder_interval'] if settings else 1800
     notifications_enabled = settings['notifications_enabled'] if settings else True
@@ -670,7 +521,7 @@ async def handle_quiet_time(message: Message):
     Настройка тихого времени.
     """
     user_id = message.from_user.id
-    settings = get_user_settings(user_id)
+    settings = await run_db(get_user_settings, user_id)
 
     quiet_enabled = settings['quiet_time_enabled'] if settings else True
     start_time = settings['quiet_time_start'] if settings else "22:00"
@@ -710,7 +561,8 @@ async def handle_interval_callback(callback: CallbackQuery):
     interval = int(callback.data.split("_")[1])
 
     if interval == 0:
-        update_user_setting(user_id, 'notifications_enabled', 0)
+        await run_db(update_user_setting, user_id, 'notifications_enabled', 0)
+        reminder_manager.cancel(user_id)
         await callback.message.edit_text(
             "⏰ Напоминания\nИнтервал: Выкл\nСтатус: выключены"
         )
@@ -718,8 +570,9 @@ async def handle_interval_callback(callback: CallbackQuery):
             reply_markup=get_reminder_interval_keyboard(interval, False)
         )
     else:
-        update_user_setting(user_id, 'reminder_interval', interval)
-        update_user_setting(user_id, 'notifications_enabled', 1)
+        await run_db(update_user_setting, user_id, 'reminder_interval', interval)
+        await run_db(update_user_setting, user_id, 'notifications_enabled', 1)
+        await reminder_manager.on_settings_changed(user_id)
 
         interval_text = format_interval(interval)
         await callback.message.edit_text(
@@ -745,13 +598,11 @@ async def handle_reminder_interval_callback(callback: CallbackQuery):
         interval_seconds = interval_minutes * 60
 
         # Обновляем настройки
-        update_user_setting(user_id, 'reminder_interval', interval_seconds)
-        update_user_setting(user_id, 'notifications_enabled', 1)
+        await run_db(update_user_setting, user_id, 'reminder_interval', interval_seconds)
+        await run_db(update_user_setting, user_id, 'notifications_enabled', 1)
 
-        # Сбрасываем кэш времени напоминаний для этого пользователя
-        for key in list(reminder_manager.user_next_reminder_time.keys()):
-            if key.startswith(str(user_id)):
-                del reminder_manager.user_next_reminder_time[key]
+        # Пересчитываем время напоминаний для этого пользователя
+        await reminder_manager.on_settings_changed(user_id)
 
         await callback.message.edit_text(
             f"✅ Уведомления установлены на каждые {interval_minutes} минут"
@@ -775,13 +626,11 @@ async def handle_activity_reminder_callback(callback: CallbackQuery, state: FSMC
         interval_seconds = interval_minutes * 60
 
         # Обновляем настройки
-        update_user_setting(user_id, 'reminder_interval', interval_seconds)
-        update_user_setting(user_id, 'notifications_enabled', 1)
+        await run_db(update_user_setting, user_id, 'reminder_interval', interval_seconds)
+        await run_db(update_user_setting, user_id, 'notifications_enabled', 1)
 
-        # Сбрасываем кэш времени напоминаний для этого пользователя
-        for key in list(reminder_manager.user_next_reminder_time.keys()):
-            if key.startswith(str(user_id)):
-                del reminder_manager.user_next_reminder_time[key]
+        # Пересчитываем время напоминаний для этого пользователя
+        await reminder_manager.on_settings_changed(user_id)
 
         # Получаем информацию о активности из состояния
         data = await state.get_data()
@@ -806,19 +655,16 @@ async def handle_toggle_notif(callback: CallbackQuery):
     Переключение уведомлений.
     """
     user_id = callback.from_user.id
-    settings = get_user_settings(user_id)
+    settings = await run_db(get_user_settings, user_id)
 
     if settings:
         current_state = settings['notifications_enabled']
         new_state = not current_state
 
-        update_user_setting(user_id, 'notifications_enabled', 1 if new_state else 0)
+        await run_db(update_user_setting, user_id, 'notifications_enabled', 1 if new_state else 0)
 
-        # Если выключаем уведомления, очищаем кэш
-        if not new_state:
-            for key in list(reminder_manager.user_next_reminder_time.keys()):
-                if key.startswith(str(user_id)):
-                    del reminder_manager.user_next_reminder_time[key]
+        # Включаем или снимаем пользователя с расписания напоминаний
+        await reminder_manager.on_settings_changed(user_id)
 
         current_interval = settings['reminder_interval']
 
@@ -841,13 +687,14 @@ async def handle_toggle_quiet(callback: CallbackQuery):
     Переключение тихого времени.
     """
     user_id = callback.from_user.id
-    settings = get_user_settings(user_id)
+    settings = await run_db(get_user_settings, user_id)
 
     if settings:
         current_state = settings['quiet_time_enabled']
         new_state = not current_state
 
-        update_user_setting(user_id, 'quiet_time_enabled', 1 if new_state else 0)
+        await run_db(update_user_setting, user_id, 'quiet_time_enabled', 1 if new_state else 0)
+        await reminder_manager.on_settings_changed(user_id)
 
         start_time = settings['quiet_time_start']
         end_time = settings['quiet_time_end']
@@ -890,9 +737,10 @@ async def handle_quiet_start_input(message: Message, state: FSMContext):
     """
     if re.match(r'^([0-1]?[0-9]|2[0-3]):[0-5][0-9]$', message.text):
         user_id = message.from_user.id
-        update_user_setting(user_id, 'quiet_time_start', message.text)
+        await run_db(update_user_setting, user_id, 'quiet_time_start', message.text)
+        await reminder_manager.on_settings_changed(user_id)
 
-        settings = get_user_settings(user_id)
+        settings = await run_db(get_user_settings, user_id)
         end_time = settings['quiet_time_end'] if settings else "06:00"
         quiet_enabled = settings['quiet_time_enabled'] if settings else True
 
@@ -913,9 +761,10 @@ async def handle_quiet_end_input(message: Message, state: FSMContext):
     """
     if re.match(r'^([0-1]?[0-9]|2[0-3]):[0-5][0-9]$', message.text):
         user_id = message.from_user.id
-        update_user_setting(user_id, 'quiet_time_end', message.text)
+        await run_db(update_user_setting, user_id, 'quiet_time_end', message.text)
+        await reminder_manager.on_settings_changed(user_id)
 
-        settings = get_user_settings(user_id)
+        settings = await run_db(get_user_settings, user_id)
         start_time = settings['quiet_time_start'] if settings else "22:00"
         quiet_enabled = settings['quiet_time_enabled'] if settings else True
 
@@ -935,7 +784,7 @@ async def handle_back_settings(callback: CallbackQuery):
     Назад в настройки.
     """
     user_id = callback.from_user.id
-    settings_text = format_all_settings(user_id)
+    settings_text = await run_db(format_all_settings, user_id)
 
     await callback.message.edit_text(settings_text)
     await callback.answer()
@@ -947,7 +796,8 @@ async def handle_clear_confirm(callback: CallbackQuery):
     """
     if callback.data == "clear_yes":
         user_id = callback.from_user.id
-        clear_user_data(user_id)
+        await run_db(clear_user_data, user_id)
+        await reminder_manager.on_settings_changed(user_id)
         await callback.message.edit_text("✅ Все данные очищены")
     else:
         await callback.message.edit_text("❌ Очистка отменена")
@@ -979,7 +829,7 @@ async def main():
     """
     Запуск бота с поддержкой часовых поясов.
     """
-    init_db()
+    await run_db(init_db)
 
     print("=" * 50)
     print("🤖 Time Tracker Bot v4.3.1")
@@ -1014,4 +864,7 @@ async def main():
         print(f"❌ Ошибка при запуске бота: {e}")
     finally:
         await reminder_manager.stop()
+        # Ожидание выполняющихся запросов не должно блокировать цикл событий
+        await asyncio.get_running_loop().run_in_executor(None, shutdown_db_executor)
+        close_db()
         print("\n🛑 Бот остановлен")
\ No newline at end of file
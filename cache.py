@@ -0,0 +1,97 @@
+"""
+Потокобезопасный LRU-кэш с ограничением размера и счетчиками попаданий.
+"""
+
+import threading
+from collections import OrderedDict
+
+class LRUCache:
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0  # Увеличивается при каждой инвалидации
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """
+        Значение из кэша (ключ становится самым свежим).
+        """
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        """
+        Запись значения с вытеснением самого старого ключа при переполнении.
+        """
+        with self._lock:
+            self._store(key, value)
+
+    def _store(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_load(self, key, loader):
+        """
+        Значение из кэша или результат loader(key) при промахе.
+        Если за время загрузки кэш инвалидировали, результат не сохраняется,
+        чтобы параллельное чтение не вернуло в кэш устаревшие данные.
+        """
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            generation = self._generation
+
+        value = loader(key)
+
+        with self._lock:
+            if self._generation == generation:
+                self._store(key, value)
+        return value
+
+    def invalidate(self, key):
+        """
+        Удаление ключа из кэша.
+        """
+        with self._lock:
+            self._generation += 1
+            self._data.pop(key, None)
+
+    def clear(self):
+        """
+        Полная очистка кэша.
+        """
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def stats(self) -> dict:
+        """
+        Счетчики кэша: размер, попадания, промахи, вытеснения и доля попаданий.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0
+            }
+
+    def __len__(self):
+        return len(self._data)
@@ -68,4 +68,58 @@ ACTIVITY_SYMBOLS = {
     'hobby': '▅',
     'study': '▆',
     'work': '▇'
-}
\ No newline at end of file
+}
+
+# Настройки соединений SQLite
+DB_CACHE_SIZE_KB = 8192  # Размер страничного кэша на соединение (в КБ)
+DB_BUSY_TIMEOUT_MS = 5000  # Ожидание снятия блокировки перед ошибкой "database is locked"
+
+# Количество потоков для запросов к базе данных из асинхронных обработчиков
+try:
+    DB_WORKERS = max(1, int(os.getenv('DB_WORKERS', '4')))
+except ValueError:
+    DB_WORKERS = 4
+
+# Размер кэша профилей пользователей (часовой пояс и настройки)
+PROFILE_CACHE_SIZE = 10000
+
+# Планировщик напоминаний: 'heap' (min-куча) или 'wheel' (иерархическое колесо таймеров)
+REMINDER_SCHEDULER = os.getenv('REMINDER_SCHEDULER', 'heap')
+
+# Ограничения отправки напоминаний (лимиты Telegram: ~30 сообщений в секунду, ~1 в секунду в один чат)
+REMINDER_RATE_LIMIT = 25  # Сообщений в секунду всего
+REMINDER_CHAT_INTERVAL = 1.0  # Минимальный интервал между сообщениями в один чат (сек)
+REMINDER_SEND_CONCURRENCY = 20  # Одновременных запросов к Telegram
+REMINDER_SEND_RETRIES = 3  # Повторов после ответа 429 или временной ошибки
+REMINDER_RETRY_BACKOFF = 1.0  # Первая задержка повтора после временной ошибки (сек), дальше удваивается
+REMINDER_RETRY_BACKOFF_MAX = 60.0  # Максимальная задержка повтора (сек)
+
+# Сохранение расписания напоминаний
+REMINDER_FLUSH_INTERVAL = 5  # Как часто записывать изменения расписания в базу (сек)
+REMINDER_CATCHUP_GRACE = 120  # Напоминания, пропущенные при простое не больше чем на столько секунд, отправляются сразу
+REMINDER_FALLBACK_DELAY = 60  # Через сколько повторить напоминание, если следующее время не удалось рассчитать (сек)
+
+# Как часто проверять смену смещения часовых поясов (летнее/зимнее время), сек
+QUIET_WINDOW_CHECK_INTERVAL = 3600
+
+# Разнесение привязанных к минутам напоминаний (5-30 мин): каждому пользователю
+# постоянное смещение в пределах окна, сек (0 - все срабатывают ровно в начале минуты)
+try:
+    REMINDER_JITTER_WINDOW = max(0.0, float(os.getenv('REMINDER_JITTER_WINDOW', '0')))
+except ValueError:
+    REMINDER_JITTER_WINDOW = 0.0
+
+# Разрешение графика активности: текст кнопки -> ширина интервала, сек.
+# Данные раскладываются по 15-минутной сетке, крупные интервалы получаются ее укрупнением
+TIMELINE_RESOLUTIONS = {
+    '🔍 15 мин': 900,
+    '🔍 30 мин': 1800,
+    '🔍 1 час': 3600,
+    '🔍 2 часа': 7200
+}
+DEFAULT_TIMELINE_RESOLUTION = 1800  # 30 минут
+TIMELINE_LINE_WIDTH = 24  # Символов в строке графика
+MONTH_TIMELINE_MIN_RESOLUTION = 7200  # Для графика за месяц интервалы не мельче 2 часов (лимит длины сообщения)
+
+# Размер кэша снимков статистики (пользователь x экран статистики)
+STATS_CACHE_SIZE = 5000
@@ -0,0 +1,90 @@
+"""
+Менеджер долгоживущих соединений SQLite.
+Каждый поток получает собственное соединение, которое открывается один раз
+и живет до остановки бота.
+"""
+
+import os
+import sqlite3
+import threading
+from config import DB_NAME, DB_CACHE_SIZE_KB, DB_BUSY_TIMEOUT_MS
+
+class ConnectionManager:
+    def __init__(self, db_name: str = DB_NAME):
+        self.db_name = db_name
+        self._db_path = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []  # Все открытые соединения (для закрытия при остановке)
+
+    @property
+    def db_path(self) -> str:
+        """
+        Путь к базе данных в директории data (вычисляется один раз).
+        """
+        if self._db_path is None:
+            data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+            if not os.path.exists(data_dir):
+                os.makedirs(data_dir)
+                print(f"✅ Создана директория data: {data_dir}")
+            self._db_path = os.path.join(data_dir, self.db_name)
+        return self._db_path
+
+    def _open_connection(self) -> sqlite3.Connection:
+        """
+        Открытие соединения с настройкой PRAGMA.
+        journal_mode=WAL сохраняется в файле базы, остальные настройки действуют
+        на соединение, поэтому выполняются один раз при его открытии.
+        """
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{DB_CACHE_SIZE_KB}')
+        conn.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def get_connection(self) -> sqlite3.Connection:
+        """
+        Соединение текущего потока (открывается при первом обращении).
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._open_connection()
+            self._local.conn = conn
+        return conn
+
+    def set_db_path(self, db_path: str):
+        """
+        Переключение на другой файл базы (моделирование, обслуживание).
+        Уже открытые соединения закрываются.
+        """
+        self.close_all()
+        self._db_path = db_path
+
+    def close_all(self):
+        """
+        Закрытие всех соединений (при остановке бота).
+        """
+        with self._lock:
+            connections = self._connections
+            self._connections = []
+
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception as e:
+                print(f"⚠️ Ошибка закрытия соединения: {e}")
+
+        # Соединения других потоков уже закрыты, сбрасываем только ссылку текущего
+        self._local = threading.local()
+
+
+# Создаем глобальный экземпляр менеджера
+connection_manager = ConnectionManager()
@@ -2,27 +2,48 @@
 База данных SQLite с поддержкой часовых поясов.
 """
 
-import sqlite3
-import os
+import time
 from datetime import datetime, timedelta
-from config import DB_NAME
+from cache import LRUCache
+from config import ACTIVITIES, PROFILE_CACHE_SIZE, DEFAULT_TIMELINE_RESOLUTION
+from connection_manager import connection_manager
+from migrations import run_migrations
+from rollups import get_tz, add_to_rollup, rebuild_rollups
+from binning import SLOT_SECONDS
+from quiet_windows import update_quiet_window, refresh_quiet_windows
+from day_grid import (
+    EMPTY_GRID, load_day_activities, grids_from_activities, update_day_grids,
+    rebuild_day_grids, overlay_open_activity, downsample_grid, slot_factor, day_bounds
+)
+from stats_cache import stats_cache
+
+# Кэш профилей пользователей: часовой пояс и настройки напоминаний.
+# Сбрасывается функциями, которые изменяют эти данные.
+_profile_cache = LRUCache(PROFILE_CACHE_SIZE)
 
 def get_db_path():
     """
     Получение пути к базе данных в директории data.
     """
-    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
-    if not os.path.exists(data_dir):
-        os.makedirs(data_dir)
-        print(f"✅ Создана директория data: {data_dir}")
-    return os.path.join(data_dir, DB_NAME)
+    return connection_manager.db_path
+
+def get_connection():
+    """
+    Долгоживущее соединение текущего потока из менеджера соединений.
+    """
+    return connection_manager.get_connection()
+
+def close_db():
+    """
+    Закрытие всех соединений с базой данных (при остановке бота).
+    """
+    connection_manager.close_all()
 
 def init_db():
     """
     Инициализация базы данных с поддержкой часовых поясов.
     """
-    db_path = get_db_path()
-    conn = sqlite3.connect(db_path)
+    conn = get_connection()
     cursor = conn.cursor()
 
     cursor.execute('''
@@ -33,7 +54,7 @@ def init_db():
             last_name TEXT,
             timezone TEXT DEFAULT 'Europe/Moscow',
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_reminder TIMESTAMP
+            last_reminder INTEGER
         )
     ''')
 
@@ -42,8 +63,8 @@ def init_db():
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER,
             activity_type TEXT,
-            start_time TIMESTAMP,
-            end_time TIMESTAMP,
+            start_time INTEGER,
+            end_time INTEGER,
             duration_seconds INTEGER
         )
     ''')
@@ -60,18 +81,24 @@ def init_db():
     ''')
 
     conn.commit()
-    conn.close()
-    print(f"✅ База данных инициализирована: {db_path}")
+
+    schema_version = run_migrations(conn)
+    print(f"✅ База данных инициализирована: {get_db_path()} (схема v{schema_version})")
 
 def add_user(user_id, username, first_name, last_name, timezone='Europe/Moscow'):
     """
     Добавление нового пользователя с часовым поясом.
+    Если часовой пояс существующего пользователя изменился, дневные итоги
+    и сетки пересчитываются так же, как в update_user_timezone.
     """
-    db_path = get_db_path()
-    conn = sqlite3.connect(db_path)
+    conn = get_connection()
     cursor = conn.cursor()
+    timezone_changed = False
 
     try:
+        cursor.execute('SELECT timezone FROM users WHERE user_id = ?', (user_id,))
+        existing = cursor.fetchone()
+
         cursor.execute('''
             INSERT OR REPLACE INTO users (user_id, username, first_name, last_name, timezone)
             VALUES (?, ?, ?, ?, ?)
@@ -82,18 +109,35 @@ def add_user(user_id, username, first_name, last_name, timezone='Europe/Moscow')
             VALUES (?)
         ''', (user_id,))
 
+        if existing is not None and existing[0] != timezone:
+            _apply_timezone_change(cursor, user_id)
+            timezone_changed = True
+        else:
+            update_quiet_window(cursor, user_id)
+
         conn.commit()
     except Exception as e:
         print(f"❌ Ошибка добавления пользователя {user_id}: {e}")
+        conn.rollback()
     finally:
-        conn.close()
+        _profile_cache.invalidate(user_id)
+        if timezone_changed:
+            stats_cache.bump(user_id)
+
+def _apply_timezone_change(cursor, user_id):
+    """
+    Пересчет данных, привязанных к локальным дням и смещению часового пояса,
+    после смены часового пояса (внутри транзакции вызывающего).
+    """
+    rebuild_rollups(cursor, user_id)
+    rebuild_day_grids(cursor, user_id)
+    update_quiet_window(cursor, user_id)
 
 def update_user_timezone(user_id, timezone):
     """
     Обновление часового пояса пользователя.
     """
-    db_path = get_db_path()
-    conn = sqlite3.connect(db_path)
+    conn = get_connection()
     cursor = conn.cursor()
 
     try:
@@ -102,41 +146,93 @@ def update_user_timezone(user_id, timezone):
             SET timezone = ?
             WHERE user_id = ?
         ''', (timezone, user_id))
+        # Дневные итоги и сетки привязаны к локальным дням - пересчитываем в новом поясе
+        _apply_timezone_change(cursor, user_id)
         conn.commit()
         return True
     except Exception as e:
         print(f"❌ Ошибка обновления часового пояса {user_id}: {e}")
+        conn.rollback()
         return False
     finally:
-        conn.close()
+        _profile_cache.invalidate(user_id)
+        stats_cache.bump(user_id)
 
-def get_user_timezone(user_id):
+def _load_profile(user_id):
     """
-    Получение часового пояса пользователя.
+    Загрузка профиля пользователя из базы одним запросом.
     """
-    db_path = get_db_path()
-    conn = sqlite3.connect(db_path)
+    conn = get_connection()
     cursor = conn.cursor()
 
-    cursor.execute('SELECT timezone FROM users WHERE user_id = ?', (user_id,))
-    result = cursor.fetchone()
-    conn.close()
+    cursor.execute('''
+        SELECT u.user_id, u.timezone,
+               us.user_id, us.reminder_interval, us.notifications_enabled,
+               us.quiet_time_enabled, us.quiet_time_start, us.quiet_time_end,
+               us.quiet_utc_start, us.quiet_utc_end, us.timeline_resolution
+        FROM (SELECT ? AS user_id) AS k
+        LEFT JOIN users u ON u.user_id = k.user_id
+        LEFT JOIN user_settings us ON us.user_id = k.user_id
+    ''', (user_id,))
 
-    if result:
-        return result[0]
+    row = cursor.fetchone()
+
+    settings = None
+    if row[2] is not None:
+        settings = {
+            'reminder_interval': row[3],
+            'notifications_enabled': bool(row[4]),
+            'quiet_time_enabled': bool(row[5]),
+            'quiet_time_start': row[6],
+            'quiet_time_end': row[7],
+            'quiet_utc_start': row[8],
+            'quiet_utc_end': row[9],
+            'timeline_resolution': row[10] or DEFAULT_TIMELINE_RESOLUTION
+        }
+
+    return {
+        'timezone': row[1] if row[0] is not None else None,
+        'settings': settings
+    }
+
+def get_user_profile(user_id):
+    """
+    Профиль пользователя (часовой пояс и настройки) из кэша
+    с загрузкой из базы при промахе.
+    """
+    return _profile_cache.get_or_load(user_id, _load_profile)
+
+def get_stats_cache_stats():
+    """
+    Счетчики кэша снимков статистики.
+    """
+    return stats_cache.stats()
+
+def get_profile_cache_stats():
+    """
+    Счетчики кэша профилей (попадания, промахи, размер).
+    """
+    return _profile_cache.stats()
+
+def get_user_timezone(user_id):
+    """
+    Получение часового пояса пользователя.
+    """
+    timezone = get_user_profile(user_id)['timezone']
+
+    if timezone:
+        return timezone
     return 'Europe/Moscow'
 
 def get_user_timezone_info(user_id):
     """
     Получение информации о часовом поясе пользователя.
     """
-    db_path = get_db_path()
-    conn = sqlite3.connect(db_path)
+    conn = get_connection()
     cursor = conn.cursor()
 
     cursor.execute('SELECT user_id, first_name, timezone FROM users WHERE user_id = ?', (user_id,))
     result = cursor.fetchone()
-    conn.close()
 
     if result:
         return {
@@ -148,194 +244,172 @@ def get_user_timezone_info(user_id):
 
 def get_current_activity(user_id):
     """
-    Получение текущей активности с учетом часового пояса пользователя.
+    Получение текущей активности: (activity_type, start_time),
+    где start_time - время начала в секундах UTC (epoch).
+    Поиск по первичному ключу таблицы open_activity.
     """
-    db_path = get_db_path()
-    conn = sqlite3.connect(db_path)
+    conn = get_connection()
     cursor = conn.cursor()
 
     cursor.execute('''
         SELECT activity_type, start_time 
-        FROM activities 
-        WHERE user_id = ? AND end_time IS NULL
-        LIMIT 1
+        FROM open_activity 
+        WHERE user_id = ?
     ''', (user_id,))
 
     current_activity = cursor.fetchone()
-    conn.close()
 
     return current_activity
 
+def count_active_users():
+    """
+    Количество пользователей с текущей активностью.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('SELECT COUNT(*) FROM open_activity')
+    return cursor.fetchone()[0]
+
 def start_activity(user_id, activity_type):
     """
     Начало новой активности с учетом локального времени пользователя.
+    Предыдущая активность закрывается, а новая открывается в одной транзакции
+    BEGIN IMMEDIATE, поэтому два быстрых нажатия не оставят двух открытых активностей.
+
+    Возвращает (activity_type, duration_seconds) завершенной активности,
+    где длительность посчитана базой при закрытии, или None,
+    если завершать нечего или эта активность уже идет.
     """
-    db_path = get_db_path()
-    conn = sqlite3.connect(db_path)
+    conn = get_connection()
     cursor = conn.cursor()
 
     completed_activity = None
+    user_tz = get_tz(get_user_timezone(user_id))
 
-    cursor.execute('''
-        SELECT activity_type, start_time 
-        FROM activities 
-        WHERE user_id = ? AND end_time IS NULL AND activity_type = ?
-        LIMIT 1
-    ''', (user_id, activity_type))
+    # IMMEDIATE берет блокировку записи до чтения текущей активности,
+    # поэтому параллельный вызов дождется фиксации этой транзакции
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        now = int(time.time())
 
-    same_activity = cursor.fetchone()
+        cursor.execute('''
+            SELECT activity_id, activity_type 
+            FROM open_activity 
+            WHERE user_id = ?
+        ''', (user_id,))
 
-    if same_activity:
-        conn.close()
-        return None
+        current_activity = cursor.fetchone()
 
-    cursor.execute('''
-        SELECT activity_type, start_time 
-        FROM activities 
-        WHERE user_id = ? AND end_time IS NULL
-        LIMIT 1
-    ''', (user_id,))
+        if current_activity and current_activity[1] == activity_type:
+            conn.rollback()
+            return None
 
-    current_activity = cursor.fetchone()
+        if current_activity:
+            cursor.execute('''
+                UPDATE activities 
+                SET end_time = ?, duration_seconds = ? - start_time
+                WHERE id = ?
+                RETURNING activity_type, start_time, duration_seconds
+            ''', (now, now, current_activity[0]))
 
-    if current_activity:
-        end_time = datetime.now()
-        start_time = datetime.fromisoformat(current_activity[1])
-        duration = int((end_time - start_time).total_seconds())
+            completed_type, completed_start, duration = cursor.fetchone()
+
+            # Дневные итоги и сетки дней обновляются в той же транзакции
+            add_to_rollup(cursor, user_id, completed_type, completed_start, now, user_tz)
+            update_day_grids(cursor, user_id, completed_start, now, user_tz)
+
+            completed_activity = (completed_type, duration)
 
         cursor.execute('''
-            UPDATE activities 
-            SET end_time = ?, duration_seconds = ?
-            WHERE user_id = ? AND end_time IS NULL
-        ''', (end_time.isoformat(), duration, user_id))
+            INSERT INTO activities (user_id, activity_type, start_time)
+            VALUES (?, ?, ?)
+            RETURNING id
+        ''', (user_id, activity_type, now))
 
-        completed_activity = current_activity
+        activity_id = cursor.fetchone()[0]
 
-    start_time = datetime.now()
-    cursor.execute('''
-        INSERT INTO activities (user_id, activity_type, start_time)
-        VALUES (?, ?, ?)
-    ''', (user_id, activity_type, start_time.isoformat()))
+        cursor.execute('''
+            INSERT OR REPLACE INTO open_activity (user_id, activity_id, activity_type, start_time)
+            VALUES (?, ?, ?, ?)
+        ''', (user_id, activity_id, activity_type, now))
 
-    conn.commit()
-    conn.close()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    # История изменилась - снимки статистики пользователя устарели
+    stats_cache.bump(user_id)
 
     return completed_activity
 
+def _day_range(start_date, end_date, tz):
+    """
+    Полуоткрытый диапазон [начало start_date, начало дня после end_date)
+    в секундах UTC, где границы дней берутся в часовом поясе tz.
+    Столбец сравнивается без обертки в date(), поэтому запрос использует
+    индекс (user_id, start_time) вместо просмотра всей истории.
+    """
+    range_start = tz.localize(datetime.combine(start_date, datetime.min.time()))
+    range_end = tz.localize(datetime.combine(end_date + timedelta(days=1), datetime.min.time()))
+    return int(range_start.timestamp()), int(range_end.timestamp())
+
 def get_stats_last_24_hours(user_id):
     """
     Статистика за последние 24 часа с учетом текущей активности.
     """
-    db_path = get_db_path()
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    # Время 24 часа назад от текущего момента
-    time_24_hours_ago = datetime.now() - timedelta(hours=24)
+    return get_total_stats_by_activity(user_id, 1)
 
+def _get_closed_rollup_totals(cursor, user_id, start_date, end_date):
+    """
+    Итоги завершенных активностей за локальные дни [start_date, end_date] из daily_rollup.
+    Возвращает словарь {activity_type: seconds}.
+    """
     cursor.execute('''
-        SELECT activity_type, SUM(duration_seconds)
-        FROM activities 
-        WHERE user_id = ? 
-          AND start_time >= ?
-          AND duration_seconds IS NOT NULL
+        SELECT activity_type, SUM(seconds)
+        FROM daily_rollup
+        WHERE user_id = ?
+          AND local_day >= ? AND local_day <= ?
         GROUP BY activity_type
-    ''', (user_id, time_24_hours_ago.isoformat()))
+    ''', (user_id, start_date.isoformat(), end_date.isoformat()))
 
-    completed_stats = cursor.fetchall()
+    return dict(cursor.fetchall())
+
+def _get_rollup_totals(cursor, user_id, start_date, end_date, user_tz):
+    """
+    Итоги по активностям за локальные дни [start_date, end_date] из daily_rollup
+    плюс часть текущей активности, попадающая в этот период.
+    Возвращает словарь {activity_type: seconds}.
+    """
+    totals = _get_closed_rollup_totals(cursor, user_id, start_date, end_date)
 
-    # Добавляем текущую активность, если она есть и началась в последние 24 часа
     current_activity = get_current_activity(user_id)
     if current_activity:
-        activity_type, start_time_str = current_activity
-        start_time = datetime.fromisoformat(start_time_str)
-
-        # Проверяем, началась ли текущая активность в последние 24 часа
-        if start_time >= time_24_hours_ago:
-            current_time = datetime.now()
-            current_duration = int((current_time - start_time).total_seconds())
-
-            # Ищем текущую активность в завершенных
-            found = False
-            completed_stats_list = list(completed_stats)
-            for i, (act_type, duration) in enumerate(completed_stats_list):
-                if act_type == activity_type:
-                    completed_stats_list[i] = (act_type, duration + current_duration)
-                    found = True
-                    break
-
-            if not found:
-                completed_stats_list.append((activity_type, current_duration))
-
-            completed_stats = completed_stats_list
-
-    # Преобразуем в словарь для удобства
-    stats_dict = {}
-    for activity_type, duration in completed_stats:
-        stats_dict[activity_type] = duration
-
-    # Добавляем все активности, даже с нулевым временем
-    from config import ACTIVITIES
-    result = []
-    for activity_type in ACTIVITIES.keys():
-        duration = stats_dict.get(activity_type, 0)
-        result.append((activity_type, duration))
+        activity_type, start_time = current_activity
+        range_start, range_end = _day_range(start_date, end_date, user_tz)
+        current_duration = min(int(time.time()), range_end) - max(start_time, range_start)
 
-    # Сортируем по убыванию времени
-    result.sort(key=lambda x: x[1], reverse=True)
+        if current_duration > 0:
+            totals[activity_type] = totals.get(activity_type, 0) + current_duration
 
-    conn.close()
-    return result
+    return totals
 
 def get_daily_stats(user_id, date=None):
     """
     Статистика за день с учетом текущей активности.
     """
-    db_path = get_db_path()
-    conn = sqlite3.connect(db_path)
+    conn = get_connection()
     cursor = conn.cursor()
 
-    if date is None:
-        date = datetime.now().date()
-
-    cursor.execute('''
-        SELECT activity_type, SUM(duration_seconds)
-        FROM activities 
-        WHERE user_id = ? 
-          AND date(start_time) = date(?)
-          AND duration_seconds IS NOT NULL
-        GROUP BY activity_type
-    ''', (user_id, date.isoformat()))
+    user_tz = get_tz(get_user_timezone(user_id))
 
-    completed_stats = cursor.fetchall()
-
-    cursor.execute('''
-        SELECT activity_type, start_time 
-        FROM activities 
-        WHERE user_id = ? 
-          AND end_time IS NULL
-          AND date(start_time) = date(?)
-        LIMIT 1
-    ''', (user_id, date.isoformat()))
-
-    current_activity = cursor.fetchone()
-    conn.close()
-
-    stats_dict = {}
-
-    for activity_type, duration in completed_stats:
-        stats_dict[activity_type] = duration
-
-    if current_activity:
-        activity_type, start_time_str = current_activity
-        start_time = datetime.fromisoformat(start_time_str)
-        current_time = datetime.now()
-        current_duration = int((current_time - start_time).total_seconds())
+    if date is None:
+        date = datetime.now(user_tz).date()
+    elif isinstance(date, datetime):
+        date = date.date()
 
-        if activity_type in stats_dict:
-            stats_dict[activity_type] += current_duration
-        else:
-            stats_dict[activity_type] = current_duration
+    stats_dict = _get_rollup_totals(cursor, user_id, date, date, user_tz)
 
     return [(activity_type, duration) for activity_type, duration in stats_dict.items()]
 
@@ -343,233 +417,203 @@ def get_period_stats(user_id, period_days):
     """
     Статистика за период с учетом текущей активности.
     """
-    db_path = get_db_path()
-    conn = sqlite3.connect(db_path)
+    conn = get_connection()
     cursor = conn.cursor()
 
-    start_date = (datetime.now() - timedelta(days=period_days)).date()
-    today = datetime.now().date()
+    user_tz = get_tz(get_user_timezone(user_id))
 
-    cursor.execute('''
-        SELECT activity_type, SUM(duration_seconds)
-        FROM activities 
-        WHERE user_id = ? 
-          AND date(start_time) >= date(?) 
-          AND duration_seconds IS NOT NULL
-        GROUP BY activity_type
-    ''', (user_id, start_date.isoformat()))
-
-    completed_stats = cursor.fetchall()
-
-    cursor.execute('''
-        SELECT activity_type, start_time 
-        FROM activities 
-        WHERE user_id = ? 
-          AND end_time IS NULL
-          AND date(start_time) >= date(?)
-        LIMIT 1
-    ''', (user_id, start_date.isoformat()))
-
-    current_activity = cursor.fetchone()
-    conn.close()
-
-    stats_dict = {}
-
-    for activity_type, duration in completed_stats:
-        stats_dict[activity_type] = duration
-
-    if current_activity:
-        activity_type, start_time_str = current_activity
-        start_time = datetime.fromisoformat(start_time_str)
-        current_time = datetime.now()
+    today = datetime.now(user_tz).date()
+    start_date = today - timedelta(days=period_days)
 
-        if start_time.date() >= start_date:
-            current_duration = int((current_time - start_time).total_seconds())
-
-            if activity_type in stats_dict:
-                stats_dict[activity_type] += current_duration
-            else:
-                stats_dict[activity_type] = current_duration
+    stats_dict = _get_rollup_totals(cursor, user_id, start_date, today, user_tz)
 
     return [(activity_type, duration) for activity_type, duration in stats_dict.items()]
 
 
-def get_hourly_activity_stats(user_id, days=1):
+def _load_grid_snapshot(cursor, user_id, start_date, days, user_tz, current):
     """
-    Получение статистики активности по 30-минутным интервалам за указанное количество дней.
-    Теперь с учетом часового пояса пользователя.
-    Возвращает список из 48 элементов (24 часа * 2 интервала) для каждого дня.
+    Завершенная часть графика за days дней с start_date: сетки из day_grid
+    одним запросом по диапазону ключа и, если текущая активность началась
+    в этом периоде, завершенные активности дня ее начала.
     """
-    db_path = get_db_path()
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    # Получаем часовой пояс пользователя
-    timezone = get_user_timezone(user_id)
-
-    # Получаем локальную дату пользователя
-    try:
-        import pytz
-        user_tz = pytz.timezone(timezone)
-        user_now = datetime.now(user_tz)
-        end_date = user_now.date()
-    except:
-        user_now = datetime.now()
-        end_date = user_now.date()
-
-    start_date = end_date - timedelta(days=days - 1)
-
-    # Получаем все активности за период
+    end_date = start_date + timedelta(days=days - 1)
     cursor.execute('''
-        SELECT activity_type, start_time, 
-               COALESCE(duration_seconds, 
-                       strftime('%s', 'now') - strftime('%s', start_time)) as duration
-        FROM activities 
-        WHERE user_id = ? 
-          AND date(start_time) BETWEEN date(?) AND date(?)
+        SELECT local_day, slots
+        FROM day_grid
+        WHERE user_id = ? AND local_day BETWEEN ? AND ?
     ''', (user_id, start_date.isoformat(), end_date.isoformat()))
+    stored = dict(cursor.fetchall())
 
-    activities = cursor.fetchall()
-    conn.close()
-
-    # Создаем структуру для хранения статистики
-    days_stats = []
+    open_day_activities = None
+    if current:
+        open_day = datetime.fromtimestamp(current[1], user_tz).date()
+        if start_date <= open_day <= end_date:
+            open_day_activities = load_day_activities(cursor, user_id, open_day, open_day, user_tz)
 
-    for day_offset in range(days):
-        current_date = start_date + timedelta(days=day_offset)
-
-        # 48 интервалов по 30 минут (00:00-00:30, 00:30-01:00, ... 23:30-00:00)
-        hourly_stats = [None] * 48
-
-        for activity_type, start_time_str, duration in activities:
-            start_time = datetime.fromisoformat(start_time_str)
+    return {
+        'start_date': start_date,
+        'grids': [stored.get((start_date + timedelta(days=i)).isoformat(), EMPTY_GRID) for i in range(days)],
+        'open_day_activities': open_day_activities
+    }
 
-            # Конвертируем время в часовой пояс пользователя
-            try:
-                user_tz = pytz.timezone(timezone)
-                start_time_user = start_time.astimezone(user_tz)
-            except:
-                start_time_user = start_time
+def _live_grids(grid_snapshot, current, user_tz, now, slot_seconds):
+    """
+    Сетки графика из снимка с наложенной текущей активностью на момент now:
+    день ее начала пересчитывается по сохраненным активностям этого дня,
+    следующие дни заполняются ею до текущего интервала.
+    """
+    grids = list(grid_snapshot['grids'])
+    start_date = grid_snapshot['start_date']
 
-            # Проверяем, относится ли активность к текущему дню в часовом поясе пользователя
-            if start_time_user.date() != current_date:
-                continue
+    if current:
+        activity_type, open_start = current
+        open_index = (datetime.fromtimestamp(open_start, user_tz).date() - start_date).days
 
-            # Рассчитываем время окончания активности
-            end_time = start_time + timedelta(seconds=duration)
+        if grid_snapshot['open_day_activities'] is not None:
+            activities, day_starts = grid_snapshot['open_day_activities']
+            grids[open_index] = grids_from_activities(
+                activities + [(activity_type, open_start, now - open_start)], day_starts
+            )[0]
 
-            # Конвертируем время окончания в часовой пояс пользователя
-            try:
-                end_time_user = end_time.astimezone(user_tz)
-            except:
-                end_time_user = end_time
+        for i in range(max(0, open_index + 1), len(grids)):
+            day_start = day_bounds(start_date + timedelta(days=i), user_tz)[0]
+            grids[i] = overlay_open_activity(grids[i], activity_type, day_start, open_start, now)
 
-            # Разбиваем активность на 30-минутные интервалы
-            interval_start = start_time_user
-            remaining_seconds = duration
+    factor = slot_factor(slot_seconds)
+    return [downsample_grid(grid, factor) for grid in grids]
 
-            while remaining_seconds > 0:
-                # Определяем час и минуту в локальном времени пользователя
-                hour = interval_start.hour
-                minute = interval_start.minute
+def get_stats_snapshot(user_id, timeline_days=0, totals_days=()):
+    """
+    Снимок завершенной части статистики: сетки графика за timeline_days дней
+    и итоги по периодам totals_days (1 - последние 24 часа, иначе - локальные дни
+    из daily_rollup) без текущей активности, а также сама текущая активность.
+    Снимок не меняется, пока не изменится история пользователя (кроме итогов
+    за 24 часа, поэтому для них хранятся строки активностей) - его можно
+    кэшировать; вклад текущей активности добавляет apply_live_stats.
+    Все запросы выполняются в одной транзакции чтения одного соединения,
+    текущая активность читается один раз.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
 
-                # Определяем номер интервала (0-47)
-                interval_num = (hour * 2) + (minute // 30)
+    user_tz = get_tz(get_user_timezone(user_id))
 
-                # Определяем конец текущего интервала
-                interval_end_time = interval_start.replace(
-                    minute=(minute // 30) * 30,
-                    second=0,
-                    microsecond=0
-                ) + timedelta(minutes=30)
+    # Одна транзакция - согласованный снимок, даже если параллельно завершается активность
+    own_transaction = not conn.in_transaction
+    if own_transaction:
+        cursor.execute('BEGIN')
+    try:
+        snapshot = _read_stats_snapshot(cursor, user_id, user_tz, timeline_days, totals_days)
+    finally:
+        if own_transaction:
+            conn.commit()
 
-                # Сколько секунд активности попадает в этот интервал
-                seconds_in_interval = min(
-                    remaining_seconds,
-                    (interval_end_time - interval_start).total_seconds()
-                )
+    return snapshot
 
-                # Если в этом интервале еще нет активности или эта активность дольше
-                if hourly_stats[interval_num] is None or seconds_in_interval > hourly_stats[interval_num][1]:
-                    hourly_stats[interval_num] = (activity_type, seconds_in_interval)
+def _read_stats_snapshot(cursor, user_id, user_tz, timeline_days, totals_days):
+    """
+    Чтение снимка статистики (внутри транзакции вызывающего).
+    """
+    now = int(time.time())
+    end_date = datetime.fromtimestamp(now, user_tz).date()
 
-                # Переходим к следующему интервалу
-                interval_start = interval_end_time
-                remaining_seconds -= seconds_in_interval
+    cursor.execute('''
+        SELECT activity_type, start_time
+        FROM open_activity
+        WHERE user_id = ?
+    ''', (user_id,))
+    current = cursor.fetchone()
+
+    snapshot = {
+        'timezone': user_tz,
+        'end_date': end_date,
+        'current': current,
+        'timeline': None,
+        'totals': {}
+    }
 
-        # Заменяем None на 'rest' (отдых) для интервалов без активности
-        for i in range(48):
-            if hourly_stats[i] is None:
-                hourly_stats[i] = ('rest', 0)
+    if timeline_days:
+        start_date = end_date - timedelta(days=timeline_days - 1)
+        snapshot['timeline'] = _load_grid_snapshot(cursor, user_id, start_date, timeline_days, user_tz, current)
 
-        days_stats.append(hourly_stats)
+    for days in totals_days:
+        if days == 1:
+            # Завершенные активности, начатые за последние 24 часа (окно сдвигается при чтении)
+            cursor.execute('''
+                SELECT activity_type, start_time, duration_seconds
+                FROM activities
+                WHERE user_id = ?
+                  AND start_time >= ?
+                  AND duration_seconds IS NOT NULL
+            ''', (user_id, now - 86400))
+            snapshot['totals'][days] = cursor.fetchall()
+        else:
+            start_date = end_date - timedelta(days=days - 1)
+            snapshot['totals'][days] = _get_closed_rollup_totals(cursor, user_id, start_date, end_date)
 
-    return days_stats
+    return snapshot
 
-def get_total_stats_by_activity(user_id, days=1):
+def _totals_list(totals):
     """
-    Получение общей статистики по активностям за указанное количество дней.
-    Для days=1 использует последние 24 часа.
+    Итоги {activity_type: seconds} -> список по всем активностям по убыванию времени.
     """
-    # Если запрашиваем 1 день, используем статистику за 24 часа
-    if days == 1:
-        return get_stats_last_24_hours(user_id)
-
-    # Остальной код функции для days > 1
-    db_path = get_db_path()
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    end_date = datetime.now().date()
-    start_date = end_date - timedelta(days=days-1)
-
-    # Статистика по завершенным активностям
-    cursor.execute('''
-        SELECT activity_type, SUM(duration_seconds)
-        FROM activities 
-        WHERE user_id = ? 
-          AND date(start_time) BETWEEN date(?) AND date(?)
-          AND duration_seconds IS NOT NULL
-        GROUP BY activity_type
-    ''', (user_id, start_date.isoformat(), end_date.isoformat()))
+    result = [(activity_type, totals.get(activity_type, 0)) for activity_type in ACTIVITIES]
+    result.sort(key=lambda x: x[1], reverse=True)
+    return result
 
-    completed_stats = dict(cursor.fetchall())
+def apply_live_stats(snapshot, slot_seconds=SLOT_SECONDS, now=None):
+    """
+    Статистика из снимка с вкладом текущей активности на момент now:
+    {'grids': сетки графика или None, 'totals': {days: [(activity_type, seconds), ...]}}.
+    """
+    now = int(now if now is not None else time.time())
+    user_tz = snapshot['timezone']
+    current = snapshot['current']
+
+    grids = None
+    if snapshot['timeline'] is not None:
+        grids = _live_grids(snapshot['timeline'], current, user_tz, now, slot_seconds)
+
+    totals = {}
+    for days, closed in snapshot['totals'].items():
+        if days == 1:
+            window_start = now - 86400
+            period_totals = {}
+            for activity_type, start_time, duration in closed:
+                if start_time >= window_start:
+                    period_totals[activity_type] = period_totals.get(activity_type, 0) + duration
+
+            # Текущая активность - если началась в последние 24 часа
+            if current and current[1] >= window_start:
+                period_totals[current[0]] = period_totals.get(current[0], 0) + now - current[1]
+        else:
+            period_totals = dict(closed)
+            if current:
+                start_date = snapshot['end_date'] - timedelta(days=days - 1)
+                range_start, range_end = _day_range(start_date, snapshot['end_date'], user_tz)
+                current_duration = min(now, range_end) - max(current[1], range_start)
+                if current_duration > 0:
+                    period_totals[current[0]] = period_totals.get(current[0], 0) + current_duration
 
-    # Добавляем текущую активность, если она есть
-    current_activity = get_current_activity(user_id)
-    if current_activity:
-        activity_type, start_time_str = current_activity
-        start_time = datetime.fromisoformat(start_time_str)
-
-        # Проверяем, попадает ли текущая активность в период
-        if start_date <= start_time.date() <= end_date:
-            current_time = datetime.now()
-            current_duration = int((current_time - start_time).total_seconds())
-
-            if activity_type in completed_stats:
-                completed_stats[activity_type] += current_duration
-            else:
-                completed_stats[activity_type] = current_duration
-
-    # Добавляем все активности, даже с нулевым временем
-    from config import ACTIVITIES
-    result = []
-    for activity_type in ACTIVITIES.keys():
-        duration = completed_stats.get(activity_type, 0)
-        result.append((activity_type, duration))
+        totals[days] = _totals_list(period_totals)
 
-    # Сортируем по убыванию времени
-    result.sort(key=lambda x: x[1], reverse=True)
+    return {'grids': grids, 'totals': totals}
 
-    conn.close()
-    return result
+def get_total_stats_by_activity(user_id, days=1):
+    """
+    Получение общей статистики по активностям за указанное количество дней
+    с учетом текущей активности.
+    Для days=1 - активности, начатые за последние 24 часа,
+    для days > 1 - локальные дни из дневных итогов.
+    """
+    snapshot = get_stats_snapshot(user_id, totals_days=(days,))
+    return apply_live_stats(snapshot)['totals'][days]
 
 def update_user_setting(user_id, setting_name, value):
     """
     Обновление настроек пользователя.
     """
-    db_path = get_db_path()
-    conn = sqlite3.connect(db_path)
+    conn = get_connection()
     cursor = conn.cursor()
 
     try:
@@ -603,6 +647,15 @@ def update_user_setting(user_id, setting_name, value):
                 SET quiet_time_end = ?
                 WHERE user_id = ?
             ''', (value, user_id))
+        elif setting_name == 'timeline_resolution':
+            cursor.execute('''
+                UPDATE user_settings 
+                SET timeline_resolution = ?
+                WHERE user_id = ?
+            ''', (value, user_id))
+
+        if setting_name in ('quiet_time_start', 'quiet_time_end'):
+            update_quiet_window(cursor, user_id)
 
         conn.commit()
         print(f"✅ Настройка {setting_name} обновлена для пользователя {user_id}: {value}")
@@ -611,166 +664,336 @@ def update_user_setting(user_id, setting_name, value):
         print(f"❌ Ошибка обновления настроек {user_id}: {e}")
         conn.rollback()
     finally:
-        conn.close()
+        _profile_cache.invalidate(user_id)
 
-def get_user_settings(user_id):
+def get_timeline_resolution(user_id):
     """
-    Получение настроек.
+    Выбранная пользователем ширина интервала графика активности (сек).
     """
-    db_path = get_db_path()
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    cursor.execute('''
-        SELECT reminder_interval, notifications_enabled, 
-               quiet_time_enabled, quiet_time_start, quiet_time_end
-        FROM user_settings 
-        WHERE user_id = ?
-    ''', (user_id,))
+    settings = get_user_profile(user_id)['settings']
+    if settings:
+        return settings['timeline_resolution']
+    return DEFAULT_TIMELINE_RESOLUTION
 
-    settings = cursor.fetchone()
-    conn.close()
+def get_user_settings(user_id):
+    """
+    Получение настроек (из кэша профилей).
+    """
+    settings = get_user_profile(user_id)['settings']
 
     if settings:
-        return {
-            'reminder_interval': settings[0],
-            'notifications_enabled': bool(settings[1]),
-            'quiet_time_enabled': bool(settings[2]),
-            'quiet_time_start': settings[3],
-            'quiet_time_end': settings[4]
-        }
+        return dict(settings)
     return None
 
 def clear_user_data(user_id):
     """
     Удаление данных.
     """
-    db_path = get_db_path()
-    conn = sqlite3.connect(db_path)
+    conn = get_connection()
     cursor = conn.cursor()
 
-    cursor.execute('DELETE FROM activities WHERE user_id = ?', (user_id,))
-    cursor.execute('''
-        UPDATE user_settings 
-        SET reminder_interval = 1800, 
-            notifications_enabled = 1,
-            quiet_time_enabled = 1,
-            quiet_time_start = '22:00',
-            quiet_time_end = '06:00'
-        WHERE user_id = ?
-    ''', (user_id,))
+    with conn:
+        cursor.execute('DELETE FROM activities WHERE user_id = ?', (user_id,))
+        cursor.execute('DELETE FROM daily_rollup WHERE user_id = ?', (user_id,))
+        cursor.execute('DELETE FROM day_grid WHERE user_id = ?', (user_id,))
+        cursor.execute('DELETE FROM open_activity WHERE user_id = ?', (user_id,))
+        cursor.execute('''
+            UPDATE user_settings 
+            SET reminder_interval = 1800, 
+                notifications_enabled = 1,
+                quiet_time_enabled = 1,
+                quiet_time_start = '22:00',
+                quiet_time_end = '06:00',
+                timeline_resolution = NULL
+            WHERE user_id = ?
+        ''', (user_id,))
+        update_quiet_window(cursor, user_id)
 
-    conn.commit()
-    conn.close()
+    _profile_cache.invalidate(user_id)
+    stats_cache.bump(user_id)
+
+def rebuild_daily_rollup(user_id=None):
+    """
+    Пересчет дневных итогов и сеток дней из сырых активностей
+    (после сбоя или изменения схемы). Возвращает количество активностей.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        processed = rebuild_rollups(cursor, user_id)
+        rebuild_day_grids(cursor, user_id)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return processed
+
+def _utc_minute(now):
+    """
+    Минута суток UTC для момента now (UTC epoch).
+    """
+    return int(now // 60) % (24 * 60)
+
+# Условие "сейчас тихое время" по окну в минутах UTC (параметр - текущая минута UTC).
+# Для тестовых интервалов (меньше минуты) тихое время не учитывается.
+# Используется только для счетчика в /status; отправка напоминаний проверяет
+# тихое время в ReminderManager._process_due в момент срабатывания (is_quiet_minute),
+# так как подписки живут дольше текущей минуты и фильтр при загрузке устарел бы
+QUIET_NOW_SQL = '''
+    us.quiet_time_enabled = 1 AND us.reminder_interval >= 60 AND (
+        (us.quiet_utc_start <= us.quiet_utc_end
+         AND :minute >= us.quiet_utc_start AND :minute < us.quiet_utc_end)
+        OR (us.quiet_utc_start > us.quiet_utc_end
+            AND (:minute >= us.quiet_utc_start OR :minute < us.quiet_utc_end))
+    )
+'''
 
 def get_users_for_reminders():
     """
-    Пользователи для напоминаний с учетом тихого времени и часовых поясов.
-    Поддержка тестовых интервалов (5 секунд).
+    Пользователи с включенными уведомлениями, у которых интервал с последнего
+    напоминания прошел и сейчас не тихое время (счетчик для /status;
+    напоминания рассылает ReminderManager по своему расписанию).
+    Тихое время проверяется в SQL по окну в минутах UTC (у каждого
+    пользователя свое, с учетом его часового пояса).
+    Нужен только для статистики /status: запрос просматривает user_settings
+    целиком, отдельного индекса под него нет.
     """
-    db_path = get_db_path()
-    conn = sqlite3.connect(db_path)
+    conn = get_connection()
     cursor = conn.cursor()
 
-    current_time = datetime.now()
-    current_hour = current_time.hour
-    current_minute = current_time.minute
-    current_second = current_time.second
+    now = int(time.time())
+
+    cursor.execute(f'''
+        SELECT u.user_id, u.first_name, us.reminder_interval, u.timezone
+        FROM users u
+        JOIN user_settings us ON u.user_id = us.user_id
+        WHERE us.notifications_enabled = 1 AND us.reminder_interval > 0
+          AND (u.last_reminder IS NULL OR :now - u.last_reminder >= us.reminder_interval)
+          AND NOT ({QUIET_NOW_SQL})
+    ''', {'now': now, 'minute': _utc_minute(now)})
+
+    return cursor.fetchall()
+
+def refresh_all_quiet_windows(at=None):
+    """
+    Пересчет окон тихого времени после смены смещения часовых поясов
+    (переход на летнее/зимнее время) на момент at (по умолчанию сейчас).
+    Возвращает список обновленных user_id.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    with conn:
+        changed = refresh_quiet_windows(cursor, at)
+
+    for user_id in changed:
+        _profile_cache.invalidate(user_id)
+
+    if changed:
+        print(f"✅ Тихое время пересчитано для {len(changed)} пользователей (смена смещения часового пояса)")
+    return changed
+
+def _subscription_from_row(row):
+    """
+    Словарь подписки на напоминания из строки запроса.
+    Тихое время - окно в минутах суток UTC (quiet_utc_start, quiet_utc_end).
+    """
+    return {
+        'user_id': row[0],
+        'timezone': row[1],
+        'reminder_interval': row[2],
+        'quiet_time_enabled': bool(row[3]),
+        'quiet_time_start': row[4],
+        'quiet_time_end': row[5],
+        'quiet_utc_start': row[6],
+        'quiet_utc_end': row[7]
+    }
+
+def get_reminder_subscriptions():
+    """
+    Все пользователи с включенными напоминаниями (для построения расписания)
+    вместе с сохраненным временем следующего напоминания.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
 
     cursor.execute('''
-        SELECT u.user_id, u.first_name, u.timezone,
-               us.reminder_interval, 
+        SELECT u.user_id, u.timezone, us.reminder_interval,
                us.quiet_time_enabled, us.quiet_time_start, us.quiet_time_end,
-               u.last_reminder
+               us.quiet_utc_start, us.quiet_utc_end, u.next_reminder_at
         FROM users u
         JOIN user_settings us ON u.user_id = us.user_id
         WHERE us.notifications_enabled = 1 AND us.reminder_interval > 0
     ''')
 
-    users = cursor.fetchall()
-    conn.close()
-
-    users_to_remind = []
-
-    for user in users:
-        user_id = user[0]
-        first_name = user[1]
-        user_timezone = user[2]
-        reminder_interval = user[3]
-        quiet_time_enabled = user[4]
-        quiet_start = user[5]
-        quiet_end = user[6]
-        last_reminder = user[7]
-
-        # Для тестовых интервалов (5 секунд) пропускаем проверку тихого времени
-        # чтобы можно было тестировать в любое время
-        if quiet_time_enabled and reminder_interval >= 60:  # Только для интервалов >= 1 минуты
-            def time_to_minutes(time_str):
-                try:
-                    h, m = map(int, time_str.split(':'))
-                    return h * 60 + m
-                except:
-                    return 0
-
-            current_minutes = current_hour * 60 + current_minute
-            start_minutes = time_to_minutes(quiet_start)
-            end_minutes = time_to_minutes(quiet_end)
-
-            in_quiet_time = False
-
-            if start_minutes > end_minutes:
-                # Ночное время (например, 22:00-06:00)
-                if current_minutes >= start_minutes or current_minutes < end_minutes:
-                    in_quiet_time = True
-            else:
-                # Дневное время
-                if start_minutes <= current_minutes < end_minutes:
-                    in_quiet_time = True
-
-            if in_quiet_time:
-                continue
-
-        if last_reminder:
-            last_reminder_time = datetime.fromisoformat(last_reminder)
-            time_since_last_reminder = (current_time - last_reminder_time).total_seconds()
-
-            if time_since_last_reminder >= reminder_interval:
-                users_to_remind.append((user_id, first_name, reminder_interval, user_timezone))
-        else:
-            users_to_remind.append((user_id, first_name, reminder_interval, user_timezone))
+    subscriptions = []
+    for row in cursor.fetchall():
+        subscription = _subscription_from_row(row)
+        subscription['next_reminder_at'] = row[8]  # Сохраненное время следующего напоминания
+        subscriptions.append(subscription)
+
+    return subscriptions
+
+def get_reminder_subscription(user_id):
+    """
+    Подписка одного пользователя или None, если напоминания выключены.
+    """
+    profile = get_user_profile(user_id)
+    settings = profile['settings']
 
-    return users_to_remind
+    if not profile['timezone'] or not settings:
+        return None
+    if not settings['notifications_enabled'] or settings['reminder_interval'] <= 0:
+        return None
+
+    return _subscription_from_row((
+        user_id,
+        profile['timezone'],
+        settings['reminder_interval'],
+        settings['quiet_time_enabled'],
+        settings['quiet_time_start'],
+        settings['quiet_time_end'],
+        settings['quiet_utc_start'],
+        settings['quiet_utc_end']
+    ))
+
+def save_next_reminder_times(items):
+    """
+    Пакетное сохранение времени следующих напоминаний.
+    items - список (user_id, next_reminder_at), None - напоминание отменено.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    with conn:
+        cursor.executemany('''
+            UPDATE users
+            SET next_reminder_at = ?
+            WHERE user_id = ?
+        ''', [(next_reminder_at, user_id) for user_id, next_reminder_at in items])
 
 def update_last_reminder_time(user_id):
     """
     Обновление времени последнего напоминания.
     """
-    db_path = get_db_path()
-    conn = sqlite3.connect(db_path)
+    conn = get_connection()
     cursor = conn.cursor()
 
-    current_time = datetime.now().isoformat()
+    with conn:
+        cursor.execute('''
+            UPDATE users 
+            SET last_reminder = ?
+            WHERE user_id = ?
+        ''', (int(time.time()), user_id))
 
-    cursor.execute('''
-        UPDATE users 
-        SET last_reminder = ?
-        WHERE user_id = ?
-    ''', (current_time, user_id))
+def update_last_reminder_times(user_ids, timestamp=None):
+    """
+    Пакетное обновление времени последнего напоминания (одна транзакция).
+    """
+    if not user_ids:
+        return
 
-    conn.commit()
-    conn.close()
+    timestamp = int(time.time()) if timestamp is None else int(timestamp)
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    with conn:
+        cursor.executemany('''
+            UPDATE users
+            SET last_reminder = ?
+            WHERE user_id = ?
+        ''', [(timestamp, user_id) for user_id in user_ids])
+
+def record_delivery_failures(dead_letters, disabled_user_ids=()):
+    """
+    Запись недоставленных напоминаний в dead_letter и отключение уведомлений
+    пользователей, которым писать больше нельзя (одна транзакция).
+    dead_letters - список (user_id, reason, error, attempts).
+    """
+    if not dead_letters and not disabled_user_ids:
+        return
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    now = int(time.time())
+
+    try:
+        with conn:
+            cursor.executemany('''
+                INSERT INTO dead_letter (user_id, reason, error, attempts, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(user_id, reason, error, attempts, now)
+                  for user_id, reason, error, attempts in dead_letters])
+
+            disabled = [(user_id,) for user_id in disabled_user_ids]
+            cursor.executemany('''
+                UPDATE user_settings
+                SET notifications_enabled = 0
+                WHERE user_id = ?
+            ''', disabled)
+            cursor.executemany('''
+                UPDATE users
+                SET next_reminder_at = NULL
+                WHERE user_id = ?
+            ''', disabled)
+    finally:
+        for user_id in disabled_user_ids:
+            _profile_cache.invalidate(user_id)
+
+    for user_id in disabled_user_ids:
+        print(f"🔕 Уведомления отключены для пользователя {user_id}: сообщения не доставляются")
+
+def get_dead_letter_count():
+    """
+    Количество записей о недоставленных напоминаниях.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('SELECT COUNT(*) FROM dead_letter')
+    return cursor.fetchone()[0]
+
+def get_reminder_payloads(user_ids, chunk_size=500):
+    """
+    Данные для напоминаний группы пользователей одним запросом на каждые
+    chunk_size пользователей: включены ли уведомления и текущая активность.
+    Возвращает словарь user_id -> (activity_type, start_time) или None
+    (нет текущей активности). Пользователи с выключенными уведомлениями
+    в результат не попадают.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    payloads = {}
+
+    user_ids = list(user_ids)
+    for i in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[i:i + chunk_size]
+        placeholders = ','.join('?' * len(chunk))
+        cursor.execute(f'''
+            SELECT us.user_id, oa.activity_type, oa.start_time
+            FROM user_settings us
+            LEFT JOIN open_activity oa ON oa.user_id = us.user_id
+            WHERE us.user_id IN ({placeholders})
+              AND us.notifications_enabled = 1
+        ''', chunk)
+
+        for user_id, activity_type, start_time in cursor.fetchall():
+            payloads[user_id] = (activity_type, start_time) if activity_type else None
+
+    return payloads
 
 def get_all_users():
     """
     Все пользователи.
     """
-    db_path = get_db_path()
-    conn = sqlite3.connect(db_path)
+    conn = get_connection()
     cursor = conn.cursor()
 
     cursor.execute('SELECT user_id, first_name, timezone FROM users')
     users = cursor.fetchall()
-    conn.close()
 
     return users
 
@@ -778,8 +1001,7 @@ def get_timezone_stats():
     """
     Статистика по часовым поясам.
     """
-    db_path = get_db_path()
-    conn = sqlite3.connect(db_path)
+    conn = get_connection()
     cursor = conn.cursor()
 
     cursor.execute('''
@@ -790,7 +1012,6 @@ def get_timezone_stats():
     ''')
 
     stats = cursor.fetchall()
-    conn.close()
 
     return stats
 
@@ -798,8 +1019,7 @@ def get_user_stats(user_id):
     """
     Основная статистика пользователя с учетом текущей активности.
     """
-    db_path = get_db_path()
-    conn = sqlite3.connect(db_path)
+    conn = get_connection()
     cursor = conn.cursor()
 
     cursor.execute('SELECT COUNT(*) FROM activities WHERE user_id = ?', (user_id,))
@@ -810,10 +1030,7 @@ def get_user_stats(user_id):
 
     current_activity = get_current_activity(user_id)
     if current_activity:
-        start_time = datetime.fromisoformat(current_activity[1])
-        current_time = datetime.now()
-        current_duration = int((current_time - start_time).total_seconds())
-        total_seconds += current_duration
+        total_seconds += int(time.time()) - current_activity[1]
 
     cursor.execute('''
         SELECT activity_type, COUNT(*) as count
@@ -826,7 +1043,6 @@ def get_user_stats(user_id):
 
     top_activities = cursor.fetchall()
 
-    conn.close()
 
     return {
         'total_activities': total_activities,
@@ -838,8 +1054,7 @@ def debug_user_settings(user_id):
     """
     Отладочная информация о настройках пользователя.
     """
-    db_path = get_db_path()
-    conn = sqlite3.connect(db_path)
+    conn = get_connection()
     cursor = conn.cursor()
 
     cursor.execute('''
@@ -850,7 +1065,6 @@ def debug_user_settings(user_id):
     ''', (user_id,))
 
     settings = cursor.fetchone()
-    conn.close()
 
     if settings:
         return f"""
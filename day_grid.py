@@ -0,0 +1,214 @@
+"""
+Сетка активности по локальным дням (таблица day_grid).
+Для каждого дня хранится BLOB из двух частей по 96 15-минутным интервалам:
+сначала по байту на интервал - код активности с наибольшим временем
+в интервале (0 - пусто), затем по два байта (big-endian) - это время
+в секундах. По времени выбирается лидер при укрупнении графика.
+Дни, затронутые завершенной активностью, пересчитываются из сырых
+активностей в той же транзакции, в которой она завершается.
+Текущая (открытая) активность в сетку не пишется и накладывается при чтении.
+"""
+
+import struct
+from datetime import datetime, timedelta
+from config import ACTIVITIES, DEFAULT_TIMEZONE
+from binning import bin_activities, BASE_SLOT_SECONDS
+from rollups import get_tz, split_by_local_day
+
+GRID_SLOTS = 86400 // BASE_SLOT_SECONDS  # 96 интервалов по 15 минут
+EMPTY_CODE = 0
+
+# Код активности в сетке (байт); порядок ACTIVITIES не меняется, новые - в конец
+ACTIVITY_CODES = {activity_type: code for code, activity_type in enumerate(ACTIVITIES, 1)}
+CODE_ACTIVITIES = {code: activity_type for activity_type, code in ACTIVITY_CODES.items()}
+
+_SECONDS_FORMAT = f'>{GRID_SLOTS}H'  # Время лидеров интервалов
+
+EMPTY_GRID = bytes(GRID_SLOTS * 3)
+
+def day_bounds(local_day, tz):
+    """
+    Начало и конец локального дня (date) в секундах UTC.
+    """
+    start = tz.localize(datetime.combine(local_day, datetime.min.time()))
+    end = tz.localize(datetime.combine(local_day + timedelta(days=1), datetime.min.time()))
+    return int(start.timestamp()), int(end.timestamp())
+
+def encode_day(day_stats) -> bytes:
+    """
+    Интервалы дня [(activity_type, seconds), ...] -> BLOB сетки:
+    коды активностей, затем время лидеров интервалов.
+    """
+    codes = bytes(
+        ACTIVITY_CODES.get(activity_type, EMPTY_CODE) if seconds > 0 else EMPTY_CODE
+        for activity_type, seconds in day_stats
+    )
+    return codes + struct.pack(_SECONDS_FORMAT, *(max(seconds, 0) for _, seconds in day_stats))
+
+def load_day_activities(cursor, user_id, first_day, last_day, tz, now=None):
+    """
+    Активности, попадающие в дни first_day..last_day (date), и границы дней.
+    now - момент, до которого учитывается открытая активность
+    (None - только завершенные активности).
+    Возвращает (activities, day_starts) для grids_from_activities.
+    """
+    days = (last_day - first_day).days + 1
+    day_starts = [day_bounds(first_day + timedelta(days=i), tz)[0] for i in range(days)]
+    range_start = day_starts[0]
+    range_end = day_bounds(last_day, tz)[1]
+    day_starts.append(range_end)
+
+    # Активности идут одна за другой, поэтому до начала диапазона
+    # в него может заходить только одна - последняя начатая раньше
+    end_expr = 'end_time' if now is None else 'COALESCE(end_time, ?)'
+    params = () if now is None else (now,)
+    closed_only = 'AND end_time IS NOT NULL' if now is None else ''
+
+    cursor.execute(f'''
+        SELECT activity_type, start_time, {end_expr} - start_time
+        FROM activities
+        WHERE user_id = ? AND start_time >= ? AND start_time < ? {closed_only}
+        UNION ALL
+        SELECT * FROM (
+            SELECT activity_type, start_time, {end_expr} - start_time
+            FROM activities
+            WHERE user_id = ? AND start_time < ? {closed_only}
+            ORDER BY start_time DESC
+            LIMIT 1
+        )
+    ''', params + (user_id, range_start, range_end) + params + (user_id, range_start))
+
+    activities = [row for row in cursor.fetchall() if row[2] is not None and row[2] > 0]
+    return activities, day_starts
+
+def grids_from_activities(activities, day_starts):
+    """
+    Сетки дней (список BLOB) из активностей (activity_type, start_time, duration).
+    """
+    return [encode_day(day_stats) for day_stats in bin_activities(activities, day_starts, BASE_SLOT_SECONDS)]
+
+def build_day_grids(cursor, user_id, first_day, last_day, tz, now=None):
+    """
+    Сетки дней first_day..last_day (date) из сырых активностей.
+    now - момент, до которого учитывается открытая активность
+    (None - только завершенные активности).
+    Возвращает список BLOB по дням.
+    """
+    return grids_from_activities(*load_day_activities(cursor, user_id, first_day, last_day, tz, now))
+
+def update_day_grids(cursor, user_id, start_time, end_time, tz):
+    """
+    Пересчет сеток дней, затронутых завершенной активностью [start_time, end_time).
+    Вызывается внутри транзакции, которая завершает активность.
+    """
+    local_days = [local_day for local_day, _ in split_by_local_day(start_time, end_time, tz)]
+    if not local_days:
+        return
+
+    first_day = datetime.strptime(local_days[0], '%Y-%m-%d').date()
+    last_day = datetime.strptime(local_days[-1], '%Y-%m-%d').date()
+    grids = build_day_grids(cursor, user_id, first_day, last_day, tz)
+
+    cursor.executemany('''
+        INSERT OR REPLACE INTO day_grid (user_id, local_day, slots)
+        VALUES (?, ?, ?)
+    ''', [(user_id, (first_day + timedelta(days=i)).isoformat(), grid)
+          for i, grid in enumerate(grids)])
+
+def rebuild_day_grids(cursor, user_id=None):
+    """
+    Пересчет сеток из сырых активностей (всех пользователей или одного).
+    Сохраняются только дни, в которых есть активность.
+    Возвращает количество сохраненных дней.
+    """
+    if user_id is None:
+        cursor.execute('DELETE FROM day_grid')
+        cursor.execute('SELECT user_id, timezone FROM users')
+    else:
+        cursor.execute('DELETE FROM day_grid WHERE user_id = ?', (user_id,))
+        cursor.execute('SELECT user_id, timezone FROM users WHERE user_id = ?', (user_id,))
+
+    timezones = {uid: get_tz(timezone) for uid, timezone in cursor.fetchall()}
+    default_tz = get_tz(DEFAULT_TIMEZONE)
+
+    if user_id is None:
+        cursor.execute('''
+            SELECT user_id, MIN(start_time), MAX(end_time)
+            FROM activities
+            WHERE end_time IS NOT NULL
+            GROUP BY user_id
+        ''')
+    else:
+        cursor.execute('''
+            SELECT user_id, MIN(start_time), MAX(end_time)
+            FROM activities
+            WHERE user_id = ? AND end_time IS NOT NULL
+            GROUP BY user_id
+        ''', (user_id,))
+
+    saved = 0
+    for uid, first_start, last_end in cursor.fetchall():
+        tz = timezones.get(uid, default_tz)
+        first_day = datetime.fromtimestamp(first_start, tz).date()
+        last_day = datetime.fromtimestamp(max(first_start, last_end - 1), tz).date()
+        grids = build_day_grids(cursor, uid, first_day, last_day, tz)
+
+        rows = [(uid, (first_day + timedelta(days=i)).isoformat(), grid)
+                for i, grid in enumerate(grids) if grid != EMPTY_GRID]
+        cursor.executemany('''
+            INSERT INTO day_grid (user_id, local_day, slots)
+            VALUES (?, ?, ?)
+        ''', rows)
+        saved += len(rows)
+
+    return saved
+
+def overlay_open_activity(grid: bytes, activity_type, day_start, open_start, now) -> bytes:
+    """
+    Наложение открытой активности на сетку дня, начавшегося в day_start,
+    если активность началась не позже начала дня: все интервалы до текущего
+    целиком принадлежат ей (завершенных активностей после ее начала нет).
+    """
+    if open_start > day_start or now <= day_start:
+        return grid
+
+    last_slot = min(GRID_SLOTS - 1, (now - 1 - day_start) // BASE_SLOT_SECONDS)
+    code = ACTIVITY_CODES.get(activity_type, EMPTY_CODE)
+    seconds = list(struct.unpack(_SECONDS_FORMAT, grid[GRID_SLOTS:]))
+    seconds[:last_slot] = [BASE_SLOT_SECONDS] * last_slot
+    seconds[last_slot] = min(BASE_SLOT_SECONDS, now - day_start - last_slot * BASE_SLOT_SECONDS)
+    codes = bytes([code]) * (last_slot + 1) + grid[last_slot + 1:GRID_SLOTS]
+    return codes + struct.pack(_SECONDS_FORMAT, *seconds)
+
+def slot_factor(slot_seconds: int) -> int:
+    """
+    Во сколько раз интервал графика slot_seconds крупнее интервала сетки.
+    Интервал должен быть кратен 15 минутам и делить сутки.
+    """
+    if slot_seconds <= 0 or slot_seconds % BASE_SLOT_SECONDS or 86400 % slot_seconds:
+        raise ValueError(f"Недопустимая ширина интервала: {slot_seconds}")
+    return slot_seconds // BASE_SLOT_SECONDS
+
+def downsample_grid(grid: bytes, factor: int) -> bytes:
+    """
+    Коды активностей для графика с интервалом в factor раз крупнее сетки.
+    В каждой группе из factor интервалов время лидеров суммируется по кодам
+    и остается код с наибольшей суммой (пустые не считаются, при равенстве -
+    встретившийся раньше). Доли активностей, не ставших лидером своего
+    15-минутного интервала (короче половины интервала), в сумму не входят.
+    """
+    codes = grid[:GRID_SLOTS]
+    if factor == 1 or grid == EMPTY_GRID:
+        return codes[::factor]
+
+    seconds = struct.unpack(_SECONDS_FORMAT, grid[GRID_SLOTS:])
+    result = bytearray(GRID_SLOTS // factor)
+    for group, offset in enumerate(range(0, GRID_SLOTS, factor)):
+        totals = {}
+        for code, slot_seconds in zip(codes[offset:offset + factor], seconds[offset:offset + factor]):
+            if code != EMPTY_CODE:
+                totals[code] = totals.get(code, 0) + slot_seconds
+        if totals:
+            result[group] = max(totals, key=totals.get)
+
+    return bytes(result)
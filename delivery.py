@@ -0,0 +1,203 @@
+"""
+Отправка сообщений с ограничением скорости.
+Общий лимит сообщений в секунду (token bucket), минимальный интервал между
+сообщениями в один чат и ограничение числа одновременных запросов.
+Ответ Telegram 429 (TelegramRetryAfter) приостанавливает все отправки
+на указанное время, после чего сообщение отправляется повторно.
+Временные ошибки (сеть, 5xx) повторяются с экспоненциальной задержкой,
+постоянные (бот заблокирован, чат не найден) не повторяются.
+Рассылка напоминаний отправляет каждое сообщение один раз (retry=False),
+а сообщения с итогом RETRY повторяет отдельной задачей, чтобы медленный
+чат не задерживал запись результатов всей пачки.
+"""
+
+import asyncio
+import time
+from aiogram.exceptions import (
+    TelegramRetryAfter,
+    TelegramForbiddenError,
+    TelegramBadRequest,
+    TelegramNotFound,
+    TelegramNetworkError,
+    TelegramServerError
+)
+
+# Итоги отправки
+SENT = 'sent'
+PERMANENT = 'permanent'  # Писать пользователю больше нельзя (заблокировал бота, удален)
+FAILED = 'failed'  # Повторы исчерпаны или неизвестная ошибка
+RETRY = 'retry'  # 429 или временная ошибка при отправке без повторов - можно повторить
+
+# Тексты ошибок 400, после которых писать в чат бессмысленно
+PERMANENT_BAD_REQUESTS = (
+    'chat not found',
+    'user is deactivated',
+    'peer_id_invalid',
+    'bot was blocked',
+)
+
+def classify_error(error: Exception) -> str:
+    """
+    Тип ошибки отправки: 'permanent', 'transient' или 'failed'.
+    """
+    if isinstance(error, (TelegramForbiddenError, TelegramNotFound)):
+        return 'permanent'
+    if isinstance(error, TelegramBadRequest):
+        message = str(error).lower()
+        if any(text in message for text in PERMANENT_BAD_REQUESTS):
+            return 'permanent'
+        return 'failed'
+    if isinstance(error, (TelegramNetworkError, TelegramServerError, asyncio.TimeoutError, OSError)):
+        return 'transient'
+    return 'failed'
+
+class TokenBucket:
+    """
+    Token bucket: rate токенов в секунду, не больше capacity в запасе.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def pause(self, seconds: float):
+        """
+        Приостановка выдачи токенов (после ответа 429).
+        """
+        now = time.monotonic()
+        self._refill(now)
+        self._tokens = 0.0
+        self._paused_until = max(self._paused_until, now + seconds)
+
+    async def acquire(self):
+        """
+        Ожидание и получение одного токена.
+        """
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+
+            self._refill(now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class RateLimitedSender:
+    """
+    Пул отправки: не больше concurrency запросов одновременно,
+    не больше rate сообщений в секунду всего и не чаще одного сообщения
+    в chat_interval секунд в один чат.
+    """
+
+    def __init__(self, rate: float, chat_interval: float, concurrency: int,
+                 max_retries: int = 3, backoff_base: float = 1.0, backoff_max: float = 60.0):
+        self.bucket = TokenBucket(rate)
+        self.chat_interval = chat_interval
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.concurrency = concurrency
+        self._semaphore = None  # Создается при первой отправке, внутри работающего цикла событий
+        self._chat_next = {}  # chat_id -> время (monotonic), раньше которого писать в чат нельзя
+        self.counters = {
+            'sent': 0,
+            'rate_limited': 0,  # Ответы 429
+            'transient_retries': 0,  # Повторы после временных ошибок
+            'permanent': 0,
+            'failed': 0
+        }
+
+    async def _wait_chat(self, chat_id: int):
+        """
+        Резервирование ближайшего разрешенного времени отправки в чат.
+        """
+        now = time.monotonic()
+        send_at = max(now, self._chat_next.get(chat_id, 0.0))
+        self._chat_next[chat_id] = send_at + self.chat_interval
+
+        # Удаляем чаты, ограничение которых уже истекло
+        if len(self._chat_next) > 10000:
+            self._chat_next = {
+                chat: next_time for chat, next_time in self._chat_next.items() if next_time > now
+            }
+
+        if send_at > now:
+            await asyncio.sleep(send_at - now)
+
+    async def send(self, chat_id: int, send_func, retry: bool = True):
+        """
+        Отправка сообщения: send_func - функция без аргументов, возвращающая
+        корутину запроса (вызывается заново при повторе).
+        Возвращает (итог, текст ошибки, число попыток), итог - SENT, PERMANENT или FAILED.
+        Ответ 429 повторяется после retry_after, временные ошибки - с задержкой
+        backoff_base * 2**n (слот пула на время ожидания освобождается).
+        retry=False - одна попытка: после 429 или временной ошибки сразу
+        возвращается RETRY (пауза после 429 все равно действует на все отправки).
+        """
+        attempts = 0
+        rate_limited = 0
+        transient_failures = 0
+        last_error = None
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        while True:
+            attempts += 1
+            async with self._semaphore:
+                await self._wait_chat(chat_id)
+                await self.bucket.acquire()
+
+                try:
+                    await send_func()
+                    self.counters['sent'] += 1
+                    return SENT, None, attempts
+                except TelegramRetryAfter as e:
+                    print(f"⚠️ Лимит Telegram, пауза {e.retry_after} сек (чат {chat_id})")
+                    self.bucket.pause(e.retry_after)
+                    self.counters['rate_limited'] += 1
+                    last_error = e
+                    if not retry:
+                        return RETRY, str(e), attempts
+                    if rate_limited >= self.max_retries:
+                        break
+                    rate_limited += 1
+                    continue
+                except Exception as e:
+                    last_error = e
+                    kind = classify_error(e)
+
+            if kind == 'permanent':
+                self.counters['permanent'] += 1
+                return PERMANENT, str(last_error), attempts
+            if kind != 'transient' or transient_failures >= self.max_retries:
+                break
+            if not retry:
+                self.counters['transient_retries'] += 1
+                return RETRY, str(last_error), attempts
+
+            delay = min(self.backoff_max, self.backoff_base * 2 ** transient_failures)
+            transient_failures += 1
+            self.counters['transient_retries'] += 1
+            await asyncio.sleep(delay)
+
+        self.counters['failed'] += 1
+        return FAILED, str(last_error), attempts
+
+    def stats(self) -> dict:
+        """
+        Счетчики итогов отправки.
+        """
+        return dict(self.counters)
@@ -3,6 +3,7 @@
 """
 
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+from config import TIMELINE_RESOLUTIONS
 from timezone_manager import timezone_manager
 
 def get_main_keyboard():
@@ -22,12 +23,13 @@ def get_main_keyboard():
 
 def get_statistics_keyboard():
     """
-    Клавиатура статистики.
+    Клавиатура статистики (с выбором разрешения графика).
     """
     keyboard = ReplyKeyboardMarkup(
         keyboard=[
             [KeyboardButton(text="📊 Статистика"), KeyboardButton(text="📅 Неделя")],
             [KeyboardButton(text="📅 Месяц"), KeyboardButton(text="📊 Год")],
+            [KeyboardButton(text=text) for text in TIMELINE_RESOLUTIONS],
             [KeyboardButton(text="⬅️ Назад")]
         ],
         resize_keyboard=True
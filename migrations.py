@@ -0,0 +1,371 @@
+"""
+Версионированные миграции схемы базы данных.
+Номер последней примененной миграции хранится в таблице schema_version.
+Каждая миграция выполняется в отдельной транзакции и повторно не запускается.
+"""
+
+import sqlite3
+import struct
+from datetime import datetime, timedelta
+import pytz
+
+# Шаги миграций не вызывают рабочие модули (rollups, quiet_windows, day_grid):
+# те читают текущую схему и меняются вместе с ней, а миграция должна одинаково
+# работать на базе любой старой версии. Поэтому логика заполнения таблиц
+# заморожена здесь в том виде, в каком она была на момент своей миграции.
+
+_DEFAULT_TIMEZONE = 'Europe/Moscow'
+_GRID_SLOT_SECONDS = 900  # Сетка day_grid: 96 интервалов по 15 минут
+_GRID_SLOTS = 86400 // _GRID_SLOT_SECONDS
+_GRID_CODES = {'work': 1, 'study': 2, 'sport': 3, 'hobby': 4, 'sleep': 5, 'rest': 6}
+
+def _tz(timezone_str):
+    """
+    Часовой пояс pytz (при ошибке - часовой пояс по умолчанию).
+    """
+    try:
+        return pytz.timezone(timezone_str)
+    except Exception:
+        return pytz.timezone(_DEFAULT_TIMEZONE)
+
+def _user_timezones(cursor):
+    """
+    user_id -> часовой пояс pytz для всех пользователей.
+    """
+    cursor.execute('SELECT user_id, timezone FROM users')
+    return {user_id: _tz(timezone) for user_id, timezone in cursor.fetchall()}
+
+def _local_day_pieces(start_time, end_time, tz):
+    """
+    Разбиение интервала [start_time, end_time) в секундах UTC по локальным дням.
+    Возвращает список (day, day_start, next_day_start, piece_start, piece_end).
+    """
+    pieces = []
+    current = start_time
+
+    while current < end_time:
+        day = datetime.fromtimestamp(current, tz).date()
+        day_start = int(tz.localize(datetime.combine(day, datetime.min.time())).timestamp())
+        next_day_start = int(tz.localize(datetime.combine(day + timedelta(days=1), datetime.min.time())).timestamp())
+        piece_end = min(next_day_start, end_time)
+        pieces.append((day, day_start, next_day_start, current, piece_end))
+        current = piece_end
+
+    return pieces
+
+def _backfill_rollups(cursor, user_ids=None):
+    """
+    Заполнение daily_rollup (схема миграции 3) из завершенных активностей
+    всех пользователей или только перечисленных.
+    """
+    timezones = _user_timezones(cursor)
+    default_tz = _tz(_DEFAULT_TIMEZONE)
+
+    if user_ids is None:
+        cursor.execute('DELETE FROM daily_rollup')
+        cursor.execute('''
+            SELECT user_id, activity_type, start_time, end_time
+            FROM activities
+            WHERE end_time IS NOT NULL
+        ''')
+        rows = cursor.fetchall()
+    else:
+        rows = []
+        for user_id in user_ids:
+            cursor.execute('DELETE FROM daily_rollup WHERE user_id = ?', (user_id,))
+            cursor.execute('''
+                SELECT user_id, activity_type, start_time, end_time
+                FROM activities
+                WHERE user_id = ? AND end_time IS NOT NULL
+            ''', (user_id,))
+            rows.extend(cursor.fetchall())
+
+    totals = {}
+    for user_id, activity_type, start_time, end_time in rows:
+        tz = timezones.get(user_id, default_tz)
+        for day, _, _, piece_start, piece_end in _local_day_pieces(start_time, end_time, tz):
+            key = (user_id, day.isoformat(), activity_type)
+            totals[key] = totals.get(key, 0) + piece_end - piece_start
+
+    cursor.executemany('''
+        INSERT INTO daily_rollup (user_id, local_day, activity_type, seconds)
+        VALUES (?, ?, ?, ?)
+    ''', [key + (seconds,) for key, seconds in totals.items()])
+
+def _quiet_minutes(time_str):
+    """
+    Минуты от начала суток для строки 'ЧЧ:ММ' (0 при ошибке формата).
+    """
+    try:
+        h, m = map(int, time_str.split(':'))
+        return h * 60 + m
+    except (AttributeError, ValueError):
+        return 0
+
+def _backfill_quiet_windows(cursor):
+    """
+    Заполнение окон тихого времени в минутах суток UTC (схема миграции 7)
+    по текущему смещению часового пояса каждого пользователя.
+    """
+    now = datetime.now(pytz.utc)
+    cursor.execute('''
+        SELECT us.user_id, u.timezone, us.quiet_time_start, us.quiet_time_end
+        FROM users u
+        JOIN user_settings us ON us.user_id = u.user_id
+    ''')
+
+    offsets = {}
+    updates = []
+    for user_id, timezone, quiet_start, quiet_end in cursor.fetchall():
+        if timezone not in offsets:
+            offsets[timezone] = int(now.astimezone(_tz(timezone)).utcoffset().total_seconds() // 60)
+        offset = offsets[timezone]
+        updates.append((
+            (_quiet_minutes(quiet_start) - offset) % 1440,
+            (_quiet_minutes(quiet_end) - offset) % 1440,
+            offset,
+            user_id
+        ))
+
+    cursor.executemany('''
+        UPDATE user_settings
+        SET quiet_utc_start = ?, quiet_utc_end = ?, quiet_utc_offset = ?
+        WHERE user_id = ?
+    ''', updates)
+
+def _backfill_day_grids(cursor):
+    """
+    Заполнение day_grid (схема миграции 9) из завершенных активностей.
+    В каждом 15-минутном интервале - код активности с наибольшим временем
+    внутри интервала (при равенстве - более ранней), 0 - пусто; последний
+    интервал дня доходит до полуночи. BLOB - 96 кодов, затем 96 значений
+    этого времени по два байта (big-endian). Сохраняются только непустые дни.
+    """
+    timezones = _user_timezones(cursor)
+    default_tz = _tz(_DEFAULT_TIMEZONE)
+
+    cursor.execute('DELETE FROM day_grid')
+    cursor.execute('SELECT DISTINCT user_id FROM activities WHERE end_time IS NOT NULL')
+    user_ids = [user_id for (user_id,) in cursor.fetchall()]
+
+    for user_id in user_ids:
+        tz = timezones.get(user_id, default_tz)
+        cursor.execute('''
+            SELECT activity_type, start_time, end_time
+            FROM activities
+            WHERE user_id = ? AND end_time IS NOT NULL AND end_time > start_time
+            ORDER BY start_time
+        ''', (user_id,))
+
+        days = {}  # день -> (коды, секунды лидера) по интервалам
+        for activity_type, start_time, end_time in cursor.fetchall():
+            code = _GRID_CODES.get(activity_type, 0)
+            for day, day_start, next_day_start, position, piece_end in _local_day_pieces(start_time, end_time, tz):
+                codes, best = days.setdefault(day, ([0] * _GRID_SLOTS, [0] * _GRID_SLOTS))
+                while position < piece_end:
+                    slot = min((position - day_start) // _GRID_SLOT_SECONDS, _GRID_SLOTS - 1)
+                    if slot == _GRID_SLOTS - 1:
+                        slot_end = next_day_start
+                    else:
+                        slot_end = day_start + (slot + 1) * _GRID_SLOT_SECONDS
+                    step_end = min(piece_end, slot_end)
+                    if step_end - position > best[slot]:
+                        best[slot] = step_end - position
+                        codes[slot] = code
+                    position = step_end
+
+        cursor.executemany('''
+            INSERT INTO day_grid (user_id, local_day, slots)
+            VALUES (?, ?, ?)
+        ''', [(user_id, day.isoformat(), bytes(codes) + struct.pack(f'>{_GRID_SLOTS}H', *best))
+              for day, (codes, best) in sorted(days.items()) if any(codes)])
+
+def _backfill_open_activity(cursor):
+    """
+    Заполнение open_activity из незавершенных активностей.
+    Если у пользователя несколько открытых записей, текущей остается последняя,
+    а остальные закрываются моментом ее начала.
+    """
+    cursor.execute('''
+        SELECT id, user_id, activity_type, start_time
+        FROM activities
+        WHERE end_time IS NULL
+        ORDER BY user_id, id
+    ''')
+
+    latest = {}
+    stale = []
+    for activity_id, user_id, activity_type, start_time in cursor.fetchall():
+        if user_id in latest:
+            stale.append((latest[user_id], user_id))
+        latest[user_id] = (activity_id, activity_type, start_time)
+
+    for (activity_id, _, start_time), user_id in stale:
+        end_time = max(start_time, latest[user_id][2])
+        cursor.execute('''
+            UPDATE activities
+            SET end_time = ?, duration_seconds = ?
+            WHERE id = ?
+        ''', (end_time, end_time - start_time, activity_id))
+
+    _backfill_rollups(cursor, {user_id for _, user_id in stale})
+
+    cursor.executemany('''
+        INSERT INTO open_activity (user_id, activity_id, activity_type, start_time)
+        VALUES (?, ?, ?, ?)
+    ''', [(user_id,) + row for user_id, row in latest.items()])
+
+# Список миграций: (версия, описание, шаги).
+# Шаг - SQL-строка или функция, принимающая курсор.
+# Версии только растут; уже выпущенные миграции не изменяются.
+MIGRATIONS = [
+    (1, 'Индекс активностей по пользователю и времени начала', [
+        '''
+        CREATE INDEX IF NOT EXISTS idx_activities_user_start
+        ON activities (user_id, start_time)
+        ''',
+    ]),
+    # Старые записи хранили локальное время сервера строкой ISO.
+    # Модификатор 'utc' переводит локальное время в UTC так же, как datetime.timestamp()
+    (2, 'Время активностей и напоминаний в секундах UTC', [
+        '''
+        UPDATE activities
+        SET start_time = CAST(strftime('%s', start_time, 'utc') AS INTEGER)
+        WHERE typeof(start_time) = 'text'
+        ''',
+        '''
+        UPDATE activities
+        SET end_time = CAST(strftime('%s', end_time, 'utc') AS INTEGER)
+        WHERE typeof(end_time) = 'text'
+        ''',
+        '''
+        UPDATE users
+        SET last_reminder = CAST(strftime('%s', last_reminder, 'utc') AS INTEGER)
+        WHERE typeof(last_reminder) = 'text'
+        ''',
+    ]),
+    (3, 'Дневные итоги активностей daily_rollup', [
+        '''
+        CREATE TABLE IF NOT EXISTS daily_rollup (
+            user_id INTEGER NOT NULL,
+            local_day TEXT NOT NULL,
+            activity_type TEXT NOT NULL,
+            seconds INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, local_day, activity_type)
+        ) WITHOUT ROWID
+        ''',
+        _backfill_rollups,
+    ]),
+    (4, 'Таблица текущих активностей open_activity', [
+        '''
+        CREATE TABLE IF NOT EXISTS open_activity (
+            user_id INTEGER PRIMARY KEY,
+            activity_id INTEGER NOT NULL,
+            activity_type TEXT NOT NULL,
+            start_time INTEGER NOT NULL
+        )
+        ''',
+        _backfill_open_activity,
+    ]),
+    (5, 'Время следующего напоминания users.next_reminder_at', [
+        'ALTER TABLE users ADD COLUMN next_reminder_at INTEGER',
+    ]),
+    (6, 'Журнал недоставленных напоминаний dead_letter', [
+        '''
+        CREATE TABLE IF NOT EXISTS dead_letter (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            reason TEXT NOT NULL,
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 1,
+            created_at INTEGER NOT NULL
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_dead_letter_user
+        ON dead_letter (user_id, created_at)
+        ''',
+    ]),
+    (7, 'Тихое время в минутах UTC', [
+        'ALTER TABLE user_settings ADD COLUMN quiet_utc_start INTEGER',
+        'ALTER TABLE user_settings ADD COLUMN quiet_utc_end INTEGER',
+        'ALTER TABLE user_settings ADD COLUMN quiet_utc_offset INTEGER',
+        _backfill_quiet_windows,
+    ]),
+    (8, 'Разрешение графика активности в настройках', [
+        'ALTER TABLE user_settings ADD COLUMN timeline_resolution INTEGER',
+    ]),
+    (9, 'Сетки активности по дням day_grid', [
+        '''
+        CREATE TABLE IF NOT EXISTS day_grid (
+            user_id INTEGER NOT NULL,
+            local_day TEXT NOT NULL,
+            slots BLOB NOT NULL,
+            PRIMARY KEY (user_id, local_day)
+        ) WITHOUT ROWID
+        ''',
+        _backfill_day_grids,
+    ]),
+]
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """
+    Текущая версия схемы (0 - миграции еще не применялись).
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP
+        )
+    ''')
+    result = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return result[0] or 0
+
+def run_migrations(conn: sqlite3.Connection) -> int:
+    """
+    Применение всех миграций новее текущей версии схемы.
+    Возвращает итоговую версию схемы.
+    """
+    if conn.in_transaction:
+        conn.commit()
+
+    current_version = get_schema_version(conn)
+
+    for version, description, steps in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version <= current_version:
+            continue
+
+        cursor = conn.cursor()
+        # IMMEDIATE сразу берет блокировку записи, чтобы два процесса
+        # не применили одну и ту же миграцию одновременно
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            # Версию проверяем повторно уже под блокировкой
+            applied = cursor.execute(
+                'SELECT 1 FROM schema_version WHERE version = ?', (version,)
+            ).fetchone()
+
+            if not applied:
+                for step in steps:
+                    if callable(step):
+                        step(cursor)
+                    else:
+                        cursor.execute(step)
+
+                cursor.execute('''
+                    INSERT INTO schema_version (version, description, applied_at)
+                    VALUES (?, ?, ?)
+                ''', (version, description, datetime.now().isoformat()))
+
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ Ошибка миграции {version} ({description}): {e}")
+            raise
+
+        if not applied:
+            print(f"✅ Миграция {version}: {description}")
+        current_version = version
+
+    return current_version
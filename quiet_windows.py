@@ -0,0 +1,99 @@
+"""
+Тихое время пользователей в минутах суток UTC.
+Локальное окно 'ЧЧ:ММ'-'ЧЧ:ММ' переводится в UTC по текущему смещению
+часового пояса и хранится в user_settings (quiet_utc_start, quiet_utc_end,
+quiet_utc_offset). ReminderManager в момент срабатывания сравнивает с окном
+текущую минуту UTC (одно целочисленное сравнение, без разбора строк и
+перевода во время пользователя).
+Окно пересчитывается при изменении часового пояса или границ тихого
+времени, а также при переходе на летнее/зимнее время.
+"""
+
+from datetime import datetime
+import pytz
+from rollups import get_tz
+
+MINUTES_PER_DAY = 24 * 60
+
+def time_to_minutes(time_str):
+    """
+    Минуты от начала суток для строки 'ЧЧ:ММ' (0 при ошибке формата).
+    """
+    try:
+        h, m = map(int, time_str.split(':'))
+        return h * 60 + m
+    except (AttributeError, ValueError):
+        return 0
+
+def utc_offset_minutes(tz, at: datetime = None) -> int:
+    """
+    Смещение часового пояса от UTC в минутах на момент at (по умолчанию сейчас).
+    """
+    at = at or datetime.now(pytz.utc)
+    return int(at.astimezone(tz).utcoffset().total_seconds() // 60)
+
+def quiet_utc_window(quiet_start, quiet_end, offset_minutes: int):
+    """
+    Границы тихого времени в минутах суток UTC: (start, end).
+    """
+    return (
+        (time_to_minutes(quiet_start) - offset_minutes) % MINUTES_PER_DAY,
+        (time_to_minutes(quiet_end) - offset_minutes) % MINUTES_PER_DAY
+    )
+
+def update_quiet_window(cursor, user_id, at: datetime = None):
+    """
+    Пересчет окна тихого времени пользователя (внутри транзакции вызывающего).
+    """
+    cursor.execute('''
+        SELECT u.timezone, us.quiet_time_start, us.quiet_time_end
+        FROM users u
+        JOIN user_settings us ON us.user_id = u.user_id
+        WHERE u.user_id = ?
+    ''', (user_id,))
+    row = cursor.fetchone()
+    if not row:
+        return
+
+    timezone, quiet_start, quiet_end = row
+    offset = utc_offset_minutes(get_tz(timezone), at)
+    utc_start, utc_end = quiet_utc_window(quiet_start, quiet_end, offset)
+
+    cursor.execute('''
+        UPDATE user_settings
+        SET quiet_utc_start = ?, quiet_utc_end = ?, quiet_utc_offset = ?
+        WHERE user_id = ?
+    ''', (utc_start, utc_end, offset, user_id))
+
+def refresh_quiet_windows(cursor, at: datetime = None) -> list:
+    """
+    Пересчет окон у пользователей, чье смещение часового пояса изменилось
+    (переход на летнее/зимнее время) или еще не вычислялось.
+    Смещение считается один раз на часовой пояс.
+    Возвращает список user_id с обновленным окном.
+    """
+    cursor.execute('SELECT DISTINCT timezone FROM users')
+    offsets = {timezone: utc_offset_minutes(get_tz(timezone), at)
+               for (timezone,) in cursor.fetchall()}
+
+    updates = []
+    for timezone, offset in offsets.items():
+        cursor.execute('''
+            SELECT us.user_id, us.quiet_time_start, us.quiet_time_end
+            FROM users u
+            JOIN user_settings us ON us.user_id = u.user_id
+            WHERE u.timezone IS ?
+              AND (us.quiet_utc_offset IS NULL OR us.quiet_utc_offset != ?)
+        ''', (timezone, offset))
+
+        for user_id, quiet_start, quiet_end in cursor.fetchall():
+            utc_start, utc_end = quiet_utc_window(quiet_start, quiet_end, offset)
+            updates.append((utc_start, utc_end, offset, user_id))
+
+    cursor.executemany('''
+        UPDATE user_settings
+        SET quiet_utc_start = ?, quiet_utc_end = ?, quiet_utc_offset = ?
+        WHERE user_id = ?
+    ''', updates)
+
+    return [user_id for _, _, _, user_id in updates]
@@ -0,0 +1,27 @@
+"""
+Пересчет дневных итогов (daily_rollup) и сеток дней (day_grid) из сырых активностей.
+Используется после сбоя или изменения схемы.
+
+Запуск:
+    python rebuild_rollups.py            # все пользователи
+    python rebuild_rollups.py <user_id>  # один пользователь
+"""
+
+import sys
+import os
+
+# Добавляем путь
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import init_db, rebuild_daily_rollup, close_db
+
+if __name__ == "__main__":
+    user_id = int(sys.argv[1]) if len(sys.argv) > 1 else None
+
+    init_db()
+    try:
+        processed = rebuild_daily_rollup(user_id)
+        target = f"пользователя {user_id}" if user_id is not None else "всех пользователей"
+        print(f"✅ Дневные итоги и сетки пересчитаны для {target}: {processed} активностей")
+    finally:
+        close_db()
@@ -4,26 +4,86 @@
 """
 
 import asyncio
+import math
+import time
 from datetime import datetime, timedelta
 import pytz
 from aiogram import Bot
 from database import (
-    get_users_for_reminders,
-    update_last_reminder_time,
+    update_last_reminder_times,
+    record_delivery_failures,
+    get_reminder_payloads,
     get_current_activity,
-    get_user_settings,
-    get_user_timezone
+    get_reminder_subscriptions,
+    get_reminder_subscription,
+    save_next_reminder_times,
+    refresh_all_quiet_windows
+)
+from async_database import run_db
+from config import (
+    ACTIVITIES,
+    REMINDER_SCHEDULER,
+    REMINDER_RATE_LIMIT,
+    REMINDER_CHAT_INTERVAL,
+    REMINDER_SEND_CONCURRENCY,
+    REMINDER_SEND_RETRIES,
+    REMINDER_RETRY_BACKOFF,
+    REMINDER_RETRY_BACKOFF_MAX,
+    REMINDER_FLUSH_INTERVAL,
+    REMINDER_CATCHUP_GRACE,
+    REMINDER_FALLBACK_DELAY,
+    QUIET_WINDOW_CHECK_INTERVAL,
+    REMINDER_JITTER_WINDOW
 )
-from config import ACTIVITIES
 from utils import get_activity_emoji
 from keyboards import get_reminder_buttons_keyboard
+from scheduler import create_scheduler, stable_jitter
+from delivery import RateLimitedSender, SENT, PERMANENT, RETRY
+from quiet_windows import MINUTES_PER_DAY
+
+def is_quiet_minute(current_minutes: int, start_minutes: int, end_minutes: int) -> bool:
+    """
+    Попадает ли минута суток в тихое время [start, end).
+    """
+    if start_minutes > end_minutes:
+        # Ночное время (например, 22:00-06:00)
+        return current_minutes >= start_minutes or current_minutes < end_minutes
+    # Дневное время
+    return start_minutes <= current_minutes < end_minutes
 
 class ReminderManager:
-    def __init__(self, bot: Bot):
+    def __init__(self, bot: Bot, clock=None, sender: RateLimitedSender = None, on_due=None):
+        """
+        clock - функция текущего времени (UTC epoch), по умолчанию time.time;
+        в моделировании подставляются виртуальные часы, а вместо Bot - заглушка.
+        on_due - функция (user_id, запланированное время), вызываемая для каждого
+        наступившего напоминания (моделирование считает по ней опоздание).
+        """
         self.bot = bot
+        self.clock = clock or time.time
+        self.on_due = on_due
         self.is_running = False
         self.task = None
-        self.user_next_reminder_time = {}  # Словарь для хранения времени следующего напоминания
+        self.scheduler = create_scheduler(REMINDER_SCHEDULER, self.clock())  # Время следующего напоминания (UTC epoch) по пользователям
+        self.subscriptions = {}  # user_id -> настройки напоминаний пользователя
+        self._wakeup = None  # Будит цикл при изменении расписания (создается в start, внутри цикла событий)
+        self.sender = sender or RateLimitedSender(
+            REMINDER_RATE_LIMIT,
+            REMINDER_CHAT_INTERVAL,
+            REMINDER_SEND_CONCURRENCY,
+            REMINDER_SEND_RETRIES,
+            REMINDER_RETRY_BACKOFF,
+            REMINDER_RETRY_BACKOFF_MAX
+        )
+        self._delivery_tasks = set()  # Рассылки, которые еще выполняются
+        self._dirty = {}  # user_id -> время следующего напоминания, еще не записанное в базу
+        self._timezones = {}  # Название часового пояса -> объект pytz
+        self._next_quiet_check = 0.0  # Когда проверять смену смещений часовых поясов
+        self.jitter_window = REMINDER_JITTER_WINDOW
+        self._last_flush = self.clock()
+        self._schedule_loaded = False  # Расписание загружено из базы
+        self._next_load_attempt = 0.0  # Когда повторить неудавшуюся загрузку расписания
+        self._load_backoff = REMINDER_RETRY_BACKOFF
 
     async def start(self):
         """Запуск менеджера напоминаний."""
@@ -31,6 +91,7 @@ class ReminderManager:
             return
 
         self.is_running = True
+        self._wakeup = asyncio.Event()
         self.task = asyncio.create_task(self._reminder_loop())
         print("✅ Напоминания запущены (с поддержкой часовых поясов и привязкой к часам, включая тестовые 5 секунд)")
 
@@ -46,6 +107,12 @@ class ReminderManager:
                 await self.task
             except asyncio.CancelledError:
                 pass
+
+        for task in list(self._delivery_tasks):
+            task.cancel()
+        await self.wait_deliveries()
+
+        await self.flush_schedule()
         print("🛑 Напоминания остановлены")
 
     def _calculate_next_reminder_time(self, user_local_time: datetime, interval_seconds: int) -> datetime:
@@ -76,170 +143,483 @@ class ReminderManager:
 
         return next_reminder
 
-    async def _reminder_loop(self):
-        """Основной цикл напоминаний с учетом часовых поясов и привязкой к часам/секундам."""
-        while self.is_running:
+    def _get_tz(self, timezone_str: str):
+        """
+        Объект часового пояса (создается один раз на пояс).
+        """
+        tz = self._timezones.get(timezone_str)
+        if tz is None:
             try:
-                users_to_remind = get_users_for_reminders()
-
-                for user_id, first_name, interval, user_timezone in users_to_remind:
-                    try:
-                        # Получаем локальное время пользователя
-                        try:
-                            tz = pytz.timezone(user_timezone)
-                            user_local_time = datetime.now(tz)
-                        except:
-                            user_local_time = datetime.now()
-
-                        # Проверяем тихое время
-                        settings = get_user_settings(user_id)
-                        if settings and settings['quiet_time_enabled']:
-                            quiet_start = settings['quiet_time_start']
-                            quiet_end = settings['quiet_time_end']
-
-                            if self._is_in_quiet_time(user_local_time, quiet_start, quiet_end):
-                                continue
-
-                        # Проверяем, нужно ли отправлять напоминание
-                        cache_key = f"{user_id}_{interval}"
-
-                        if cache_key not in self.user_next_reminder_time:
-                            # Первое напоминание - рассчитываем время
-                            next_reminder = self._calculate_next_reminder_time(user_local_time, interval)
-                            self.user_next_reminder_time[cache_key] = next_reminder
-
-                            # Если текущее время уже близко к следующему напоминанию, отправляем сразу
-                            time_diff = (next_reminder - user_local_time).total_seconds()
-                            if time_diff < 1:  # Меньше секунды до следующего напоминания
-                                await self.send_reminder_with_buttons(user_id)
-                                # Для тестовых интервалов (5 секунд) используем простую логику
-                                if interval < 60:
-                                    self.user_next_reminder_time[cache_key] = user_local_time + timedelta(seconds=interval)
-                                else:
-                                    self.user_next_reminder_time[cache_key] = self._calculate_next_reminder_time(user_local_time, interval)
-                                update_last_reminder_time(user_id)
-                        else:
-                            next_reminder = self.user_next_reminder_time[cache_key]
-
-                            # Проверяем, настало ли время напоминания
-                            if user_local_time >= next_reminder:
-                                await self.send_reminder_with_buttons(user_id)
-                                # Обновляем время следующего напоминания
-                                if interval < 60:
-                                    # Для тестовых интервалов (5 секунд)
-                                    self.user_next_reminder_time[cache_key] = user_local_time + timedelta(seconds=interval)
-                                else:
-                                    # Для обычных интервалов
-                                    self.user_next_reminder_time[cache_key] = self._calculate_next_reminder_time(user_local_time, interval)
-                                update_last_reminder_time(user_id)
-
-                    except Exception as e:
-                        print(f"Ошибка обработки пользователя {user_id}: {e}")
-                        continue
-
-                # Очищаем старые записи из кэша
-                self._clean_old_cache_entries()
-
-                # Для тестовых интервалов проверяем чаще (каждую секунду)
-                # Для обычных интервалов можно проверять реже
-                has_short_intervals = any(interval < 60 for _, _, interval, _ in users_to_remind)
-                sleep_time = 1 if has_short_intervals else 30
-                await asyncio.sleep(sleep_time)
+                tz = pytz.timezone(timezone_str)
+            except Exception:
+                tz = pytz.utc
+            self._timezones[timezone_str] = tz
+        return tz
 
-            except asyncio.CancelledError:
-                break
-            except Exception as e:
-                print(f"Ошибка в цикле напоминаний: {e}")
-                await asyncio.sleep(5)
+    def _get_local_time(self, timezone_str: str, now: float) -> datetime:
+        """
+        Локальное время пользователя для момента now (UTC epoch).
+        """
+        return datetime.fromtimestamp(now, self._get_tz(timezone_str))
 
-    def _clean_old_cache_entries(self):
-        """Очистка старых записей из кэша времени напоминаний."""
-        current_time = datetime.now()
-        keys_to_remove = []
+    def _zone_time(self, zones: dict, timezone_str: str, now: float) -> datetime:
+        """
+        Локальное время часового пояса.
+        Считается один раз на пояс за тик: zones - словарь текущего тика.
+        """
+        local_time = zones.get(timezone_str)
+        if local_time is None:
+            local_time = self._get_local_time(timezone_str, now)
+            zones[timezone_str] = local_time
+        return local_time
+
+    def _schedule_next(self, user_id: int, subscription: dict, now: float, user_local_time: datetime = None):
+        """
+        Расчет и постановка в расписание следующего напоминания пользователя.
+        """
+        if user_local_time is None:
+            user_local_time = self._get_local_time(subscription['timezone'], now)
+        interval = subscription['reminder_interval']
+        next_reminder = self._calculate_next_reminder_time(user_local_time, interval)
+        due = next_reminder.timestamp()
+
+        # Привязанные к минутам интервалы срабатывают у всех в одну секунду -
+        # сдвигаем каждого пользователя на свое постоянное смещение внутри окна
+        if 60 <= interval <= 1800:
+            due += stable_jitter(user_id, self.jitter_window)
+        self.scheduler.schedule(user_id, due)
+        self._dirty[user_id] = math.ceil(due)
+
+    async def flush_schedule(self):
+        """
+        Пакетная запись изменившихся времен следующих напоминаний в базу.
+        """
+        self._last_flush = self.clock()
+        if not self._dirty:
+            return
+
+        items = list(self._dirty.items())
+        self._dirty = {}
+        try:
+            await run_db(save_next_reminder_times, items)
+        except Exception as e:
+            print(f"Ошибка сохранения расписания напоминаний: {e}")
+            # Возвращаем записи, которые не изменились за время попытки
+            for user_id, due in items:
+                self._dirty.setdefault(user_id, due)
 
-        for key, next_reminder_time in self.user_next_reminder_time.items():
-            # Если время напоминания прошло более чем сутки назад - удаляем
-            if (current_time - next_reminder_time).total_seconds() > 86400:
-                keys_to_remove.append(key)
+    async def load_schedule(self):
+        """
+        Загрузка подписок из базы и построение расписания (один раз при запуске).
+        Сохраненное время следующего напоминания восстанавливается как есть.
+        Если оно прошло, пока бот не работал: недавно пропущенное напоминание
+        отправляется сразу, а более старое переносится на следующий слот,
+        чтобы после перезапуска не было волны напоминаний.
+        """
+        subscriptions = await run_db(get_reminder_subscriptions)
+        now = self.clock()
+
+        self.scheduler.clear()
+        self.subscriptions = {}
+        zones = {}
+        restored = caught_up = skipped = 0
+        for subscription in subscriptions:
+            user_id = subscription['user_id']
+            self.subscriptions[user_id] = subscription
+            stored = subscription.pop('next_reminder_at', None)
+
+            if stored and stored > now - REMINDER_CATCHUP_GRACE:
+                self.scheduler.schedule(user_id, stored)
+                if stored > now:
+                    restored += 1
+                else:
+                    caught_up += 1
+            else:
+                if stored:
+                    skipped += 1
+                local_time = self._zone_time(zones, subscription['timezone'], now)
+                self._schedule_next(user_id, subscription, now, local_time)
 
-        for key in keys_to_remove:
-            del self.user_next_reminder_time[key]
+        self._schedule_loaded = True
+        print(f"✅ Расписание напоминаний: {len(self.subscriptions)} пользователей "
+              f"(восстановлено {restored}, догоняющих {caught_up}, перенесено {skipped})")
 
-    def _is_in_quiet_time(self, local_time, quiet_start, quiet_end):
+    async def on_settings_changed(self, user_id: int):
         """
-        Проверка, находится ли локальное время в тихом времени.
+        Перечитывание настроек пользователя и перенос его напоминания.
+        Вызывается после изменения интервала, тихого часа, часового пояса
+        или включения/выключения уведомлений.
         """
-        current_hour = local_time.hour
-        current_minute = local_time.minute
+        user_id = int(user_id)
+        subscription = await run_db(get_reminder_subscription, user_id)
 
-        def time_to_minutes(time_str):
-            try:
-                h, m = map(int, time_str.split(':'))
-                return h * 60 + m
-            except:
-                return 0
-
-        current_minutes = current_hour * 60 + current_minute
-        start_minutes = time_to_minutes(quiet_start)
-        end_minutes = time_to_minutes(quiet_end)
-
-        # Проверка попадания в тихое время
-        if start_minutes > end_minutes:
-            # Ночное время (например, 22:00-06:00)
-            if current_minutes >= start_minutes or current_minutes < end_minutes:
-                return True
+        if subscription:
+            self.subscriptions[user_id] = subscription
+            self._schedule_next(user_id, subscription, self.clock())
+            self._wake()
         else:
-            # Дневное время
-            if start_minutes <= current_minutes < end_minutes:
-                return True
+            self.cancel(user_id)
+
+    def reschedule(self, user_id: int) -> bool:
+        """
+        Пересчет времени следующего напоминания от текущего момента
+        по уже загруженным настройкам. Возвращает False, если у пользователя
+        нет активной подписки.
+        """
+        user_id = int(user_id)
+        subscription = self.subscriptions.get(user_id)
+        if not subscription:
+            return False
 
-        return False
+        self._schedule_next(user_id, subscription, self.clock())
+        self._wake()
+        return True
 
-    async def send_reminder_with_buttons(self, user_id: int):
+    def _wake(self):
         """
-        Отправка напоминания с кнопками выбора интервала.
+        Пробуждение цикла после изменения расписания (если цикл запущен).
+        """
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def cancel(self, user_id: int):
+        """
+        Отмена напоминаний пользователя.
+        """
+        user_id = int(user_id)
+        self.subscriptions.pop(user_id, None)
+        self.scheduler.cancel(user_id)
+        self._dirty[user_id] = None
+        self._wake()
+
+    def _schedule_fallback(self, user_id: int, subscription: dict, now: float):
+        """
+        Перепланирование после ошибки обработки пользователя. Если и расчет
+        следующего времени не удался (например, испорчены настройки),
+        напоминание переносится на REMINDER_FALLBACK_DELAY секунд, чтобы
+        пользователь не выпал из расписания, а остальные в тике обработались.
         """
         try:
-            current_activity = get_current_activity(user_id)
-
-            if current_activity:
-                # Получаем название активности
-                activity_type, start_time = current_activity
-                activity_name = ACTIVITIES.get(activity_type, activity_type)
-                emoji = get_activity_emoji(activity_type)
-
-                # Рассчитываем время
-                start_time_dt = datetime.fromisoformat(start_time)
-                duration = int((datetime.now() - start_time_dt).total_seconds())
-
-                # Форматируем время
-                hours = duration // 3600
-                minutes = (duration % 3600) // 60
-                seconds = duration % 60
-
-                if hours > 0:
-                    time_str = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-                elif minutes > 0:
-                    time_str = f"{minutes:02d}:{seconds:02d}"
-                else:
-                    time_str = f"{seconds:02d} сек"
+            self._schedule_next(user_id, subscription, now)
+        except Exception as e:
+            print(f"Ошибка расчета следующего напоминания пользователя {user_id}: {e}")
+            due = now + REMINDER_FALLBACK_DELAY
+            self.scheduler.schedule(user_id, due)
+            self._dirty[user_id] = math.ceil(due)
+
+    async def _process_due(self, now: float):
+        """
+        Отбор напоминаний, время которых наступило, и планирование следующих.
+        Локальное время считается один раз на часовой пояс, а тихое время
+        проверяется по окну пользователя в минутах суток UTC.
+        Отправка выполняется отдельной задачей, чтобы цикл не ждал рассылку.
+        """
+        recipients = []
+        zones = {}  # Часовой пояс -> локальное время
+        utc_minute = int(now // 60) % MINUTES_PER_DAY
+
+        for user_id, due in self.scheduler.pop_due(now):
+            if self.on_due:
+                self.on_due(user_id, due)
 
-                # Отправляем сообщение с кнопками
-                await self.bot.send_message(
-                    chat_id=user_id,
-                    text=f"{emoji} {activity_name}?\n{time_str}\n\nУведомлять через:",
-                    reply_markup=get_reminder_buttons_keyboard()
+            subscription = self.subscriptions.get(user_id)
+            if not subscription:
+                continue
+
+            try:
+                local_time = self._zone_time(zones, subscription['timezone'], now)
+
+                # Для тестовых интервалов (меньше минуты) тихое время не учитываем,
+                # чтобы можно было тестировать в любое время
+                in_quiet_time = (
+                    subscription['reminder_interval'] >= 60
+                    and subscription['quiet_time_enabled']
+                    and subscription['quiet_utc_start'] is not None
+                    and is_quiet_minute(
+                        utc_minute,
+                        subscription['quiet_utc_start'],
+                        subscription['quiet_utc_end']
+                    )
                 )
+
+                if not in_quiet_time:
+                    recipients.append(user_id)
+
+                # Следующее напоминание считаем от текущего момента
+                self._schedule_next(user_id, subscription, now, local_time)
+
+            except Exception as e:
+                print(f"Ошибка обработки пользователя {user_id}: {e}")
+                self._schedule_fallback(user_id, subscription, now)
+
+        if recipients:
+            task = asyncio.create_task(self._deliver(recipients))
+            self._delivery_tasks.add(task)
+            task.add_done_callback(self._delivery_tasks.discard)
+
+    async def _deliver(self, user_ids: list):
+        """
+        Пакетная рассылка напоминаний:
+        1) данные всех получателей читаются одним запросом;
+        2) сообщения отправляются параллельно с учетом лимитов Telegram,
+           по одной попытке на сообщение;
+        3) время последнего напоминания записывается одной транзакцией,
+           недоставленные обрабатываются сразу;
+        4) сообщения с ответом 429 или временной ошибкой повторяются
+           отдельной задачей, которая потом записывает свои результаты.
+        """
+        try:
+            payloads = await run_db(get_reminder_payloads, user_ids)
+        except Exception as e:
+            print(f"Ошибка чтения данных для напоминаний: {e}")
+            return
+
+        recipients = [user_id for user_id in user_ids if user_id in payloads]
+        retry_ids = await self._send_batch(recipients, payloads, retry=False)
+
+        if retry_ids:
+            task = asyncio.create_task(self._retry_deliveries(retry_ids, payloads))
+            self._delivery_tasks.add(task)
+            task.add_done_callback(self._delivery_tasks.discard)
+
+    async def _retry_deliveries(self, user_ids: list, payloads: dict):
+        """
+        Повтор напоминаний после 429 или временной ошибки: первая задержка -
+        как у временной ошибки (после 429 ждет сам ограничитель скорости),
+        дальше повторы идут по правилам RateLimitedSender.
+        """
+        await asyncio.sleep(self.sender.backoff_base)
+        await self._send_batch(user_ids, payloads, retry=True, previous_attempts=1)
+
+    async def _send_batch(self, user_ids: list, payloads: dict, retry: bool, previous_attempts: int = 0) -> list:
+        """
+        Параллельная отправка напоминаний и запись итогов: время последнего
+        напоминания - одной транзакцией, недоставленные - в _handle_failures.
+        Возвращает пользователей с итогом RETRY (только при retry=False).
+        """
+        results = await asyncio.gather(
+            *(self._send_reminder(user_id, payloads[user_id], retry) for user_id in user_ids),
+            return_exceptions=True
+        )
+
+        sent = []
+        failures = []
+        retry_ids = []
+        for user_id, result in zip(user_ids, results):
+            if isinstance(result, Exception):
+                print(f"Ошибка отправки напоминания пользователю {user_id}: {result}")
+                failures.append((user_id, 'error', str(result), previous_attempts + 1))
+                continue
+
+            outcome, error, attempts = result
+            if outcome == SENT:
+                sent.append(user_id)
+            elif outcome == RETRY:
+                retry_ids.append(user_id)
             else:
-                # Если нет активности
-                await self.bot.send_message(
-                    chat_id=user_id,
-                    text="❓ Чем занят?\n\nУведомлять через:",
-                    reply_markup=get_reminder_buttons_keyboard()
-                )
+                failures.append((user_id, outcome, error, previous_attempts + attempts))
 
+        if sent:
+            try:
+                await run_db(update_last_reminder_times, sent, self.clock())
+            except Exception as e:
+                print(f"Ошибка сохранения времени напоминаний: {e}")
+
+        await self._handle_failures(failures)
+        return retry_ids
+
+    async def _handle_failures(self, failures: list):
+        """
+        Обработка недоставленных напоминаний: запись в dead_letter,
+        а при постоянной ошибке (бот заблокирован, аккаунт удален) -
+        отключение уведомлений и удаление пользователя из расписания.
+        failures - список (user_id, итог, текст ошибки, число попыток).
+        """
+        if not failures:
+            return
+
+        disabled = [user_id for user_id, outcome, _, _ in failures if outcome == PERMANENT]
+        for user_id in disabled:
+            self.cancel(user_id)
+
+        try:
+            await run_db(record_delivery_failures, failures, disabled)
+        except Exception as e:
+            print(f"Ошибка записи недоставленных напоминаний: {e}")
+
+    async def _refresh_quiet_windows(self):
+        """
+        Пересчет окон тихого времени при смене смещения часовых поясов
+        (переход на летнее/зимнее время) и обновление загруженных подписок.
+        """
+        # Переходы на летнее/зимнее время происходят в начале часа - проверяем по границам интервала
+        now = self.clock()
+        self._next_quiet_check = (now // QUIET_WINDOW_CHECK_INTERVAL + 1) * QUIET_WINDOW_CHECK_INTERVAL
+        try:
+            changed = await run_db(refresh_all_quiet_windows, datetime.fromtimestamp(now, pytz.utc))
+            if not changed:
+                return
+
+            changed = set(changed)
+            for subscription in await run_db(get_reminder_subscriptions):
+                user_id = subscription['user_id']
+                if user_id in changed and user_id in self.subscriptions:
+                    subscription.pop('next_reminder_at', None)
+                    self.subscriptions[user_id] = subscription
+        except Exception as e:
+            print(f"Ошибка пересчета тихого времени: {e}")
+
+    async def _ensure_schedule_loaded(self) -> bool:
+        """
+        Загрузка расписания, если она еще не удалась. При ошибке следующая
+        попытка откладывается, задержка удваивается до REMINDER_RETRY_BACKOFF_MAX.
+        Возвращает True, если расписание загружено.
+        """
+        if self._schedule_loaded:
+            return True
+        if self.clock() < self._next_load_attempt:
+            return False
+
+        try:
+            await self.load_schedule()
+            return True
+        except Exception as e:
+            print(f"Ошибка загрузки расписания напоминаний (повтор через {self._load_backoff:.0f} сек): {e}")
+            self._next_load_attempt = self.clock() + self._load_backoff
+            self._load_backoff = min(self._load_backoff * 2, REMINDER_RETRY_BACKOFF_MAX)
+            return False
+
+    async def run_once(self):
+        """
+        Одна итерация цикла: загрузка расписания (если еще не удалась),
+        проверка смещений часовых поясов, обработка наступивших напоминаний
+        и, если пора, запись расписания в базу.
+        """
+        if not await self._ensure_schedule_loaded():
+            return
+
+        if self.clock() >= self._next_quiet_check:
+            await self._refresh_quiet_windows()
+
+        await self._process_due(self.clock())
+
+        if self._dirty and self.clock() - self._last_flush >= REMINDER_FLUSH_INTERVAL:
+            await self.flush_schedule()
+
+    def next_wakeup(self) -> float:
+        """
+        Время ближайшего события: напоминания, проверки смещений поясов или
+        записи расписания (ее не откладываем дольше интервала сохранения).
+        Пока расписание не загружено - время следующей попытки загрузки.
+        """
+        if not self._schedule_loaded:
+            return self._next_load_attempt
+
+        wake_at = self._next_quiet_check
+        next_due = self.scheduler.next_due()
+        if next_due is not None:
+            wake_at = min(wake_at, next_due)
+        if self._dirty:
+            wake_at = min(wake_at, self._last_flush + REMINDER_FLUSH_INTERVAL)
+        return wake_at
+
+    async def wait_deliveries(self):
+        """
+        Ожидание завершения начатых рассылок.
+        """
+        if self._delivery_tasks:
+            await asyncio.gather(*list(self._delivery_tasks), return_exceptions=True)
+
+    async def _reminder_loop(self):
+        """
+        Основной цикл напоминаний.
+        Обрабатываются только пользователи, чье время наступило;
+        между срабатываниями цикл спит ровно до ближайшего времени в расписании.
+        Расписание загружается на первой итерации; если загрузка не удалась,
+        она повторяется с нарастающей задержкой.
+        """
+        while self.is_running:
+            try:
+                # Сбрасываем событие до расчета сна, чтобы не пропустить изменение расписания
+                self._wakeup.clear()
+
+                await self.run_once()
+
+                timeout = max(0.0, self.next_wakeup() - self.clock())
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                print(f"Ошибка в цикле напоминаний: {e}")
+                await asyncio.sleep(5)
+
+    def _format_reminder_text(self, current_activity) -> str:
+        """
+        Текст напоминания по текущей активности (или вопрос, если ее нет).
+        """
+        if not current_activity:
+            return "❓ Чем занят?\n\nУведомлять через:"
+
+        # Получаем название активности
+        activity_type, start_time = current_activity
+        activity_name = ACTIVITIES.get(activity_type, activity_type)
+        emoji = get_activity_emoji(activity_type)
+
+        # Рассчитываем время
+        duration = int(self.clock()) - start_time
+
+        # Форматируем время
+        hours = duration // 3600
+        minutes = (duration % 3600) // 60
+        seconds = duration % 60
+
+        if hours > 0:
+            time_str = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+        elif minutes > 0:
+            time_str = f"{minutes:02d}:{seconds:02d}"
+        else:
+            time_str = f"{seconds:02d} сек"
+
+        return f"{emoji} {activity_name}?\n{time_str}\n\nУведомлять через:"
+
+    async def _send_reminder(self, user_id: int, current_activity, retry: bool = True):
+        """
+        Отправка напоминания с кнопками по уже прочитанной текущей активности.
+        Сообщение проходит через общий ограничитель скорости отправки.
+        retry=False - одна попытка (см. RateLimitedSender.send).
+        Возвращает (итог, текст ошибки, число попыток).
+        """
+        text = self._format_reminder_text(current_activity)
+        return await self.sender.send(
+            user_id,
+            lambda: self.bot.send_message(
+                chat_id=user_id,
+                text=text,
+                reply_markup=get_reminder_buttons_keyboard()
+            ),
+            retry
+        )
+
+    async def send_reminder_with_buttons(self, user_id: int) -> bool:
+        """
+        Отправка напоминания с кнопками выбора интервала.
+        Возвращает True, если напоминание отправлено.
+        """
+        try:
+            current_activity = await run_db(get_current_activity, user_id)
+            outcome, error, attempts = await self._send_reminder(user_id, current_activity)
         except Exception as e:
             print(f"Ошибка отправки напоминания пользователю {user_id}: {e}")
+            return False
+
+        if outcome != SENT:
+            print(f"Ошибка отправки напоминания пользователю {user_id}: {error}")
+            await self._handle_failures([(user_id, outcome, error, attempts)])
+        return outcome == SENT
 
     async def send_reminder(self, user_id: int):
         """
@@ -0,0 +1,98 @@
+"""
+Ежедневные итоги активностей (таблица daily_rollup).
+Итоги хранятся по локальным дням пользователя и обновляются в той же
+транзакции, в которой завершается активность. Активность, переходящая
+через полночь, делится между днями.
+"""
+
+from datetime import datetime, timedelta
+import pytz
+from config import DEFAULT_TIMEZONE
+
+def get_tz(timezone_str):
+    """
+    Объект часового пояса pytz (при ошибке - часовой пояс по умолчанию).
+    """
+    try:
+        return pytz.timezone(timezone_str)
+    except Exception:
+        return pytz.timezone(DEFAULT_TIMEZONE)
+
+def split_by_local_day(start_time, end_time, tz):
+    """
+    Разбиение интервала [start_time, end_time) в секундах UTC по локальным дням.
+    Возвращает список кортежей (local_day, seconds), где local_day - 'YYYY-MM-DD'.
+    """
+    parts = []
+    current = start_time
+
+    while current < end_time:
+        day = datetime.fromtimestamp(current, tz).date()
+        next_midnight = tz.localize(datetime.combine(day + timedelta(days=1), datetime.min.time()))
+        boundary = min(int(next_midnight.timestamp()), end_time)
+        parts.append((day.isoformat(), boundary - current))
+        current = boundary
+
+    return parts
+
+def add_to_rollup(cursor, user_id, activity_type, start_time, end_time, tz):
+    """
+    Добавление завершенной активности к дневным итогам.
+    Вызывается внутри транзакции, которая завершает активность.
+    """
+    rows = [
+        (user_id, local_day, activity_type, seconds)
+        for local_day, seconds in split_by_local_day(start_time, end_time, tz)
+    ]
+    cursor.executemany('''
+        INSERT INTO daily_rollup (user_id, local_day, activity_type, seconds)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (user_id, local_day, activity_type)
+        DO UPDATE SET seconds = seconds + excluded.seconds
+    ''', rows)
+
+def rebuild_rollups(cursor, user_id=None):
+    """
+    Пересчет дневных итогов из сырых активностей (всех пользователей или одного).
+    Возвращает количество обработанных активностей.
+    """
+    if user_id is None:
+        cursor.execute('DELETE FROM daily_rollup')
+        cursor.execute('SELECT user_id, timezone FROM users')
+    else:
+        cursor.execute('DELETE FROM daily_rollup WHERE user_id = ?', (user_id,))
+        cursor.execute('SELECT user_id, timezone FROM users WHERE user_id = ?', (user_id,))
+
+    timezones = {uid: get_tz(timezone) for uid, timezone in cursor.fetchall()}
+    default_tz = get_tz(DEFAULT_TIMEZONE)
+
+    if user_id is None:
+        cursor.execute('''
+            SELECT user_id, activity_type, start_time, end_time
+            FROM activities
+            WHERE end_time IS NOT NULL
+        ''')
+    else:
+        cursor.execute('''
+            SELECT user_id, activity_type, start_time, end_time
+            FROM activities
+            WHERE user_id = ? AND end_time IS NOT NULL
+        ''', (user_id,))
+
+    # Суммируем в памяти и записываем одним пакетом
+    totals = {}
+    processed = 0
+    for uid, activity_type, start_time, end_time in cursor.fetchall():
+        tz = timezones.get(uid, default_tz)
+        for local_day, seconds in split_by_local_day(start_time, end_time, tz):
+            key = (uid, local_day, activity_type)
+            totals[key] = totals.get(key, 0) + seconds
+        processed += 1
+
+    cursor.executemany('''
+        INSERT INTO daily_rollup (user_id, local_day, activity_type, seconds)
+        VALUES (?, ?, ?, ?)
+    ''', [(uid, local_day, activity_type, seconds)
+          for (uid, local_day, activity_type), seconds in totals.items()])
+
+    return processed
@@ -0,0 +1,290 @@
+"""
+Планировщики напоминаний по времени следующего срабатывания.
+HeapScheduler - min-куча, TimingWheelScheduler - иерархическое колесо таймеров.
+Оба реализуют одинаковый интерфейс: schedule, cancel, get_due, pop_due,
+next_due, clear, len() и in.
+"""
+
+import heapq
+import itertools
+import math
+import time
+
+class HeapScheduler:
+    """
+    Min-куча (due, seq, user_id) с ленивым удалением.
+    У каждого пользователя действительна только последняя запись;
+    устаревшие записи пропускаются при извлечении.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._entries = {}  # user_id -> (due, seq) действующей записи
+        self._counter = itertools.count()
+
+    def schedule(self, user_id: int, due: float):
+        """
+        Установка (или перенос) времени срабатывания пользователя.
+        """
+        seq = next(self._counter)
+        self._entries[user_id] = (due, seq)
+        heapq.heappush(self._heap, (due, seq, user_id))
+
+        # Уплотняем кучу, если устаревших записей стало слишком много
+        if len(self._heap) > 2 * len(self._entries) + 1024:
+            self._compact()
+
+    def cancel(self, user_id: int):
+        """
+        Отмена напоминаний пользователя.
+        """
+        self._entries.pop(user_id, None)
+
+    def get_due(self, user_id: int):
+        """
+        Время срабатывания пользователя или None.
+        """
+        entry = self._entries.get(user_id)
+        return entry[0] if entry else None
+
+    def pop_due(self, now: float) -> list:
+        """
+        Извлечение всех срабатываний со временем <= now.
+        Возвращает список (user_id, due) в порядке времени.
+        """
+        due_items = []
+        heap = self._heap
+
+        while heap and heap[0][0] <= now:
+            due, seq, user_id = heapq.heappop(heap)
+            if self._entries.get(user_id) != (due, seq):
+                continue  # Запись устарела (перенос или отмена)
+            del self._entries[user_id]
+            due_items.append((user_id, due))
+
+        return due_items
+
+    def next_due(self):
+        """
+        Ближайшее время срабатывания или None, если расписание пусто.
+        """
+        heap = self._heap
+        while heap:
+            due, seq, user_id = heap[0]
+            if self._entries.get(user_id) == (due, seq):
+                return due
+            heapq.heappop(heap)
+        return None
+
+    def clear(self):
+        """
+        Полная очистка расписания.
+        """
+        self._heap = []
+        self._entries = {}
+
+    def _compact(self):
+        self._heap = [(due, seq, user_id) for user_id, (due, seq) in self._entries.items()]
+        heapq.heapify(self._heap)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, user_id):
+        return user_id in self._entries
+
+
+class TimingWheelScheduler:
+    """
+    Иерархическое колесо таймеров с шагом в одну секунду.
+    Уровень L состоит из 2**slot_bits ячеек, каждая покрывает
+    2**(slot_bits * L) секунд; запись попадает на самый нижний уровень,
+    окно которого от текущей секунды вмещает ее срок. Вставка и отмена -
+    O(1) (словарь ячейки), продвижение на секунду - O(1) плюс перенос на
+    нижний уровень записей одной ячейки, срок которых приблизился.
+    """
+
+    def __init__(self, slot_bits: int = 8, levels: int = 4, start: float = None):
+        self.slot_bits = slot_bits
+        self.levels = levels
+        self._slot_mask = (1 << slot_bits) - 1
+        self._current = math.floor(time.time() if start is None else start)  # Текущая необработанная секунда
+        self._clear_wheels()
+
+    def _clear_wheels(self):
+        size = 1 << self.slot_bits
+        self._wheels = [[{} for _ in range(size)] for _ in range(self.levels)]
+        self._overdue = {}  # Срок уже прошел - отдаем при ближайшем pop_due
+        self._overflow = {}  # Срок дальше самого верхнего уровня
+        self._entries = {}  # user_id -> (due, ячейка)
+
+    def _bucket_for(self, tick: int) -> dict:
+        """
+        Ячейка для секунды tick: самый нижний уровень, окно которого
+        (отсчитанное от текущей секунды) содержит tick.
+        """
+        delta = tick - self._current
+        if delta < 0:
+            return self._overdue
+
+        for level in range(self.levels):
+            if delta < 1 << (self.slot_bits * (level + 1)):
+                index = (tick >> (self.slot_bits * level)) & self._slot_mask
+                return self._wheels[level][index]
+
+        return self._overflow
+
+    def schedule(self, user_id: int, due: float):
+        """
+        Установка (или перенос) времени срабатывания пользователя.
+        """
+        self.cancel(user_id)
+        bucket = self._bucket_for(math.floor(due))
+        bucket[user_id] = due
+        self._entries[user_id] = (due, bucket)
+
+    def cancel(self, user_id: int):
+        """
+        Отмена напоминаний пользователя.
+        """
+        entry = self._entries.pop(user_id, None)
+        if entry:
+            del entry[1][user_id]
+
+    def get_due(self, user_id: int):
+        """
+        Время срабатывания пользователя или None.
+        """
+        entry = self._entries.get(user_id)
+        return entry[0] if entry else None
+
+    def _cascade(self, bucket: dict):
+        """
+        Перенос записей ячейки верхнего уровня на нижние уровни.
+        """
+        items = list(bucket.items())
+        bucket.clear()
+        for user_id, due in items:
+            target = self._bucket_for(math.floor(due))
+            target[user_id] = due
+            self._entries[user_id] = (due, target)
+
+    def _advance(self):
+        """
+        Переход к следующей секунде с переносом записей верхних уровней.
+        Сначала переносятся верхние уровни: их записи могут попасть в ячейку
+        нижнего уровня, которая переносится на этом же шаге.
+        """
+        self._current += 1
+        current = self._current
+        if current & self._slot_mask:
+            return
+
+        top_shift = self.slot_bits * self.levels
+        if current & ((1 << top_shift) - 1) == 0 and self._overflow:
+            self._cascade(self._overflow)
+        for level in range(self.levels - 1, 0, -1):
+            shift = self.slot_bits * level
+            if current & ((1 << shift) - 1) == 0:
+                self._cascade(self._wheels[level][(current >> shift) & self._slot_mask])
+
+    def pop_due(self, now: float) -> list:
+        """
+        Извлечение всех срабатываний со временем <= now.
+        Возвращает список (user_id, due) в порядке времени.
+        """
+        due_items = sorted(self._overdue.items(), key=lambda item: item[1])
+        self._overdue.clear()
+
+        target = math.floor(now)
+        if not self._entries or len(self._entries) == len(due_items):
+            # В колесе ничего нет - перематываем время без обхода ячеек
+            self._current = max(self._current, target)
+
+        wheel = self._wheels[0]
+        while self._current < target:
+            bucket = wheel[self._current & self._slot_mask]
+            if bucket:
+                due_items.extend(sorted(bucket.items(), key=lambda item: item[1]))
+                bucket.clear()
+            self._advance()
+
+        # Текущая секунда обрабатывается частично: в ячейке могут быть
+        # записи с дробным временем позже now
+        bucket = wheel[self._current & self._slot_mask]
+        if bucket:
+            ready = sorted(
+                (item for item in bucket.items() if item[1] <= now),
+                key=lambda item: item[1]
+            )
+            for user_id, _ in ready:
+                del bucket[user_id]
+            due_items.extend(ready)
+
+        for user_id, _ in due_items:
+            del self._entries[user_id]
+
+        return due_items
+
+    def next_due(self):
+        """
+        Ближайшее время срабатывания или None, если расписание пусто.
+        Не позже ближайшего переноса с верхних уровней: в этот момент цикл
+        проснется и проверит колесо снова.
+        """
+        if not self._entries:
+            return None
+        if self._overdue:
+            return min(self._overdue.values())
+
+        # Записи верхних уровней не могут сработать раньше ближайшего переноса
+        next_cascade = float(((self._current >> self.slot_bits) + 1) << self.slot_bits)
+
+        wheel = self._wheels[0]
+        current_index = self._current & self._slot_mask
+        for offset in range(self._slot_mask + 1):
+            bucket = wheel[(current_index + offset) & self._slot_mask]
+            if bucket:
+                return min(min(bucket.values()), next_cascade)
+
+        return next_cascade
+
+    def clear(self):
+        """
+        Полная очистка расписания.
+        """
+        self._clear_wheels()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, user_id):
+        return user_id in self._entries
+
+
+def stable_jitter(user_id: int, window: float) -> float:
+    """
+    Постоянное для пользователя смещение в пределах [0, window) секунд
+    (мультипликативный хэш user_id, шаг 1 мс).
+    """
+    steps = int(window * 1000)
+    if steps <= 0:
+        return 0.0
+    return (user_id * 2654435761 % 2 ** 32) % steps / 1000
+
+
+SCHEDULERS = {
+    'heap': HeapScheduler,
+    'wheel': TimingWheelScheduler
+}
+
+def create_scheduler(kind: str = 'heap', now: float = None):
+    """
+    Планировщик по названию из конфигурации ('heap' или 'wheel').
+    now - текущее время для колеса таймеров (по умолчанию time.time()).
+    """
+    if kind == 'wheel':
+        return TimingWheelScheduler(start=now)
+    if kind != 'heap':
+        print(f"⚠️ Неизвестный планировщик напоминаний '{kind}', используется heap")
+    return HeapScheduler()
@@ -0,0 +1,239 @@
+"""
+Моделирование работы напоминаний на виртуальных часах.
+
+ReminderManager работает с настоящей базой (во временном файле), но с
+виртуальными часами и заглушкой вместо Telegram: сутки или неделя
+проходят за секунды. Синтетические пользователи получают случайные
+часовые пояса из TimezoneManager, интервалы из клавиатуры настроек и
+разное тихое время.
+
+Отчет: число отправленных напоминаний, опоздание относительно
+запланированного времени (с учетом лимита отправки Telegram),
+нарушения тихого времени и процессорное время на тик.
+
+Запуск: python simulation.py --users 1000 --days 7 --scheduler wheel
+"""
+
+import os
+
+# config требует токен; в моделировании запросы в Telegram не отправляются
+os.environ.setdefault('BOT_TOKEN', '0:simulation')
+
+import argparse
+import asyncio
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime
+import pytz
+
+from config import REMINDER_RATE_LIMIT, REMINDER_JITTER_WINDOW
+from connection_manager import connection_manager
+from database import init_db, close_db
+from delivery import RateLimitedSender
+from quiet_windows import refresh_quiet_windows, time_to_minutes
+from reminder import ReminderManager, is_quiet_minute
+from scheduler import create_scheduler
+from timezone_manager import timezone_manager
+
+# Интервалы из keyboards.get_reminder_interval_keyboard (5 секунд - только с --with-test)
+INTERVALS = [300, 900, 1800, 3600, 7200, 14400, 28800]
+TEST_INTERVAL = 5
+
+# Варианты тихого времени: (включено, начало, конец)
+QUIET_WINDOWS = [
+    (1, '22:00', '06:00'),
+    (1, '23:30', '07:30'),
+    (1, '13:00', '14:00'),
+    (0, '22:00', '06:00'),
+]
+
+class VirtualClock:
+    """
+    Виртуальные часы: время меняется только вызовом advance_to.
+    """
+
+    def __init__(self, start: float):
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance_to(self, moment: float):
+        self.now = max(self.now, moment)
+
+
+class FakeBot:
+    """
+    Заглушка Bot: запоминает отправленные сообщения.
+    Время доставки моделируется очередью с лимитом rate сообщений в секунду,
+    как у настоящей отправки через RateLimitedSender.
+    """
+
+    def __init__(self, clock: VirtualClock, rate: float):
+        self.clock = clock
+        self.rate = rate
+        self._next_slot = 0.0
+        self.sent = []  # (user_id, время доставки)
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        slot = max(self.clock(), self._next_slot)
+        self._next_slot = slot + 1 / self.rate
+        self.sent.append((chat_id, slot))
+
+
+def create_users(count: int, rng: random.Random, start: datetime, with_test: bool) -> dict:
+    """
+    Создание синтетических пользователей в базе.
+    Возвращает словарь user_id -> (часовой пояс, интервал, тихое время).
+    """
+    timezones = sorted(set(timezone_manager.common_timezones.values()))
+    intervals = INTERVALS + ([TEST_INTERVAL] if with_test else [])
+
+    users = {}
+    for user_id in range(1, count + 1):
+        users[user_id] = (rng.choice(timezones), rng.choice(intervals), rng.choice(QUIET_WINDOWS))
+
+    conn = connection_manager.get_connection()
+    cursor = conn.cursor()
+    with conn:
+        cursor.executemany('''
+            INSERT INTO users (user_id, first_name, timezone)
+            VALUES (?, ?, ?)
+        ''', [(user_id, f'sim{user_id}', timezone) for user_id, (timezone, _, _) in users.items()])
+        cursor.executemany('''
+            INSERT INTO user_settings (user_id, reminder_interval, notifications_enabled,
+                                       quiet_time_enabled, quiet_time_start, quiet_time_end)
+            VALUES (?, ?, 1, ?, ?, ?)
+        ''', [(user_id, interval, enabled, quiet_start, quiet_end)
+              for user_id, (_, interval, (enabled, quiet_start, quiet_end)) in users.items()])
+        # Окна тихого времени - по смещениям поясов на момент начала моделирования
+        refresh_quiet_windows(cursor, start)
+
+    return users
+
+
+def count_quiet_violations(users: dict, sent: list) -> int:
+    """
+    Напоминания, доставленные в тихое время пользователя (по его локальному времени).
+    """
+    timezones = {}
+    violations = 0
+    for user_id, delivered_at in sent:
+        timezone, interval, (enabled, quiet_start, quiet_end) = users[user_id]
+        if not enabled or interval < 60:
+            continue
+
+        tz = timezones.setdefault(timezone, pytz.timezone(timezone))
+        local_time = datetime.fromtimestamp(delivered_at, tz)
+        if is_quiet_minute(local_time.hour * 60 + local_time.minute,
+                           time_to_minutes(quiet_start), time_to_minutes(quiet_end)):
+            violations += 1
+    return violations
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def simulate(args) -> dict:
+    rng = random.Random(args.seed)
+    start = pytz.utc.localize(datetime.strptime(args.start, '%Y-%m-%d'))
+    end = start.timestamp() + args.days * 86400
+
+    fd, db_path = tempfile.mkstemp(suffix='.db', prefix='simulation_')
+    os.close(fd)
+    connection_manager.set_db_path(db_path)
+
+    try:
+        init_db()
+        users = create_users(args.users, rng, start, args.with_test)
+
+        clock = VirtualClock(start.timestamp())
+        bot = FakeBot(clock, args.rate)
+        # Лимиты отправки моделирует FakeBot, сам отправитель ничего не ждет
+        sender = RateLimitedSender(rate=1e9, chat_interval=0, concurrency=1000)
+        # Запоминаем запланированное время каждого срабатывания для расчета опоздания
+        planned = {}
+        manager = ReminderManager(bot, clock=clock, sender=sender, on_due=planned.__setitem__)
+        manager.scheduler = create_scheduler(args.scheduler, clock())
+        manager.jitter_window = args.jitter
+
+        await manager.load_schedule()
+
+        lateness = []
+        tick_cpu = []
+        sent_before = 0
+        while True:
+            wake_at = manager.next_wakeup()
+            if wake_at > end:
+                break
+            clock.advance_to(wake_at)
+
+            cpu_started = time.process_time()
+            await manager.run_once()
+            await manager.wait_deliveries()
+            tick_cpu.append(time.process_time() - cpu_started)
+
+            for user_id, delivered_at in bot.sent[sent_before:]:
+                lateness.append(delivered_at - planned[user_id])
+            sent_before = len(bot.sent)
+
+        await manager.flush_schedule()
+    finally:
+        close_db()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+
+    return {
+        'sent': len(bot.sent),
+        'ticks': len(tick_cpu),
+        'lateness': lateness,
+        'quiet_violations': count_quiet_violations(users, bot.sent),
+        'tick_cpu': tick_cpu,
+        'send_stats': sender.stats()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Моделирование напоминаний на виртуальных часах')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--days', type=float, default=1)
+    parser.add_argument('--start', default='2026-03-23', help='Дата начала (UTC), ГГГГ-ММ-ДД')
+    parser.add_argument('--scheduler', default='heap', choices=['heap', 'wheel'])
+    parser.add_argument('--jitter', type=float, default=REMINDER_JITTER_WINDOW,
+                        help='Окно разнесения привязанных напоминаний, сек')
+    parser.add_argument('--rate', type=float, default=REMINDER_RATE_LIMIT,
+                        help='Лимит отправки, сообщений в секунду')
+    parser.add_argument('--with-test', action='store_true', help='Добавить тестовый интервал 5 секунд')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    result = asyncio.run(simulate(args))
+    elapsed = time.perf_counter() - started
+
+    lateness = result['lateness']
+    tick_cpu = result['tick_cpu']
+
+    print("=" * 50)
+    print(f"📊 Моделирование: {args.users} пользователей, {args.days:g} сут. с {args.start}, "
+          f"планировщик {args.scheduler}, разнесение {args.jitter:g} сек")
+    print(f"• Отправлено напоминаний: {result['sent']} ({result['sent'] / args.days:.0f} в сутки)")
+    print(f"• Итоги отправки: {result['send_stats']}")
+    if lateness:
+        print(f"• Опоздание, сек: среднее {statistics.mean(lateness):.2f}, "
+              f"p50 {percentile(lateness, 0.5):.2f}, p95 {percentile(lateness, 0.95):.2f}, "
+              f"p99 {percentile(lateness, 0.99):.2f}, макс {max(lateness):.2f}")
+    print(f"• Нарушений тихого времени: {result['quiet_violations']}")
+    if tick_cpu:
+        print(f"• Тиков: {result['ticks']}, CPU на тик, мс: среднее {statistics.mean(tick_cpu) * 1e3:.2f}, "
+              f"p99 {percentile(tick_cpu, 0.99) * 1e3:.2f}, макс {max(tick_cpu) * 1e3:.2f}")
+    print(f"• Время моделирования: {elapsed:.1f} сек")
+
+
+if __name__ == "__main__":
+    main()
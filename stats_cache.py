@@ -0,0 +1,67 @@
+"""
+Кэш снимков статистики по версии данных пользователя.
+Ключ - (user_id, экран, версия данных). Версия меняется при каждом
+изменении истории пользователя (смена активности, очистка данных, смена
+часового пояса), поэтому снимки старой версии больше не находятся
+и со временем вытесняются из LRU.
+Версии тоже хранятся в LRU того же размера. Новая версия берется из общего
+счетчика, поэтому пользователь, чья версия вытеснена, получает версию,
+которой нет ни в одном ключе снимков, - это промах, а не устаревший снимок.
+"""
+
+import itertools
+import threading
+from collections import OrderedDict
+from cache import LRUCache
+from config import STATS_CACHE_SIZE
+
+class StatsCache:
+    def __init__(self, maxsize: int = STATS_CACHE_SIZE):
+        self._snapshots = LRUCache(maxsize)
+        self._versions = OrderedDict()  # user_id -> версия данных (LRU)
+        self._versions_maxsize = maxsize
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _set_version(self, user_id) -> int:
+        version = next(self._counter)
+        self._versions[user_id] = version
+        self._versions.move_to_end(user_id)
+        while len(self._versions) > self._versions_maxsize:
+            self._versions.popitem(last=False)
+        return version
+
+    def version(self, user_id) -> int:
+        """
+        Текущая версия данных пользователя (новая, если ее нет в LRU).
+        """
+        with self._lock:
+            if user_id in self._versions:
+                self._versions.move_to_end(user_id)
+                return self._versions[user_id]
+            return self._set_version(user_id)
+
+    def bump(self, user_id):
+        """
+        Новая версия данных пользователя. Вызывается после фиксации транзакции,
+        иначе снимок, прочитанный до фиксации, попал бы в кэш под новой версией.
+        """
+        with self._lock:
+            self._set_version(user_id)
+
+    def get_or_load(self, user_id, view, loader):
+        """
+        Снимок экрана view для текущей версии данных или результат loader() при промахе.
+        """
+        key = (user_id, view, self.version(user_id))
+        return self._snapshots.get_or_load(key, lambda _: loader())
+
+    def stats(self) -> dict:
+        """
+        Счетчики кэша (размер, попадания, промахи, вытеснения, доля попаданий).
+        """
+        return self._snapshots.stats()
+
+
+# Глобальный экземпляр
+stats_cache = StatsCache()
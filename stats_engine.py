@@ -0,0 +1,145 @@
+"""
+Единый расчет статистики для экранов бота.
+Экран описывается декларативно (StatsView): за сколько дней график,
+итоги за какие периоды, по какому периоду распределение и сколько
+активностей в топе. StatsEngine по описанию читает все данные одним
+снимком (одно соединение, одна транзакция, текущая активность - один раз)
+через кэш снимков и возвращает StatsResult, который отрисовывает
+utils.format_view_stats.
+"""
+
+import time
+from datetime import datetime
+from config import MONTH_TIMELINE_MIN_RESOLUTION
+from database import get_stats_snapshot, apply_live_stats, get_user_timezone, get_timeline_resolution
+from rollups import get_tz
+from stats_cache import stats_cache
+
+class StatsView:
+    """
+    Описание экрана статистики.
+
+    name - ключ экрана в кэше снимков
+    title - заголовок сообщения
+    timeline_days - дней на графике активности (0 - без графика)
+    timeline_caption - подпись периода у графика ('7 дней') или None
+    timeline_preview_days - сколько дней графика показывать (None - все)
+    min_resolution - самая мелкая ширина интервала графика, сек (лимит длины сообщения)
+    total_windows - строки "Всего времени": кортежи (дней, подпись периода)
+    distribution_days - период распределения по активностям (1 - последние 24 часа)
+    distribution_title - заголовок распределения
+    top_n - распределение списком из top_n активностей вместо диаграммы (None - диаграмма)
+    """
+
+    def __init__(self, name, title, timeline_days=0, timeline_caption=None,
+                 timeline_preview_days=None, min_resolution=0, total_windows=(),
+                 distribution_days=1, distribution_title="Распределение по активностям (за 24 часа)",
+                 top_n=None):
+        self.name = name
+        self.title = title
+        self.timeline_days = timeline_days
+        self.timeline_caption = timeline_caption
+        self.timeline_preview_days = timeline_preview_days
+        self.min_resolution = min_resolution
+        self.total_windows = tuple(total_windows)
+        self.distribution_days = distribution_days
+        self.distribution_title = distribution_title
+        self.top_n = top_n
+
+    @property
+    def totals_days(self) -> tuple:
+        """
+        Все периоды итогов, нужные экрану (без повторов).
+        """
+        days = [window_days for window_days, _ in self.total_windows] + [self.distribution_days]
+        return tuple(dict.fromkeys(days))
+
+
+class StatsResult:
+    """
+    Данные экрана статистики на момент now.
+
+    grids - сетки графика (bytes по дням) или None
+    totals - {дней: [(activity_type, seconds), ...] по убыванию времени}
+    current - текущая активность (activity_type, start_time) или None
+    """
+
+    def __init__(self, view: StatsView, slot_seconds: int, grids, totals: dict, current, now: int):
+        self.view = view
+        self.slot_seconds = slot_seconds
+        self.grids = grids
+        self.totals = totals
+        self.current = current
+        self.now = now
+
+    @property
+    def current_type(self):
+        return self.current[0] if self.current else None
+
+    def total_seconds(self, days: int) -> int:
+        """
+        Общее время всех активностей за период.
+        """
+        return sum(seconds for _, seconds in self.totals[days])
+
+    @property
+    def distribution(self) -> list:
+        return self.totals[self.view.distribution_days]
+
+
+class StatsEngine:
+    """
+    Расчет статистики экранов: снимок завершенной истории берется из кэша
+    (или читается при промахе), заново считается только вклад текущей активности.
+    """
+
+    def __init__(self, cache=stats_cache):
+        self.cache = cache
+
+    def fetch(self, user_id, view: StatsView, slot_seconds: int = None) -> StatsResult:
+        """
+        Данные экрана view для пользователя.
+        slot_seconds - ширина интервала графика (по умолчанию - выбранная пользователем).
+        """
+        if slot_seconds is None:
+            slot_seconds = get_timeline_resolution(user_id)
+        slot_seconds = max(slot_seconds, view.min_resolution)
+
+        now = int(time.time())
+        today = datetime.fromtimestamp(now, get_tz(get_user_timezone(user_id))).date()
+
+        # Локальная дата в ключе: итоги по дням и график сдвигаются в полночь
+        snapshot = self.cache.get_or_load(
+            user_id, (view.name, today),
+            lambda: get_stats_snapshot(user_id, view.timeline_days, view.totals_days)
+        )
+        live = apply_live_stats(snapshot, slot_seconds, now)
+
+        return StatsResult(view, slot_seconds, live['grids'], live['totals'], snapshot['current'], now)
+
+
+# Экраны статистики
+STATS_VIEWS = {
+    'default': StatsView(
+        'default', "📊 Статистика за последние 3 дня:",
+        timeline_days=3
+    ),
+    'week': StatsView(
+        'week', "📅 Статистика за неделю:",
+        timeline_days=7, timeline_caption="7 дней", timeline_preview_days=3,
+        total_windows=[(1, "за 24 часа")]
+    ),
+    'month': StatsView(
+        'month', "📅 Статистика за месяц:",
+        timeline_days=30, timeline_caption="30 дней", min_resolution=MONTH_TIMELINE_MIN_RESOLUTION,
+        total_windows=[(30, "за 30 дней"), (1, "за 24 часа")]
+    ),
+    'year': StatsView(
+        'year', "📊 Статистика за год:",
+        total_windows=[(365, "за год"), (1, "за 24 часа")],
+        distribution_title="Топ активностей за 24 часа", top_n=5
+    ),
+}
+
+# Глобальный экземпляр
+stats_engine = StatsEngine()
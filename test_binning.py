@@ -0,0 +1,112 @@
+"""
+Сравнение раскладки активностей по интервалам (_bin_sweep и _bin_numpy)
+с наивным расчетом пересечения каждой активности с каждым интервалом.
+Недели со сменой летнего/зимнего времени проверяют дни длиной 23 и 25 часов.
+
+Вариант на NumPy проверяется, только если NumPy установлен.
+
+Запуск: python -m pytest test_binning.py (или python -m unittest test_binning)
+"""
+
+import random
+import unittest
+from datetime import date, datetime, timedelta
+
+import pytz
+
+import binning
+from binning import _bin_sweep, _bin_numpy
+
+SLOT_WIDTHS = (900, 1800, 3600, 7200)
+
+# (часовой пояс, первый день недели)
+WEEKS = [
+    ('Europe/Berlin', date(2024, 3, 27)),  # Переход на летнее время 31 марта
+    ('Europe/Berlin', date(2024, 10, 23)),  # Переход на зимнее время 27 октября
+    ('America/New_York', date(2024, 3, 7)),  # Переход на летнее время 10 марта
+    ('Europe/Moscow', date(2024, 6, 3)),
+]
+
+def day_starts_for(tz, first_day, days):
+    """
+    Начала локальных дней first_day..first_day + days - 1 и конец последнего.
+    """
+    return [
+        int(tz.localize(datetime.combine(first_day + timedelta(days=i), datetime.min.time())).timestamp())
+        for i in range(days + 1)
+    ]
+
+def naive_bins(activities, day_starts, slot_seconds):
+    """
+    Эталон: для каждого интервала считается пересечение с каждой активностью.
+    """
+    slots = 86400 // slot_seconds
+    ordered = sorted(activities, key=lambda a: a[1])
+    result = []
+
+    for day_start, next_day_start in zip(day_starts, day_starts[1:]):
+        day = []
+        for slot in range(slots):
+            slot_start = min(day_start + slot * slot_seconds, next_day_start)
+            if slot == slots - 1:
+                slot_end = next_day_start
+            else:
+                slot_end = min(day_start + (slot + 1) * slot_seconds, next_day_start)
+
+            best = ('rest', 0)
+            for activity_type, start_time, duration in ordered:
+                overlap = min(start_time + duration, slot_end) - max(start_time, slot_start)
+                if overlap > best[1]:
+                    best = (activity_type, overlap)
+            day.append(best)
+        result.append(day)
+
+    return result
+
+def random_activities(rng, day_starts):
+    """
+    Идущие друг за другом активности с паузами; первая может начаться до периода,
+    последняя - закончиться после него.
+    """
+    activities = []
+    position = day_starts[0] - rng.randint(0, 20000)
+    while position < day_starts[-1] + 3600:
+        duration = rng.choice([rng.randint(1, 600), rng.randint(60, 5400), rng.randint(3600, 40000)])
+        activities.append((rng.choice(['work', 'study', 'sport', 'hobby', 'sleep']), position, duration))
+        position += duration + rng.choice([0, 0, rng.randint(1, 4000)])
+
+    rng.shuffle(activities)
+    return activities
+
+class BinningTest(unittest.TestCase):
+    def check(self, bin_function):
+        rng = random.Random(21)
+        for timezone, first_day in WEEKS:
+            tz = pytz.timezone(timezone)
+            day_starts = day_starts_for(tz, first_day, 7)
+            for slot_seconds in SLOT_WIDTHS:
+                for _ in range(3):
+                    activities = random_activities(rng, day_starts)
+                    with self.subTest(timezone=timezone, first_day=first_day, slot_seconds=slot_seconds):
+                        self.assertEqual(
+                            bin_function(activities, day_starts, slot_seconds),
+                            naive_bins(activities, day_starts, slot_seconds)
+                        )
+
+    def test_sweep_matches_naive(self):
+        self.check(_bin_sweep)
+
+    @unittest.skipIf(binning.np is None, "NumPy не установлен")
+    def test_numpy_matches_naive(self):
+        self.check(_bin_numpy)
+
+    def test_empty_period(self):
+        day_starts = day_starts_for(pytz.timezone('Europe/Moscow'), date(2024, 6, 3), 2)
+        expected = [[('rest', 0)] * 48] * 2
+        self.assertEqual(_bin_sweep([], day_starts, 1800), expected)
+        if binning.np is not None:
+            self.assertEqual(_bin_numpy([], day_starts, 1800), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+"""
+Проверка сеток активности (day_grid): укрупнение 15-минутной сетки до
+интервалов графика выбирает тип активности с наибольшим временем внутри интервала,
+а сетки и дневные итоги, обновляемые при каждой смене активности, совпадают
+с полным пересчетом из истории и с заполнением из миграций (в том числе через полночь и переход на
+летнее/зимнее время).
+
+Запуск: python -m pytest test_day_grid.py (или python -m unittest test_day_grid)
+"""
+
+import os
+
+# config требует токен; запросы в Telegram не отправляются
+os.environ.setdefault('BOT_TOKEN', '0:test')
+
+import random
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import pytz
+
+import database
+from binning import BASE_SLOT_SECONDS
+from connection_manager import connection_manager
+from database import init_db, close_db, add_user, get_connection, start_activity
+from rollups import rebuild_rollups
+from day_grid import rebuild_day_grids
+from migrations import _backfill_rollups, _backfill_day_grids
+from day_grid import ACTIVITY_CODES, EMPTY_GRID, GRID_SLOTS, downsample_grid, grids_from_activities
+
+DAY_START = 1_717_362_000  # Полночь 3 июня 2024 по Москве
+DAY_STARTS = [DAY_START, DAY_START + 86400]
+
+def coarse_codes(activities, slot_seconds):
+    """
+    Эталон: в каждом интервале slot_seconds - тип активности с наибольшим
+    суммарным временем (при равенстве - начавшийся в интервале раньше).
+    """
+    codes = bytearray()
+    for slot_start in range(DAY_START, DAY_START + 86400, slot_seconds):
+        totals = {}
+        for activity_type, start_time, duration in sorted(activities, key=lambda a: a[1]):
+            overlap = min(start_time + duration, slot_start + slot_seconds) - max(start_time, slot_start)
+            if overlap > 0:
+                totals[activity_type] = totals.get(activity_type, 0) + overlap
+        codes.append(ACTIVITY_CODES[max(totals, key=totals.get)] if totals else 0)
+    return bytes(codes)
+
+class DownsampleTest(unittest.TestCase):
+    def downsample(self, activities, slot_seconds):
+        grid = grids_from_activities(activities, DAY_STARTS)[0]
+        return downsample_grid(grid, slot_seconds // BASE_SLOT_SECONDS)
+
+    def test_longer_activity_wins_split_slot(self):
+        # 14 минут труда и 16 минут сна: по 15-минутному интервалу каждому,
+        # но в 30-минутном интервале сна больше
+        activities = [('work', DAY_START, 14 * 60), ('sleep', DAY_START + 14 * 60, 16 * 60)]
+        graph = self.downsample(activities, 1800)
+        self.assertEqual(graph[0], ACTIVITY_CODES['sleep'])
+        self.assertEqual(graph, coarse_codes(activities, 1800))
+
+    def test_equal_time_keeps_earlier(self):
+        activities = [('work', DAY_START, 15 * 60), ('sleep', DAY_START + 15 * 60, 15 * 60)]
+        self.assertEqual(self.downsample(activities, 1800)[0], ACTIVITY_CODES['work'])
+
+    def test_aligned_activities_match_reference(self):
+        # Если активности не делят 15-минутные интервалы, укрупнение точное
+        rng = random.Random(22)
+        for _ in range(20):
+            activities = []
+            position = DAY_START
+            while position < DAY_START + 86400:
+                duration = rng.randint(1, 12) * BASE_SLOT_SECONDS
+                activities.append((rng.choice(list(ACTIVITY_CODES)), position, duration))
+                position += duration + rng.choice([0, BASE_SLOT_SECONDS])
+
+            for slot_seconds in (900, 1800, 3600, 7200):
+                self.assertEqual(self.downsample(activities, slot_seconds), coarse_codes(activities, slot_seconds))
+
+    def test_empty_grid(self):
+        self.assertEqual(downsample_grid(EMPTY_GRID, 1), bytes(GRID_SLOTS))
+        self.assertEqual(downsample_grid(EMPTY_GRID, 8), bytes(GRID_SLOTS // 8))
+
+
+# (часовой пояс, локальное начало последовательности): в каждую попадает переход часов
+SWITCH_RUNS = [
+    ('Europe/Berlin', datetime(2024, 3, 29, 18, 0)),
+    ('Europe/Berlin', datetime(2024, 10, 25, 21, 30)),
+    ('America/New_York', datetime(2024, 11, 1, 22, 0)),
+]
+
+class IncrementalMaintenanceTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.db', prefix='day_grid_')
+        os.close(fd)
+        connection_manager.set_db_path(self.db_path)
+        init_db()
+
+    def tearDown(self):
+        close_db()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_path + suffix):
+                os.remove(self.db_path + suffix)
+
+    def snapshot(self):
+        conn = get_connection()
+        return (
+            conn.execute('SELECT * FROM day_grid ORDER BY user_id, local_day').fetchall(),
+            conn.execute('SELECT * FROM daily_rollup ORDER BY user_id, local_day, activity_type').fetchall()
+        )
+
+    def test_switches_match_full_rebuild(self):
+        rng = random.Random(23)
+        clock = [0]
+
+        with mock.patch.object(database.time, 'time', lambda: clock[0]):
+            for user_id, (timezone, local_start) in enumerate(SWITCH_RUNS, 1):
+                add_user(user_id, 'test', 'Test', None, timezone)
+                clock[0] = int(pytz.timezone(timezone).localize(local_start).timestamp())
+
+                # Несколько суток случайных переключений: от секунд до двух суток
+                for _ in range(60):
+                    start_activity(user_id, rng.choice(list(ACTIVITY_CODES)))
+                    clock[0] += rng.choice([
+                        rng.randint(1, 900), rng.randint(600, 7200), rng.randint(3600, 36000),
+                        rng.randint(1, 900), rng.randint(600, 7200), rng.randint(86400, 172800)
+                    ])
+
+        incremental = self.snapshot()
+        self.assertTrue(incremental[0] and incremental[1])
+
+        conn = get_connection()
+        with conn:
+            cursor = conn.cursor()
+            rebuild_rollups(cursor)
+            rebuild_day_grids(cursor)
+
+        self.assertEqual(incremental, self.snapshot())
+
+        # Заполнение из миграций написано независимо от рабочих модулей
+        with conn:
+            cursor = conn.cursor()
+            _backfill_rollups(cursor)
+            _backfill_day_grids(cursor)
+
+        self.assertEqual(incremental, self.snapshot())
+
+
+if __name__ == "__main__":
+    unittest.main()
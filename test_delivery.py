@@ -0,0 +1,91 @@
+"""
+Проверка RateLimitedSender: итоги отправки после ответа 429, временной
+и постоянной ошибки, с повторами и без (retry=False).
+
+Запуск: python -m pytest test_delivery.py (или python -m unittest test_delivery)
+"""
+
+import asyncio
+import unittest
+
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramNetworkError
+from aiogram.methods import SendMessage
+
+from delivery import RateLimitedSender, SENT, PERMANENT, FAILED, RETRY
+
+METHOD = SendMessage(chat_id=1, text='test')
+
+def rate_limited():
+    return TelegramRetryAfter(METHOD, 'Too Many Requests', 0)
+
+def network_error():
+    return TelegramNetworkError(METHOD, 'connection reset')
+
+def blocked():
+    return TelegramForbiddenError(METHOD, 'Forbidden: bot was blocked by the user')
+
+def scripted(*errors):
+    """
+    Функция отправки: сначала по очереди бросает errors, потом отправляет успешно.
+    """
+    remaining = list(errors)
+
+    async def send():
+        if remaining:
+            raise remaining.pop(0)
+
+    return lambda: send()
+
+def make_sender(max_retries=2):
+    return RateLimitedSender(
+        rate=1e9, chat_interval=0, concurrency=10,
+        max_retries=max_retries, backoff_base=0.001, backoff_max=0.01
+    )
+
+class SenderTest(unittest.TestCase):
+    def send(self, sender, send_func, retry=True):
+        return asyncio.run(sender.send(1, send_func, retry))
+
+    def test_sent(self):
+        sender = make_sender()
+        self.assertEqual(self.send(sender, scripted()), (SENT, None, 1))
+        self.assertEqual(sender.stats()['sent'], 1)
+
+    def test_rate_limited_is_retried(self):
+        sender = make_sender()
+        self.assertEqual(self.send(sender, scripted(rate_limited(), rate_limited()))[::2], (SENT, 3))
+        self.assertEqual(sender.stats()['rate_limited'], 2)
+
+    def test_rate_limited_retries_exhausted(self):
+        sender = make_sender(max_retries=2)
+        outcome, error, attempts = self.send(sender, scripted(*(rate_limited() for _ in range(5))))
+        self.assertEqual((outcome, attempts), (FAILED, 3))
+        self.assertIn('Flood control', error)
+
+    def test_transient_is_retried(self):
+        sender = make_sender()
+        self.assertEqual(self.send(sender, scripted(network_error()))[::2], (SENT, 2))
+        self.assertEqual(sender.stats()['transient_retries'], 1)
+
+    def test_transient_retries_exhausted(self):
+        sender = make_sender(max_retries=2)
+        outcome, _, attempts = self.send(sender, scripted(*(network_error() for _ in range(5))))
+        self.assertEqual((outcome, attempts), (FAILED, 3))
+        self.assertEqual(sender.stats()['failed'], 1)
+
+    def test_permanent_is_not_retried(self):
+        sender = make_sender()
+        outcome, error, attempts = self.send(sender, scripted(blocked()))
+        self.assertEqual((outcome, attempts), (PERMANENT, 1))
+        self.assertIn('blocked', error)
+        self.assertEqual(sender.stats()['permanent'], 1)
+
+    def test_single_attempt_returns_retry(self):
+        sender = make_sender()
+        self.assertEqual(self.send(sender, scripted(rate_limited()), retry=False)[::2], (RETRY, 1))
+        self.assertEqual(self.send(sender, scripted(network_error()), retry=False)[::2], (RETRY, 1))
+        self.assertEqual(self.send(sender, scripted(blocked()), retry=False)[::2], (PERMANENT, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+"""
+Проверка планов запросов статистики: чтения активностей по диапазону времени
+должны идти через индекс (user_id, start_time), а не просмотром всей истории.
+
+Запросы перехватываются у настоящих функций (set_trace_callback) и
+проверяются через EXPLAIN QUERY PLAN на временной базе.
+
+Запуск: python -m pytest test_query_plans.py (или python -m unittest test_query_plans)
+"""
+
+import os
+
+# config требует токен; запросы в Telegram не отправляются
+os.environ.setdefault('BOT_TOKEN', '0:test')
+
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from connection_manager import connection_manager
+from database import init_db, close_db, add_user, get_connection, get_stats_snapshot
+from day_grid import load_day_activities
+from rollups import get_tz
+
+USER_ID = 1
+INDEX_NAME = 'idx_activities_user_start'
+
+class QueryPlanTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.db', prefix='query_plans_')
+        os.close(fd)
+        connection_manager.set_db_path(self.db_path)
+        init_db()
+        add_user(USER_ID, 'test', 'Test', None, 'Europe/Moscow')
+
+        conn = get_connection()
+        now = int(time.time())
+        with conn:
+            conn.executemany('''
+                INSERT INTO activities (user_id, activity_type, start_time, end_time, duration_seconds)
+                VALUES (?, 'work', ?, ?, 3600)
+            ''', [(USER_ID, now - hours * 3600, now - hours * 3600 + 3600) for hours in range(2, 200)])
+
+        self.statements = []
+        conn.set_trace_callback(self.statements.append)
+
+    def tearDown(self):
+        get_connection().set_trace_callback(None)
+        close_db()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_path + suffix):
+                os.remove(self.db_path + suffix)
+
+    def activity_queries(self):
+        """
+        Перехваченные запросы чтения из activities.
+        """
+        return [sql for sql in self.statements
+                if sql.lstrip().upper().startswith('SELECT') and 'FROM activities' in sql]
+
+    def assert_uses_index(self, sql, bounds):
+        """
+        Все чтения activities - поиск по индексу; хотя бы в одном индекс
+        ограничивает время начала всеми границами bounds (например 'start_time>').
+        """
+        plan = get_connection().execute('EXPLAIN QUERY PLAN ' + sql).fetchall()
+        details = [row[-1] for row in plan]
+        activity_steps = [detail for detail in details if 'activities' in detail.split()]
+
+        self.assertTrue(activity_steps, f"В плане нет таблицы activities: {details}")
+        for detail in activity_steps:
+            self.assertTrue(
+                detail.startswith('SEARCH') and INDEX_NAME in detail,
+                f"Запрос читает activities без индекса {INDEX_NAME}: {detail}\n{sql}"
+            )
+
+        # Диапазон времени должен ограничиваться индексом, а не только user_id
+        self.assertTrue(
+            any(all(bound in detail for bound in bounds) for detail in activity_steps),
+            f"Индекс не ограничивает {bounds}: {activity_steps}\n{sql}"
+        )
+
+    def test_day_activities_use_index(self):
+        tz = get_tz('Europe/Moscow')
+        today = datetime.now(tz).date()
+        cursor = get_connection().cursor()
+
+        # Только завершенные (запись сеток) и с открытой активностью (чтение графика)
+        load_day_activities(cursor, USER_ID, today - timedelta(days=6), today, tz)
+        load_day_activities(cursor, USER_ID, today - timedelta(days=6), today, tz, int(time.time()))
+
+        queries = self.activity_queries()
+        self.assertEqual(len(queries), 2)
+        for sql in queries:
+            self.assert_uses_index(sql, ('start_time>', 'start_time<'))
+
+    def test_last_24_hours_uses_index(self):
+        get_stats_snapshot(USER_ID, totals_days=(1,))
+
+        queries = self.activity_queries()
+        self.assertEqual(len(queries), 1)
+        self.assert_uses_index(queries[0], ('start_time>',))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,259 @@
+"""
+Проверка ReminderManager без Telegram: виртуальные часы, заглушка бота,
+временная база для итогов рассылки и пересчета тихого времени при смене
+летнего/зимнего времени.
+
+Запуск: python -m pytest test_reminder.py (или python -m unittest test_reminder)
+"""
+
+import os
+
+# config требует токен; запросы в Telegram не отправляются
+os.environ.setdefault('BOT_TOKEN', '0:test')
+
+import asyncio
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import pytz
+
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramNetworkError
+from aiogram.methods import SendMessage
+
+import reminder
+from async_database import shutdown_db_executor
+from config import REMINDER_FALLBACK_DELAY
+from connection_manager import connection_manager
+from database import init_db, close_db, add_user, get_connection, update_last_reminder_times
+from delivery import RateLimitedSender
+from reminder import ReminderManager, is_quiet_minute
+
+NOW = 1_717_400_000.0
+
+def subscription(user_id, **overrides):
+    settings = {
+        'user_id': user_id,
+        'timezone': 'Europe/Moscow',
+        'reminder_interval': 1800,
+        'quiet_time_enabled': 0,
+        'quiet_utc_start': None,
+        'quiet_utc_end': None,
+    }
+    settings.update(overrides)
+    return settings
+
+class ProcessDueTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = NOW
+        self.manager = ReminderManager(bot=None, clock=lambda: self.clock)
+        self.delivered = []
+
+        async def deliver(user_ids):
+            self.delivered.extend(user_ids)
+
+        self.manager._deliver = deliver
+
+    def process(self, now):
+        async def run():
+            await self.manager._process_due(now)
+            await self.manager.wait_deliveries()
+        asyncio.run(run())
+
+    def test_broken_subscription_does_not_stop_tick(self):
+        # У первого пользователя испорчен интервал: ни проверка, ни расчет следующего времени не проходят
+        self.manager.subscriptions = {
+            1: subscription(1, reminder_interval=None),
+            2: subscription(2),
+        }
+        self.manager.scheduler.schedule(1, NOW - 2)
+        self.manager.scheduler.schedule(2, NOW - 1)
+
+        self.process(NOW)
+
+        self.assertEqual(self.delivered, [2])
+        self.assertEqual(self.manager.scheduler.get_due(1), NOW + REMINDER_FALLBACK_DELAY)
+        self.assertGreater(self.manager.scheduler.get_due(2), NOW)
+
+
+METHOD = SendMessage(chat_id=1, text='test')
+
+class ScriptedBot:
+    """
+    Бот, который для каждого чата по очереди бросает заданные ошибки,
+    а потом отправляет успешно.
+    """
+
+    def __init__(self, errors: dict):
+        self.errors = {chat_id: list(chat_errors) for chat_id, chat_errors in errors.items()}
+        self.sent = []
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        chat_errors = self.errors.get(chat_id)
+        if chat_errors:
+            raise chat_errors.pop(0)
+        self.sent.append(chat_id)
+
+class DeliveryTest(unittest.TestCase):
+    MAX_RETRIES = 2
+
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.db', prefix='reminder_')
+        os.close(fd)
+        connection_manager.set_db_path(self.db_path)
+        init_db()
+        for user_id in (1, 2, 3, 4):
+            add_user(user_id, 'test', 'Test', None, 'Europe/Moscow')
+
+        self.bot = ScriptedBot({
+            2: [TelegramNetworkError(METHOD, 'connection reset')],
+            3: [TelegramForbiddenError(METHOD, 'Forbidden: bot was blocked by the user')],
+            4: [TelegramRetryAfter(METHOD, 'Too Many Requests', 0) for _ in range(10)],
+        })
+        sender = RateLimitedSender(
+            rate=1e9, chat_interval=0, concurrency=10,
+            max_retries=self.MAX_RETRIES, backoff_base=0.001, backoff_max=0.01
+        )
+        self.manager = ReminderManager(self.bot, clock=lambda: NOW, sender=sender)
+        for user_id in (1, 2, 3, 4):
+            self.manager.subscriptions[user_id] = subscription(user_id)
+            self.manager.scheduler.schedule(user_id, NOW + 1800)
+
+    def tearDown(self):
+        shutdown_db_executor()
+        close_db()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_path + suffix):
+                os.remove(self.db_path + suffix)
+
+    def deliver(self):
+        async def run():
+            await self.manager._deliver([1, 2, 3, 4])
+            await self.manager.wait_deliveries()
+        asyncio.run(run())
+
+    def test_outcomes(self):
+        recorded = []
+
+        def record(user_ids, timestamp=None):
+            recorded.append(list(user_ids))
+            update_last_reminder_times(user_ids, timestamp)
+
+        with mock.patch.object(reminder, 'update_last_reminder_times', record):
+            self.deliver()
+
+        # Успешные записываются сразу, повтор после временной ошибки - отдельно
+        self.assertEqual(recorded, [[1], [2]])
+        self.assertEqual(sorted(self.bot.sent), [1, 2])
+
+        conn = get_connection()
+        dead_letters = conn.execute(
+            'SELECT user_id, reason, attempts FROM dead_letter ORDER BY user_id'
+        ).fetchall()
+        # 429 без конца: одна попытка в пачке и 1 + MAX_RETRIES в повторе
+        self.assertEqual(dead_letters, [(3, 'permanent', 1), (4, 'failed', self.MAX_RETRIES + 2)])
+
+        # Заблокировавший бота пользователь отключен и убран из расписания
+        enabled = dict(conn.execute('SELECT user_id, notifications_enabled FROM user_settings').fetchall())
+        self.assertEqual(enabled, {1: 1, 2: 1, 3: 0, 4: 1})
+        self.assertNotIn(3, self.manager.scheduler)
+        self.assertNotIn(3, self.manager.subscriptions)
+        self.assertIn(4, self.manager.scheduler)
+
+        last_reminder = dict(conn.execute('SELECT user_id, last_reminder FROM users').fetchall())
+        self.assertEqual(last_reminder, {1: int(NOW), 2: int(NOW), 3: None, 4: None})
+
+
+class QuietMinuteTest(unittest.TestCase):
+    def test_daytime_window(self):
+        # 13:00-15:00
+        self.assertFalse(is_quiet_minute(779, 780, 900))
+        self.assertTrue(is_quiet_minute(780, 780, 900))
+        self.assertTrue(is_quiet_minute(899, 780, 900))
+        self.assertFalse(is_quiet_minute(900, 780, 900))
+
+    def test_window_wrapping_midnight(self):
+        # 22:00-06:00: с вечера до полуночи и после полуночи до утра
+        self.assertTrue(is_quiet_minute(1320, 1320, 360))
+        self.assertTrue(is_quiet_minute(1439, 1320, 360))
+        self.assertTrue(is_quiet_minute(0, 1320, 360))
+        self.assertTrue(is_quiet_minute(359, 1320, 360))
+        self.assertFalse(is_quiet_minute(360, 1320, 360))
+        self.assertFalse(is_quiet_minute(720, 1320, 360))
+        self.assertFalse(is_quiet_minute(1319, 1320, 360))
+
+    def test_empty_window(self):
+        self.assertFalse(is_quiet_minute(600, 600, 600))
+
+class QuietWindowRefreshTest(unittest.TestCase):
+    """
+    Тихое время 22:00-06:00 по Берлину: зимой это 21:00-05:00 UTC,
+    после перехода на летнее время 31 марта 2024 - 20:00-04:00 UTC.
+    """
+
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.db', prefix='quiet_')
+        os.close(fd)
+        connection_manager.set_db_path(self.db_path)
+        init_db()
+        add_user(1, 'test', 'Test', None, 'Europe/Berlin')
+
+        self.clock = datetime(2024, 3, 30, 12, 0, tzinfo=pytz.utc).timestamp()
+        self.manager = ReminderManager(bot=None, clock=lambda: self.clock)
+
+    def tearDown(self):
+        shutdown_db_executor()
+        close_db()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_path + suffix):
+                os.remove(self.db_path + suffix)
+
+    def stored_window(self):
+        return get_connection().execute(
+            'SELECT quiet_utc_start, quiet_utc_end, quiet_utc_offset FROM user_settings WHERE user_id = 1'
+        ).fetchone()
+
+    def loaded_window(self):
+        subscription = self.manager.subscriptions[1]
+        return subscription['quiet_utc_start'], subscription['quiet_utc_end']
+
+    def refresh(self):
+        async def run():
+            await self.manager._refresh_quiet_windows()
+        asyncio.run(run())
+
+    def test_refresh_follows_dst(self):
+        async def load():
+            await self.manager._refresh_quiet_windows()
+            await self.manager.load_schedule()
+        asyncio.run(load())
+
+        self.assertEqual(self.stored_window(), (21 * 60, 5 * 60, 60))
+        self.assertEqual(self.loaded_window(), (21 * 60, 5 * 60))
+
+        # Час после перехода на летнее время (01:00 UTC)
+        self.clock = datetime(2024, 3, 31, 2, 0, tzinfo=pytz.utc).timestamp()
+        self.refresh()
+        self.assertEqual(self.stored_window(), (20 * 60, 4 * 60, 120))
+        self.assertEqual(self.loaded_window(), (20 * 60, 4 * 60))
+
+        # 22:30 по Берлину летом - 20:30 UTC: тихое время
+        self.assertTrue(is_quiet_minute(20 * 60 + 30, *self.loaded_window()))
+        self.assertFalse(is_quiet_minute(4 * 60 + 30, *self.loaded_window()))
+
+        # Обратно на зимнее время 27 октября 2024 (01:00 UTC)
+        self.clock = datetime(2024, 10, 27, 2, 0, tzinfo=pytz.utc).timestamp()
+        self.refresh()
+        self.assertEqual(self.stored_window(), (21 * 60, 5 * 60, 60))
+        self.assertEqual(self.loaded_window(), (21 * 60, 5 * 60))
+
+    def test_refresh_is_scheduled_hourly(self):
+        self.refresh()
+        self.assertEqual(self.manager._next_quiet_check % 3600, 0)
+        self.assertGreater(self.manager._next_quiet_check, self.clock)
+        self.assertLessEqual(self.manager._next_quiet_check - self.clock, 3600)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+Сравнение колеса таймеров с кучей: на одной и той же случайной
+последовательности schedule/cancel/pop_due оба планировщика должны отдавать
+одинаковые срабатывания. Маленькие slot_bits/levels заставляют колесо часто
+переносить записи между уровнями и через переполнение.
+
+Запуск: python -m pytest test_scheduler.py (или python -m unittest test_scheduler)
+"""
+
+import random
+import unittest
+
+from scheduler import HeapScheduler, TimingWheelScheduler
+
+START = 1_000_000.0
+
+class WheelMatchesHeapTest(unittest.TestCase):
+    def run_differential(self, seed, slot_bits, levels, max_delay, steps=3000, users=60):
+        rng = random.Random(seed)
+        heap = HeapScheduler()
+        wheel = TimingWheelScheduler(slot_bits=slot_bits, levels=levels, start=START)
+        now = START
+
+        for step in range(steps):
+            action = rng.random()
+            user_id = rng.randrange(users)
+
+            if action < 0.5:
+                # Дробное время, иногда уже прошедшее
+                due = now + rng.uniform(-3, max_delay)
+                heap.schedule(user_id, due)
+                wheel.schedule(user_id, due)
+            elif action < 0.6:
+                heap.cancel(user_id)
+                wheel.cancel(user_id)
+            else:
+                # Время идет то мелкими шагами, то большими скачками
+                now += rng.choice([0, rng.uniform(0, 1.5), rng.uniform(0, max_delay / 4)])
+                expected = heap.pop_due(now)
+                actual = wheel.pop_due(now)
+                self.assertEqual(sorted(actual), sorted(expected), f"шаг {step}, now={now}")
+                self.assertEqual([due for _, due in actual], sorted(due for _, due in actual))
+
+            self.assertEqual(len(wheel), len(heap))
+            self.assertEqual(wheel.get_due(user_id), heap.get_due(user_id))
+            self.assertEqual(user_id in wheel, user_id in heap)
+
+            # Колесо может проснуться раньше (на перенос уровня), но не позже кучи
+            heap_next = heap.next_due()
+            wheel_next = wheel.next_due()
+            self.assertEqual(wheel_next is None, heap_next is None)
+            if heap_next is not None:
+                self.assertLessEqual(wheel_next, heap_next)
+
+        # Остаток расписания срабатывает одинаково
+        now += 10 * max_delay
+        self.assertEqual(sorted(wheel.pop_due(now)), sorted(heap.pop_due(now)))
+        self.assertEqual(len(wheel), 0)
+
+    def test_two_levels_with_overflow(self):
+        # Окно колеса 16 секунд, сроки до 200 секунд уходят в переполнение
+        for seed in range(5):
+            self.run_differential(seed, slot_bits=2, levels=2, max_delay=200)
+
+    def test_three_levels(self):
+        # Окно колеса 512 секунд, записи переносятся через все уровни
+        for seed in range(5):
+            self.run_differential(seed, slot_bits=3, levels=3, max_delay=600)
+
+    def test_default_wheel(self):
+        self.run_differential(0, slot_bits=8, levels=4, max_delay=7200)
+
+    def test_clear(self):
+        wheel = TimingWheelScheduler(slot_bits=2, levels=2, start=START)
+        for user_id in range(10):
+            wheel.schedule(user_id, START + user_id * 7.5)
+        wheel.clear()
+        self.assertEqual(len(wheel), 0)
+        self.assertIsNone(wheel.next_due())
+        self.assertEqual(wheel.pop_due(START + 1000), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+"""
+Проверка start_activity при параллельных вызовах: нажатия из нескольких
+потоков пула базы (run_db) оставляют ровно одну открытую активность,
+а завершенные активности идут друг за другом без наложений.
+
+Запуск: python -m pytest test_start_activity.py (или python -m unittest test_start_activity)
+"""
+
+import os
+
+# config требует токен; запросы в Telegram не отправляются
+os.environ.setdefault('BOT_TOKEN', '0:test')
+
+import asyncio
+import random
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import database
+from async_database import run_db, shutdown_db_executor
+from config import DB_WORKERS
+from connection_manager import connection_manager
+from database import init_db, close_db, add_user, get_connection, start_activity
+
+USER_IDS = (1, 2)
+ACTIVITIES = ['work', 'study', 'sport', 'hobby', 'sleep', 'rest']
+CALLS_PER_USER = 60
+
+class ConcurrentStartActivityTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.db', prefix='start_activity_')
+        os.close(fd)
+        connection_manager.set_db_path(self.db_path)
+        init_db()
+        for user_id in USER_IDS:
+            add_user(user_id, 'test', 'Test', None, 'Europe/Moscow')
+
+    def tearDown(self):
+        shutdown_db_executor()
+        close_db()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_path + suffix):
+                os.remove(self.db_path + suffix)
+
+    def test_concurrent_switches(self):
+        self.assertGreater(DB_WORKERS, 1)
+
+        async def run():
+            calls = [
+                run_db(start_activity, user_id, ACTIVITIES[i % len(ACTIVITIES)])
+                for i in range(CALLS_PER_USER)
+                for user_id in USER_IDS
+            ]
+            return await asyncio.gather(*calls)
+
+        # Часы с задержкой: потоки чаще переключаются посреди смены активности
+        real_time = time.time
+
+        def jittered_time():
+            time.sleep(random.random() / 1000)
+            return real_time()
+
+        with mock.patch.object(database.time, 'time', jittered_time):
+            asyncio.run(run())
+
+        conn = get_connection()
+        for user_id in USER_IDS:
+            with self.subTest(user_id=user_id):
+                open_rows = conn.execute(
+                    'SELECT activity_id FROM open_activity WHERE user_id = ?', (user_id,)
+                ).fetchall()
+                open_activities = conn.execute(
+                    'SELECT id FROM activities WHERE user_id = ? AND end_time IS NULL', (user_id,)
+                ).fetchall()
+                self.assertEqual(len(open_rows), 1)
+                self.assertEqual(open_rows, open_activities)
+
+                activities = conn.execute('''
+                    SELECT id, start_time, end_time, duration_seconds
+                    FROM activities WHERE user_id = ? ORDER BY id
+                ''', (user_id,)).fetchall()
+
+                # Открытая активность - последняя по порядку
+                self.assertEqual(activities[-1][0], open_rows[0][0])
+                self.assertIsNone(activities[-1][2])
+
+                # Каждая завершенная активность закрыта в момент начала следующей
+                for (_, start, end, duration), (_, next_start, _, _) in zip(activities, activities[1:]):
+                    self.assertIsNotNone(end)
+                    self.assertLessEqual(start, end)
+                    self.assertEqual(end, next_start)
+                    self.assertEqual(duration, end - start)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+"""
+Проверка кэша снимков статистики: снимок из кэша с наложенной текущей
+активностью дает тот же результат, что и расчет заново (в том числе после
+полуночи), а смена активности или часового пояса делает снимок устаревшим.
+
+Запуск: python -m pytest test_stats_cache.py (или python -m unittest test_stats_cache)
+"""
+
+import os
+
+# config требует токен; запросы в Telegram не отправляются
+os.environ.setdefault('BOT_TOKEN', '0:test')
+
+import random
+import tempfile
+import time
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import pytz
+
+from connection_manager import connection_manager
+from database import init_db, close_db, add_user, start_activity, update_user_timezone
+from stats_cache import StatsCache
+from stats_engine import StatsEngine, STATS_VIEWS
+
+USER_ID = 1
+TIMEZONE = 'Europe/Moscow'
+SLOT_WIDTHS = (900, 1800, 3600, 7200)
+
+def result_data(result):
+    return result.grids, result.totals, result.current, result.slot_seconds
+
+class StatsCacheTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.db', prefix='stats_cache_')
+        os.close(fd)
+        connection_manager.set_db_path(self.db_path)
+        init_db()
+
+        # Часы для всех модулей: время задает тест
+        self.clock = int(pytz.timezone(TIMEZONE).localize(datetime(2024, 6, 10, 8, 0)).timestamp())
+        patcher = mock.patch.object(time, 'time', lambda: self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        add_user(USER_ID, 'test', 'Test', None, TIMEZONE)
+
+        # История за несколько дней; последняя активность остается текущей,
+        # до 23:50 местного времени
+        rng = random.Random(24)
+        end = int(pytz.timezone(TIMEZONE).localize(datetime(2024, 6, 14, 23, 50)).timestamp())
+        activities = ['work', 'study', 'sport', 'hobby', 'sleep', 'rest']
+        previous = None
+        while self.clock < end - 3600:
+            activity_type = rng.choice([a for a in activities if a != previous])
+            start_activity(USER_ID, activity_type)
+            previous = activity_type
+            self.clock += rng.randint(300, 4 * 3600)
+        self.clock = end
+
+        # Версии данных поднимает database - подменяем его кэш проверяемым
+        self.cache = StatsCache()
+        cache_patcher = mock.patch('database.stats_cache', self.cache)
+        cache_patcher.start()
+        self.addCleanup(cache_patcher.stop)
+        self.engine = StatsEngine(self.cache)
+
+    def tearDown(self):
+        close_db()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_path + suffix):
+                os.remove(self.db_path + suffix)
+
+    def fresh(self, view, slot_seconds):
+        return StatsEngine(StatsCache()).fetch(USER_ID, view, slot_seconds)
+
+    def assert_matches_fresh(self, view, slot_seconds):
+        self.assertEqual(
+            result_data(self.engine.fetch(USER_ID, view, slot_seconds)),
+            result_data(self.fresh(view, slot_seconds))
+        )
+
+    def test_cached_snapshot_matches_fresh(self):
+        # Снимки кэшируются в 23:50; 5 минут спустя - из кэша; 25 минут спустя - уже другой день
+        for step in (0, 5 * 60, 20 * 60):
+            self.clock += step
+            for view in STATS_VIEWS.values():
+                for slot_seconds in SLOT_WIDTHS:
+                    with self.subTest(step=step, view=view.name, slot_seconds=slot_seconds):
+                        self.assert_matches_fresh(view, slot_seconds)
+
+        self.assertGreater(self.cache.stats()['hits'], 0)
+
+    def test_start_activity_invalidates(self):
+        view = STATS_VIEWS['week']
+        self.engine.fetch(USER_ID, view, 1800)
+        self.engine.fetch(USER_ID, view, 1800)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+        self.clock += 120
+        current = self.engine.fetch(USER_ID, view, 1800).current_type
+        start_activity(USER_ID, 'sleep' if current != 'sleep' else 'work')
+
+        result = self.engine.fetch(USER_ID, view, 1800)
+        self.assertEqual(self.cache.stats()['misses'], 2)
+        self.assertEqual(result_data(result), result_data(self.fresh(view, 1800)))
+
+    def test_timezone_change_invalidates(self):
+        view = STATS_VIEWS['default']
+        before = self.engine.fetch(USER_ID, view, 3600)
+
+        update_user_timezone(USER_ID, 'America/New_York')
+        after = self.engine.fetch(USER_ID, view, 3600)
+        self.assertEqual(self.cache.stats()['misses'], 2)
+
+        self.assertEqual(result_data(after), result_data(self.fresh(view, 3600)))
+        self.assertNotEqual(result_data(after), result_data(before))
+
+
+class VersionBoundTest(unittest.TestCase):
+    def test_versions_are_bounded(self):
+        cache = StatsCache(maxsize=3)
+        for user_id in range(100):
+            cache.bump(user_id)
+            cache.version(user_id)
+        self.assertLessEqual(len(cache._versions), 3)
+
+    def test_evicted_version_misses(self):
+        cache = StatsCache(maxsize=2)
+        loads = []
+
+        def load(user_id):
+            loads.append(user_id)
+            return user_id
+
+        cache.get_or_load(1, 'view', lambda: load(1))
+        cache.get_or_load(1, 'view', lambda: load(1))
+        self.assertEqual(loads, [1])
+
+        # Версия пользователя 1 вытесняется; новая версия не совпадает ни с одним снимком
+        old_version = cache.version(1)
+        cache.version(2)
+        cache.version(3)
+        self.assertNotEqual(cache.version(1), old_version)
+
+        cache.get_or_load(1, 'view', lambda: load(1))
+        self.assertEqual(loads, [1, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
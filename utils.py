@@ -4,9 +4,19 @@
 
 import pytz
 from datetime import datetime, timedelta
-from config import ACTIVITIES, ACTIVITY_EMOJIS, ACTIVITY_SYMBOLS
+from config import ACTIVITIES, ACTIVITY_EMOJIS, ACTIVITY_SYMBOLS, TIMELINE_LINE_WIDTH
 from database import get_current_activity, get_user_timezone
 from timezone_manager import timezone_manager
+from day_grid import ACTIVITY_CODES, EMPTY_CODE
+
+# Таблица перевода кодов сетки в символы графика: сон и пустые интервалы - '▁'
+_GRAPH_SYMBOLS = {EMPTY_CODE: '▁'}
+_GRAPH_SYMBOLS.update({
+    code: '▁' if activity_type == 'sleep' else ACTIVITY_SYMBOLS.get(activity_type, '▂')
+    for activity_type, code in ACTIVITY_CODES.items()
+})
+# Коды, не считающиеся активностью при проверке "день пустой"
+_IDLE_CODES = bytes([EMPTY_CODE, ACTIVITY_CODES['rest']])
 
 def is_test_interval(interval_seconds):
     """
@@ -44,9 +54,11 @@ def format_duration_compact(seconds):
     seconds = seconds % 60
     return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
 
-def format_stats_message(stats, period_name, user_id=None):
+def format_stats_message(stats, period_name, user_id=None, current_activity=None):
     """
     Форматирование статистики с пометкой текущей активности.
+    current_activity - тип текущей активности, если уже известен
+    (иначе читается по user_id).
     """
     if not stats:
         return f"{period_name}:\n\nНет данных"
@@ -55,8 +67,7 @@ def format_stats_message(stats, period_name, user_id=None):
     total_seconds = 0
 
     # Получаем текущую активность для пометки
-    current_activity = None
-    if user_id:
+    if current_activity is None and user_id:
         current = get_current_activity(user_id)
         if current:
             current_activity = current[0]
@@ -101,82 +112,58 @@ def format_stats_message(stats, period_name, user_id=None):
     return message
 
 
-def generate_activity_graph(stats_by_hour, days=1):
+def generate_activity_graph(grids, days=1, slot_seconds=1800):
     """
     Генерация графиков активности за указанное количество дней.
-    Каждая строка из 24 символов = 12 часов (1 символ = 30 минут)
-    Первая строка: 00:00-12:00
-    Вторая строка: 12:00-24:00
+    1 символ = 1 интервал slot_seconds, в строке до TIMELINE_LINE_WIDTH символов:
+    при 30 минутах - две строки по 12 часов (00:00-12:00 и 12:00-24:00),
+    при 15 минутах - четыре строки по 6 часов, при 1 и 2 часах - одна строка.
 
-    stats_by_hour: список из days элементов, каждый элемент - список из 48 кортежей
-                   (activity_type, seconds) для каждого 30-минутного интервала
+    grids: список из days сеток (bytes, database.apply_live_stats),
+           байт на интервал - код активности, 0 - нет активности
     days: количество дней
+    slot_seconds: ширина интервала в секундах
 
     Возвращает строку с графиком.
     """
-    if not stats_by_hour or days <= 0:
+    if not grids or days <= 0:
         return ""
 
+    slots_per_day = 86400 // slot_seconds
+    line_width = min(TIMELINE_LINE_WIDTH, slots_per_day)
+
     graph_lines = []
+    for grid in grids:
+        # Пропускаем дни без активности (только пустые интервалы и отдых)
+        if not grid.translate(None, _IDLE_CODES):
+            continue
 
-    # Проверяем, есть ли вообще активность за период
-    has_activity = False
-    for day_stats in stats_by_hour:
-        for activity_type, seconds in day_stats:
-            if seconds > 0 and activity_type != 'rest':
-                has_activity = True
-                break
-        if has_activity:
-            break
-
-    if not has_activity:
-        return ""
+        # Байт -> символ графика одной операцией на день
+        line = grid.decode('latin-1').translate(_GRAPH_SYMBOLS)
+        for line_start in range(0, slots_per_day, line_width):
+            graph_lines.append(line[line_start:line_start + line_width])
+
+    return "\n".join(graph_lines)
 
-    for day_stats in stats_by_hour:
-        # Проверяем, есть ли активность в этом дне
-        day_has_activity = False
-        for activity_type, seconds in day_stats:
-            if seconds > 0 and activity_type != 'rest':
-                day_has_activity = True
-                break
 
-        if not day_has_activity:
-            continue
+def graph_lines_per_day(slot_seconds):
+    """
+    Число строк графика активности на один день.
+    """
+    slots_per_day = 86400 // slot_seconds
+    return -(-slots_per_day // min(TIMELINE_LINE_WIDTH, slots_per_day))
 
-        # Создаем график
-        # Первая строка: интервалы 0-23 (00:00-12:00)
-        line1 = ""
-        for i in range(24):  # Интервалы 0-23
-            activity_type, seconds = day_stats[i]
-            if seconds > 0:
-                if activity_type == 'sleep':
-                    line1 += '▁'  # Сон
-                else:
-                    symbol = ACTIVITY_SYMBOLS.get(activity_type, '▂')
-                    line1 += symbol
-            else:
-                line1 += '▁'  # Отдых или нет активности
-
-        # Вторая строка: интервалы 24-47 (12:00-24:00)
-        line2 = ""
-        for i in range(24, 48):  # Интервалы 24-47
-            activity_type, seconds = day_stats[i]
-            if seconds > 0:
-                if activity_type == 'sleep':
-                    line2 += '▁'  # Сон
-                else:
-                    symbol = ACTIVITY_SYMBOLS.get(activity_type, '▂')
-                    line2 += symbol
-            else:
-                line2 += '▁'  # Отдых или нет активности
-
-        graph_lines.append(line1)
-        graph_lines.append(line2)
 
-    return "\n".join(graph_lines)
+def format_resolution(slot_seconds):
+    """
+    Подпись ширины интервала графика ('15 мин', '1 ч').
+    """
+    if slot_seconds % 3600 == 0:
+        return f"{slot_seconds // 3600} ч"
+    return f"{slot_seconds // 60} мин"
 
 
-def generate_bar_graph(activity_stats, user_id=None, max_width=12):
+def generate_bar_graph(activity_stats, user_id=None, max_width=12, current_activity=None):
     """
     Генерация столбчатой диаграммы для статистики по активностям.
     Один символ █ = 1 час активности.
@@ -184,6 +171,7 @@ def generate_bar_graph(activity_stats, user_id=None, max_width=12):
     activity_stats: список кортежей (activity_type, seconds)
     user_id: ID пользователя для определения текущей активности
     max_width: максимальная ширина графика в символах (по умолчанию 12 блоков = 12 часов)
+    current_activity: тип текущей активности, если уже известен (тогда база не читается)
 
     Возвращает строку с диаграммой.
     """
@@ -191,8 +179,7 @@ def generate_bar_graph(activity_stats, user_id=None, max_width=12):
         return ""
 
     # Получаем текущую активность
-    current_activity = None
-    if user_id:
+    if current_activity is None and user_id:
         current = get_current_activity(user_id)
         if current:
             current_activity = current[0]
@@ -249,19 +236,71 @@ def generate_bar_graph(activity_stats, user_id=None, max_width=12):
 
     return "\n".join(bars)
 
-def format_complete_stats(user_id, days=3):
+def format_view_stats(result):
+    """
+    Сообщение экрана статистики из StatsResult (stats_engine):
+    график активности, строки общего времени и распределение по активностям
+    (диаграмма или топ активностей) - по описанию экрана result.view.
+    """
+    view = result.view
+    message_text = f"{view.title}\n\n"
+
+    timeline_graph = ""
+    if result.grids is not None:
+        timeline_graph = generate_activity_graph(result.grids, view.timeline_days, result.slot_seconds)
+
+    if timeline_graph and timeline_graph.strip():
+        caption = f"{view.timeline_caption}, " if view.timeline_caption else ""
+        message_text += f"График активности ({caption}1 символ = {format_resolution(result.slot_seconds)}):\n"
+
+        lines = timeline_graph.split('\n')
+        if view.timeline_preview_days:
+            # Показываем только первые дни графика
+            max_lines = view.timeline_preview_days * graph_lines_per_day(result.slot_seconds)
+            if len(lines) > max_lines:
+                lines = lines[:max_lines] + ["..."]
+        message_text += '\n'.join(lines)
+        message_text += "\n\n"
+
+    if view.total_windows:
+        for days, caption in view.total_windows:
+            message_text += f"📈 Всего времени {caption}: {format_duration_compact(result.total_seconds(days))}\n"
+        message_text += "\n"
+
+    message_text += f"{view.distribution_title}:\n\n"
+
+    if view.top_n:
+        top_activities = [
+            (activity_type, duration)
+            for activity_type, duration in result.distribution[:view.top_n]
+            if duration > 0
+        ]
+        for activity_type, duration in top_activities:
+            activity_name = ACTIVITIES.get(activity_type, activity_type)
+            emoji = get_activity_emoji(activity_type)
+            message_text += f"{emoji} {activity_name}: {format_duration_compact(duration)}\n"
+        if not top_activities:
+            message_text += "Нет данных об активностях"
+    else:
+        bar_graph = generate_bar_graph(result.distribution, max_width=12, current_activity=result.current_type)
+        message_text += bar_graph if bar_graph else "Нет данных об активностях"
+
+    return message_text
+
+def format_complete_stats(user_id, days=3, slot_seconds=None):
     """
     Форматирование полной статистики с графиками.
+    slot_seconds - ширина интервала графика (по умолчанию - выбранная пользователем).
     """
-    from database import get_hourly_activity_stats, get_total_stats_by_activity
+    from stats_engine import StatsView, stats_engine
 
-    # Получаем данные
-    hourly_stats = get_hourly_activity_stats(user_id, days)
-    activity_stats = get_total_stats_by_activity(user_id, 1)  # Только за сутки для графика
+    # Данные за days дней графика и распределение за сутки - одним снимком
+    view = StatsView(f'complete_{days}', "", timeline_days=days)
+    result = stats_engine.fetch(user_id, view, slot_seconds)
 
     # Генерируем графики
-    timeline_graph = generate_activity_graph(hourly_stats, days)
-    bar_graph = generate_bar_graph(activity_stats, user_id)
+    timeline_graph = generate_activity_graph(result.grids, days, result.slot_seconds)
+    bar_graph = generate_bar_graph(result.distribution, current_activity=result.current_type)
 
     # Форматируем сообщение
     message = ""